@@ -4,14 +4,21 @@ analyze_pcap.py - Hauptanalyse auf Basis von PCAP-Dateien.
 Nutzt pcap_engine.py für das Lesen, erstellt Reports.
 """
 import os, sys, json, logging, argparse
+from contextlib import nullcontext
 from datetime import datetime
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from pcap_engine import read_pcap_probes, analyze_persistence
 from mac_ignore import MacIgnoreSet
 from oui_lookup import load_oui_db, lookup
-from wigle_lookup import WiGLEClient, lookup_device, format_wigle_section, format_nearby_section
+from wigle_lookup import (WiGLEClient, WiGLEScheduler, PRIORITY_WATCHED, PRIORITY_NEARBY,
+                          BUDGET_S, format_wigle_section, format_nearby_section)
+from enrichment import EnrichmentStage, DEADLINE_S
+import http_pool
+from wigle_offline import open_offline, DEFAULT_PATH as OFFLINE_DB
 from suspects_db import SuspectsDB
 from watch_list import WatchList
+from gps_track import GpsTrack, parse_ts
+from geo import extend_trajectory, count_places, VISIT_MERGE_M, MAX_VISITS
 
 try:
     from pcap_engine import read_pcap_data_ips
@@ -97,6 +104,55 @@ def filter_scans(scans, ignore_macs, ignore_ssids):
 
     return filtered
 
+def fmt_places(d):
+    """Anzahl verschiedener Orte (Trajektorie) für Report-Tabelle, '-' ohne GPS."""
+    return str(d['n_places']) if d.get('n_places') else '-'
+
+def device_position(d, cur_lat=None, cur_lon=None):
+    """Letzte geotaggte Position des Geräts, sonst aktuelle Position."""
+    traj = d.get('trajectory')
+    if traj:
+        return traj[-1]['lat'], traj[-1]['lon']
+    return cur_lat, cur_lon
+
+def load_bt_scans(bt_files, gps_track=None):
+    """
+    Lädt BT-Scan JSONs und geotaggt jedes Gerät: interpolierte Track-Position
+    zu first_seen, Fallback auf die GPS-Position des Scans. Mehrere Scans
+    desselben Geräts ergeben eine Trajektorie + 'n_places'.
+    """
+    scans = []
+    for bt_file in bt_files:
+        if not os.path.exists(bt_file):
+            continue
+        with open(bt_file) as f:
+            bt_data = json.load(f)
+        gps = bt_data.get('gps') or {}
+        scan_pos = None
+        if gps.get('fix') and gps.get('lat') and gps.get('lon'):
+            scan_pos = (gps['lat'], gps['lon'])
+        scans.append((parse_ts(bt_data.get('timestamp', '')) or 0,
+                      scan_pos, bt_data.get('bt_devices', {})))
+
+    # Zeitlich sortiert → Cursor läuft mit dem Track mit (Sort-Merge-Join)
+    scans.sort(key=lambda s: s[0])
+    cursor = gps_track.cursor() if gps_track else None
+    bt_devices = {}
+    trajectories = {}
+    for scan_ts, scan_pos, devices in scans:
+        seen = sorted((parse_ts(dev.get('first_seen') or '') or scan_ts, mac)
+                      for mac, dev in devices.items())
+        for ts, mac in seen:
+            bt_devices[mac] = devices[mac]
+            pos = (cursor.position_at(ts) if cursor and ts else None) or scan_pos
+            if pos:
+                extend_trajectory(trajectories.setdefault(mac, []),
+                                  int(ts), pos[0], pos[1])
+    for mac, traj in trajectories.items():
+        bt_devices[mac] = {**bt_devices[mac], 'trajectory': traj,
+                           'n_places': count_places(traj)}
+    return bt_devices
+
 def _ensure_bt_fingerprinting(bt_devices, oui_db=None):
     """
     Wendet bt_fingerprint auf BT-Geräte an, falls noch nicht erfolgt.
@@ -105,6 +161,7 @@ def _ensure_bt_fingerprinting(bt_devices, oui_db=None):
     try:
         from bt_fingerprint import fingerprint_device
         from oui_lookup import lookup
+        from oui_attrs import attributes
     except ImportError:
         return bt_devices
 
@@ -119,6 +176,7 @@ def _ensure_bt_fingerprinting(bt_devices, oui_db=None):
                 uuids=d.get('uuids', []),
                 appearance_code=d.get('appearance'),
                 oui_vendor=vendor,
+                oui_attrs=attributes(mac, oui_db, vendor),
                 company_id=d.get('company_id'),
                 addr_type=d.get('addr_type'),
                 addr_subtype=d.get('addr_subtype'),
@@ -136,11 +194,66 @@ def _ensure_bt_fingerprinting(bt_devices, oui_db=None):
     return result
 
 
-def save_report(scored, suspicious, output_dir, ignore_macs, bt_devices=None, oui_db=None, wigle_client=None, suspects_db=None, watch_list=None, cur_lat=None, cur_lon=None, mac_to_ips=None, shodan_key=None):
+def save_report(scored, suspicious, output_dir, ignore_macs, bt_devices=None, oui_db=None, wigle_client=None, suspects_db=None, watch_list=None, cur_lat=None, cur_lon=None, mac_to_ips=None, shodan_key=None, enrich_deadline_s=DEADLINE_S):
     os.makedirs(output_dir, exist_ok=True)
     ts   = datetime.now().strftime('%Y%m%d_%H%M%S')
     path = os.path.join(output_dir, f'argus_report_{ts}.md')
 
+    # Watch-List Alarme sammeln
+    tracking_alarms = []
+    static_alarms   = []
+    watched_ok      = []
+    if watch_list:
+        watched = [(mac, d) for mac, d in scored.items()
+                   if watch_list.is_watched(mac)]
+        # Alle beobachteten Geräte prüfen, Watch-List einmal speichern
+        results = watch_list.check_many(
+            (mac, *device_position(d, cur_lat, cur_lon)) for mac, d in watched)
+        for mac, d in watched:
+            result = results[mac]
+            entry  = {'mac': mac, 'watch': result, 'data': d}
+            if result['status'] == 'dynamic_alarm':
+                tracking_alarms.append(entry)
+            elif result['status'] == 'static_alarm':
+                static_alarms.append(entry)
+            else:
+                watched_ok.append(entry)
+
+    # Verdächtige die nicht in Watch-List sind
+    new_suspicious = {m: d for m, d in suspicious.items()
+                     if not (watch_list and watch_list.is_watched(m))}
+
+    # Enrichment vor dem Rendern: WiGLE (ein Task, intern priorisiert und
+    # dedupliziert) und InternetDB parallel, begrenzt durch die Deadline
+    stage = EnrichmentStage(deadline_s=enrich_deadline_s)
+    wigle_sched = None
+    nearby_key  = None
+    if wigle_client:
+        wigle_sched = WiGLEScheduler(
+            wigle_client, budget_s=min(wigle_client.budget_s, enrich_deadline_s))
+        for e in tracking_alarms + static_alarms:
+            wigle_sched.add_device(
+                e['mac'], e['data'].get('ssids', []),
+                priority=PRIORITY_WATCHED + e['data'].get('persistence_score', 0))
+        for mac, d in new_suspicious.items():
+            wigle_sched.add_device(mac, d.get('ssids', []),
+                                   priority=d['persistence_score'])
+        # Nearby-Abgleich (nur mit GPS)
+        if cur_lat and cur_lon:
+            nearby_key = wigle_sched.add('nearby', (cur_lat, cur_lon, 200),
+                                         PRIORITY_NEARBY)
+        stage.add('wigle', 'report', wigle_sched.run)
+    public_ips = {}
+    if _HAS_SHODAN and mac_to_ips:
+        for mac in new_suspicious:
+            ips = [ip for ip in mac_to_ips.get(mac, set()) if not is_private_ip(ip)]
+            public_ips[mac] = ips[:2]
+            for ip in ips[:2]:
+                stage.add('internetdb', ip, enrich_ip, ip, api_key=shodan_key)
+    stage.run()
+    if wigle_sched and stage.failed('wigle', 'report'):
+        wigle_sched.fail_pending()
+
     with open(path, 'w') as f:
         f.write('# Argus Pager - Report\n\n')
         f.write(f'**Datum:** {datetime.now().strftime("%d.%m.%Y %H:%M:%S")}  \n')
@@ -150,22 +263,6 @@ def save_report(scored, suspicious, output_dir, ignore_macs, bt_devices=None, ou
             f.write(f'**Ignoriert:** {len(ignore_macs)} MACs  \n')
         f.write('\n')
 
-        # Watch-List Alarme sammeln
-        tracking_alarms = []
-        static_alarms   = []
-        watched_ok      = []
-        if watch_list:
-            for mac, d in scored.items():
-                if watch_list.is_watched(mac):
-                    result = watch_list.check(mac, cur_lat, cur_lon)
-                    entry  = {'mac': mac, 'watch': result, 'data': d}
-                    if result['status'] == 'dynamic_alarm':
-                        tracking_alarms.append(entry)
-                    elif result['status'] == 'static_alarm':
-                        static_alarms.append(entry)
-                    else:
-                        watched_ok.append(entry)
-
         # 🔴 TRACKING ERKANNT
         if tracking_alarms:
             f.write('## 🔴 TRACKING ERKANNT - Dynamische Geräte\n\n')
@@ -175,7 +272,10 @@ def save_report(scored, suspicious, output_dir, ignore_macs, bt_devices=None, ou
                 label  = watch_list.get(mac).get('label', mac)
                 f.write(f'### {label} (`{mac}`)\n')
                 f.write(f'- **Hersteller:** {vendor}\n')
-                f.write(f'- **Warnung:** {e["watch"]["message"]}\n\n')
+                f.write(f'- **Warnung:** {e["watch"]["message"]}\n')
+                if wigle_sched:
+                    f.write(format_wigle_section(wigle_sched.device_results(mac)) + '\n')
+                f.write('\n')
 
         # ⚠ AUSSERHALB BEKANNTER ZONE
         if static_alarms:
@@ -186,58 +286,62 @@ def save_report(scored, suspicious, output_dir, ignore_macs, bt_devices=None, ou
                 label  = watch_list.get(mac).get('label', mac)
                 f.write(f'### {label} (`{mac}`)\n')
                 f.write(f'- **Hersteller:** {vendor}\n')
-                f.write(f'- **Warnung:** {e["watch"]["message"]}\n\n')
-
-        # Verdächtige die nicht in Watch-List sind
-        new_suspicious = {m: d for m, d in suspicious.items()
-                         if not (watch_list and watch_list.is_watched(m))}
+                f.write(f'- **Warnung:** {e["watch"]["message"]}\n')
+                if wigle_sched:
+                    f.write(format_wigle_section(wigle_sched.device_results(mac)) + '\n')
+                f.write('\n')
 
         if new_suspicious:
             f.write('## ⚠️ WARNING - Verdächtige Geräte\n\n')
-            f.write('| MAC | Hersteller | Typ | Score | Appearances | RSSI | Status |\n')
-            f.write('|-----|------------|-----|-------|-------------|------|--------|\n')
-            for mac, d in sorted(new_suspicious.items(),
-                                 key=lambda x: x[1]['persistence_score'],
-                                 reverse=True):
-                vendor = lookup(mac, oui_db) if oui_db else '?'
-                mtype  = mac_type(mac)
-                # suspects_db ZUERST aktualisieren, dann Status lesen
-                if suspects_db:
-                    suspects_db.update(mac, vendor, mtype,
-                                      d['persistence_score'],
-                                      d.get('ssids', []),
-                                      cur_lat, cur_lon)
-                    entry = suspects_db.get(mac)
-                    if entry['seen_count'] > 1:
-                        known_flag = f'⚠ BEKANNT ({entry["seen_count"]}x)'
+            f.write('| MAC | Hersteller | Typ | Score | Appearances | RSSI | Status | Orte |\n')
+            f.write('|-----|------------|-----|-------|-------------|------|--------|------|\n')
+            # Alle SuspectsDB-Updates dieses Reports in einer Transaktion
+            with (suspects_db.transaction() if suspects_db else nullcontext()):
+                for mac, d in sorted(new_suspicious.items(),
+                                     key=lambda x: x[1]['persistence_score'],
+                                     reverse=True):
+                    vendor = lookup(mac, oui_db) if oui_db else '?'
+                    mtype  = mac_type(mac)
+                    # suspects_db ZUERST aktualisieren, dann Status lesen
+                    if suspects_db:
+                        dev_lat, dev_lon = device_position(d, cur_lat, cur_lon)
+                        entry = suspects_db.update(mac, vendor, mtype,
+                                                   d['persistence_score'],
+                                                   d.get('ssids', []),
+                                                   dev_lat, dev_lon)
+                        if entry['seen_count'] > 1:
+                            known_flag = f'⚠ BEKANNT ({entry["seen_count"]}x)'
+                        else:
+                            known_flag = '🆕 NEU'
                     else:
                         known_flag = '🆕 NEU'
-                else:
-                    known_flag = '🆕 NEU'
-                f.write(f'| `{mac}` | {vendor} | {mtype} | {d["persistence_score"]:.2f} | '
-                        f'{d["appearances"]} | {fmt_rssi(d)} | {known_flag} |\n')
-                # WiGLE Lookup
-                if wigle_client:
-                    ssids = [s for s in d.get('ssids', []) if s and len(s) > 2]
-                    wigle = lookup_device(mac, ssids, client=wigle_client)
-                    wigle_text = format_wigle_section(wigle)
-                    if wigle_text.strip():
-                        f.write(wigle_text + '\n')
-                    else:
-                        f.write('\n**WiGLE:** Keine Treffer (Wildcard Probes)\n')
+                    f.write(f'| `{mac}` | {vendor} | {mtype} | {d["persistence_score"]:.2f} | '
+                            f'{d["appearances"]} | {fmt_rssi(d)} | {known_flag} | '
+                            f'{fmt_places(d)} |\n')
+                    # WiGLE Lookup
+                    if wigle_sched:
+                        wigle_text = format_wigle_section(wigle_sched.device_results(mac))
+                        if wigle_text.strip():
+                            f.write(wigle_text + '\n')
+                        else:
+                            f.write('\n**WiGLE:** Keine Treffer (Wildcard Probes)\n')
             # InternetDB Enrichment für verdächtige Geräte mit IPs
-            if _HAS_SHODAN and mac_to_ips:
+            if public_ips:
                 enriched_any = False
-                for mac in new_suspicious:
-                    ips = mac_to_ips.get(mac, set())
-                    public_ips = [ip for ip in ips if not is_private_ip(ip)]
-                    if not public_ips:
+                for mac, ips in public_ips.items():
+                    if not ips:
                         continue
                     if not enriched_any:
                         f.write('\n### 🌐 InternetDB Enrichment\n\n')
                         enriched_any = True
-                    for ip in public_ips[:2]:
-                        info = enrich_ip(ip, api_key=shodan_key)
+                    for ip in ips:
+                        if stage.pending('internetdb', ip):
+                            f.write(f'**`{mac}`** → `{ip}`: ⏳ ausstehend (Zeitlimit)\n\n')
+                            continue
+                        if stage.failed('internetdb', ip):
+                            f.write(f'**`{mac}`** → `{ip}`: ⚠ Abfrage fehlgeschlagen\n\n')
+                            continue
+                        info = stage.result('internetdb', ip) or {'source': 'error'}
                         if info.get('source') == 'error':
                             continue
                         f.write(f'**`{mac}`** → `{ip}`\n')
@@ -327,8 +431,8 @@ def save_report(scored, suspicious, output_dir, ignore_macs, bt_devices=None, ou
                     f.write('\n')
 
             f.write('\n## Bluetooth Geräte\n\n')
-            f.write('| MAC | Name | Typ | Risiko | Mic | Cam | WiFi-Korr. |\n')
-            f.write('|-----|------|-----|--------|-----|-----|------------|\n')
+            f.write('| MAC | Name | Typ | Risiko | Mic | Cam | WiFi-Korr. | Orte |\n')
+            f.write('|-----|------|-----|--------|-----|-----|------------|------|\n')
             for mac, d in bt_fingerprinted.items():
                 corr = '-'
                 for wmac in suspicious:
@@ -344,20 +448,23 @@ def save_report(scored, suspicious, output_dir, ignore_macs, bt_devices=None, ou
                 cam = '📷' if d.get('has_camera') else '-'
                 f.write(f'| `{mac}` | {d.get("name","?")} | '
                         f'{d.get("device_type", d.get("type","?"))} | '
-                        f'{risk_em} {d.get("risk","?")} | {mic} | {cam} | {corr} |\n')
+                        f'{risk_em} {d.get("risk","?")} | {mic} | {cam} | {corr} | '
+                        f'{fmt_places(d)} |\n')
 
     # WiGLE Nearby-Abgleich (nur wenn GPS + WiGLE verfügbar)
-    if wigle_client and cur_lat and cur_lon and cur_lat != 0 and cur_lon != 0:
-        try:
-            nearby = wigle_client.search_nearby(cur_lat, cur_lon, radius_m=200)
+    if nearby_key:
+        nearby = wigle_sched.result(*nearby_key)
+        with open(path, 'a') as f:
             if nearby:
-                nearby_section = format_nearby_section(
-                    nearby, list(suspicious.keys()), cur_lat, cur_lon, radius_m=200
-                )
-                with open(path, 'a') as f:
-                    f.write(nearby_section)
-        except Exception as e:
-            log.warning(f'WiGLE Nearby fehlgeschlagen: {e}')
+                f.write(format_nearby_section(
+                    nearby, list(suspicious.keys()), cur_lat, cur_lon, radius_m=200))
+            elif wigle_sched.pending(*nearby_key):
+                f.write('\n## 📡 WiGLE Nearby-Abgleich (200m Radius)\n\n⏳ Ausstehend (Zeitlimit)\n')
+            elif wigle_sched.failed(*nearby_key):
+                f.write('\n## 📡 WiGLE Nearby-Abgleich (200m Radius)\n\n⚠ Abfrage fehlgeschlagen\n')
+    if wigle_client and not stage.pending('wigle', 'report'):
+        wigle_client.flush()
+    http_pool.log_stats()
 
     log.info(f'Report: {path}')
     print(f'REPORT_PATH:{path}')
@@ -400,20 +507,31 @@ def main():
     # WiGLE Client initialisieren
     wigle_client = None
     wigle_cfg = config.get('wigle', {})
-    if wigle_cfg.get('enabled') and wigle_cfg.get('api_token'):
-        wigle_client = WiGLEClient(wigle_cfg['api_name'], wigle_cfg['api_token'])
-        log.info('WiGLE aktiviert')
+    wigle_offline = open_offline(wigle_cfg.get('offline_db', OFFLINE_DB)) \
+        if wigle_cfg.get('enabled') else None
+    if wigle_cfg.get('enabled') and (wigle_cfg.get('api_token') or wigle_offline):
+        wigle_client = WiGLEClient(wigle_cfg.get('api_name', ''), wigle_cfg.get('api_token', ''),
+                                   budget_s=wigle_cfg.get('time_budget_s', BUDGET_S),
+                                   offline=wigle_offline)
+        log.info('WiGLE aktiviert' + (' (mit Offline-DB)' if wigle_offline else ''))
     else:
         log.info('WiGLE deaktiviert')
 
+    # GPS-Track einmal laden (Geotagging pro Frame/BT-Gerät + aktuelle Position)
+    cur_lat, cur_lon = None, None
+    gps_track_path = config.get('paths', {}).get(
+        'gps_track', '/root/loot/chasing_your_tail/gps_track.csv')
+    track = GpsTrack.load(gps_track_path)
+    fix = track.last()
+    if fix:
+        _, cur_lat, cur_lon = fix
+        log.info(f'GPS: {cur_lat}, {cur_lon} ({len(track)} Fixes im Track)')
+
     # BT-Scans laden
     bt_devices_all = {}
     if args.bt_scans:
-        for bt_file in [f.strip() for f in args.bt_scans.split(',') if f.strip()]:
-            if os.path.exists(bt_file):
-                with open(bt_file) as f:
-                    bt_data = json.load(f)
-                bt_devices_all.update(bt_data.get('bt_devices', {}))
+        bt_devices_all = load_bt_scans(
+            [f.strip() for f in args.bt_scans.split(',') if f.strip()], track)
         log.info(f'BT-Geräte geladen: {len(bt_devices_all)}')
 
     # Ignore-Listen laden
@@ -423,7 +541,7 @@ def main():
     pcap_files = [p.strip() for p in args.pcaps.split(',') if p.strip()]
     log.info(f'{len(pcap_files)} PCAP-Datei(en) werden analysiert')
 
-    scans = [read_pcap_probes(p) for p in pcap_files]
+    scans = [read_pcap_probes(p, track) for p in pcap_files]
     if not any(scans):
         log.warning('Keine Daten gefunden.')
         sys.exit(0)
@@ -439,27 +557,19 @@ def main():
     # SuspectsDB laden
     suspects_db_path = config.get('paths', {}).get(
         'suspects_db', '/root/loot/chasing_your_tail/suspects_db.json')
-    suspects = SuspectsDB(suspects_db_path)
+    hist_cfg = config.get('surveillance', {})
+    visit_merge_m = hist_cfg.get('visit_merge_m', VISIT_MERGE_M)
+    max_visits = hist_cfg.get('max_visits', MAX_VISITS)
+    suspects = SuspectsDB(suspects_db_path, visit_merge_m, max_visits)
 
     # WatchList laden
     watch_list_path = config.get('paths', {}).get(
         'watch_list', '/root/loot/chasing_your_tail/watch_list.json')
-    wl = WatchList(watch_list_path)
-
-    # GPS-Koordinaten aus letztem GPS-Track lesen (falls vorhanden)
-    cur_lat, cur_lon = None, None
-    gps_track = config.get('paths', {}).get(
-        'gps_track', '/root/loot/chasing_your_tail/gps_track.csv')
-    if os.path.exists(gps_track):
-        try:
-            with open(gps_track) as f:
-                lines = [l.strip() for l in f if l.strip()]
-            if lines:
-                last = lines[-1].split(',')
-                cur_lat, cur_lon = float(last[1]), float(last[2])
-                log.info(f'GPS: {cur_lat}, {cur_lon}')
-        except Exception as e:
-            log.warning(f'GPS-Track Lesefehler: {e}')
+    wl = WatchList(watch_list_path, visit_merge_m, max_visits)
+    # Zonenindex einmal pro Lauf (Watch-List-Zonen + config known_zones)
+    wl_cfg = config.get('watch_list', {})
+    wl.build_zone_index(wl_cfg.get('known_zones', []),
+                        wl_cfg.get('default_zone_radius_m', 100))
 
     # IP-Extraktion aus PCAPs (für InternetDB Enrichment)
     mac_to_ips = {}
@@ -478,7 +588,8 @@ def main():
     save_report(scored, suspicious, args.output_dir, ignore_macs,
                 bt_devices_all, oui_db, wigle_client,
                 suspects, wl, cur_lat, cur_lon,
-                mac_to_ips=mac_to_ips, shodan_key=shodan_key)
+                mac_to_ips=mac_to_ips, shodan_key=shodan_key,
+                enrich_deadline_s=config.get('enrichment', {}).get('deadline_s', DEADLINE_S))
     sys.exit(2 if suspicious else 0)
 
 if __name__ == '__main__':
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+bench_enrichment.py - Benchmark der Enrichment-Pipeline gegen den lokalen
+mock_enrichment_server (keine echten Dienste, keine echten Daten).
+
+Startet den Mock-Server, leitet http_pool dorthin um, legt WiGLE- und
+Enrichment-Cache in ein temp-Verzeichnis und erzeugt synthetische Daten:
+Probe-Geräte (SSIDs aus einem gemeinsamen Pool, öffentliche IPs aus den
+Dokumentations-Netzen) und Kamera-Beacons. Danach --runs Durchläufe
+(1. kalt, weitere warm aus dem persistenten Cache) von
+
+  analyze_pcap.save_report      WiGLE (MAC/SSID/Nearby) + InternetDB
+  hotel_scan.analyze_beacons    Fingerbank + CVEDB
+
+Ausgabe je Lauf: Wall-Zeit beider Stufen, Requests je Host (Server-Sicht,
+inkl. 429/503), neue/wiederverwendete Verbindungen, Cache-Trefferquote.
+
+  python3 bench_enrichment.py --devices 30 --latency-ms 300 --rate-limit 2
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import http_pool
+import shodan_lookup
+import wigle_lookup
+import analyze_pcap
+import hotel_scan
+from pcap_engine import analyze_persistence
+from oui_attrs import CAMERA_OUIS
+from mock_enrichment_server import MockEnrichmentServer
+
+# Synthetische Position (offener Atlantik) - nur für die Nearby-Kacheln
+BENCH_LAT = 0.5
+BENCH_LON = -30.5
+
+
+def make_scans(n_devices, n_ssids):
+    """Zwei Scan-Fenster mit denselben Geräten → alle verdächtig (Score 1.0)."""
+    now = time.time()
+    scan = {}
+    for i in range(n_devices):
+        mac = f'02:00:5e:{(i >> 8) & 0xff:02x}:{i & 0xff:02x}:01'
+        ssids = [f'bench-net-{(i * 7 + k) % n_ssids}' for k in range(i % 3)]
+        scan[mac] = {'count': 3, 'ssids': ssids, 'rssi_max': -55 - i % 30,
+                     'rssi_last': -60 - i % 30, 'last_seen': now}
+    return analyze_persistence(scan, scan, threshold=0.6, min_appearances=2)
+
+
+def make_ips(macs, per_mac=2):
+    """Öffentliche IPs aus TEST-NET-2/3 (RFC 5737), je Gerät per_mac."""
+    out = {}
+    for i, mac in enumerate(macs):
+        out[mac] = {f'{"198.51.100" if k else "203.0.113"}.{(i * per_mac + k) % 254 + 1}'
+                    for k in range(per_mac)}
+    return out
+
+
+def make_beacons(n):
+    """Beacons mit Kamera-OUIs und -SSIDs (mehrere je Hersteller)."""
+    ouis = [o for o, v in CAMERA_OUIS.items() if 'IoT' not in v]
+    beacons = {}
+    for i in range(n):
+        bssid = f'{ouis[i % len(ouis)]}:{(i >> 8) & 0xff:02x}:{i & 0xff:02x}:10'
+        beacons[bssid] = {'ssid': f'hikvision-{i}' if i % 3 == 0 else f'bench-{i}',
+                          'hidden': False, 'channel': 1 + i % 11,
+                          'rssi': -50 - i % 40, 'beacon_count': 10}
+    return beacons
+
+
+def _ratio(hits, misses):
+    total = hits + misses
+    return f'{hits / total * 100:.0f}%' if total else '-'
+
+
+def run_once(args, srv, tmp, scored, suspicious, mac_to_ips, beacons):
+    srv.reset()
+    http_pool.POOL = http_pool.HTTPPool(mock=srv.url)
+    # Enrichment-Cache wie ein neuer Prozess von der Platte öffnen
+    shodan_lookup._cache = None
+    client = wigle_lookup.WiGLEClient('bench', 'bench', budget_s=args.deadline)
+    if args.wigle_rate:
+        client.bucket = wigle_lookup.TokenBucket(args.wigle_rate, wigle_lookup.RATE_BURST)
+
+    t0 = time.monotonic()
+    analyze_pcap.save_report(scored, suspicious, tmp, set(),
+                             wigle_client=client,
+                             cur_lat=BENCH_LAT, cur_lon=BENCH_LON,
+                             mac_to_ips=mac_to_ips,
+                             shodan_key='bench' if args.shodan_key else None,
+                             enrich_deadline_s=args.deadline)
+    t_report = time.monotonic() - t0
+
+    t0 = time.monotonic()
+    suspects = hotel_scan.analyze_beacons(beacons, None, fingerbank_key='bench',
+                                          mac_to_dhcp={}, deadline_s=args.deadline)
+    t_hotel = time.monotonic() - t0
+
+    pending = sum(1 for s in suspects for r in s['reasons'] if r.startswith('⏳'))
+    enrich = shodan_lookup._store()
+    result = {
+        'report_s': t_report, 'hotel_s': t_hotel, 'hotel_pending': pending,
+        'server': srv.stats(), 'pool': http_pool.POOL.stats(),
+        'wigle_cache': (client._cache.hits, client._cache.misses),
+        'enrich_cache': (enrich.hits, enrich.misses),
+        'wigle_skipped': client.skipped,
+    }
+    client.flush()
+    shodan_lookup.flush_cache()
+    http_pool.POOL.close()
+    return result
+
+
+def print_result(n, r):
+    print(f'\n── Lauf {n} {"(kalt)" if n == 1 else "(warm)"} ' + '─' * 40)
+    print(f'save_report:     {r["report_s"]:6.2f} s   '
+          f'(WiGLE übersprungen: {r["wigle_skipped"]})')
+    print(f'analyze_beacons: {r["hotel_s"]:6.2f} s   '
+          f'(ausstehend: {r["hotel_pending"]})')
+    server = r['server']
+    print(f'{"Host":<22} {"Req":>5} {"429":>5} {"503":>5} {"neu":>5} {"reuse":>5} {"Ø ms":>6}')
+    for host in sorted(h for h in server if h != '*'):
+        s = server[host]
+        p = r['pool'].get(host, {})
+        print(f'{host:<22} {s.get("requests", 0):>5} {s.get("429", 0):>5} '
+              f'{s.get("503", 0):>5} {p.get("new", 0):>5} {p.get("reused", 0):>5} '
+              f'{p.get("avg_ms") if p.get("avg_ms") is not None else "-":>6}')
+    total = sum(s.get('requests', 0) for h, s in server.items() if h != '*')
+    conns = server.get('*', {}).get('connections', 0)
+    print(f'Requests gesamt: {total}, TCP-Verbindungen: {conns}')
+    print(f'Cache-Trefferquote: WiGLE {_ratio(*r["wigle_cache"])}, '
+          f'Enrichment {_ratio(*r["enrich_cache"])}')
+
+
+def main():
+    p = argparse.ArgumentParser(description='Enrichment-Benchmark gegen Mock-Server')
+    p.add_argument('--devices', type=int, default=20, help='verdächtige Probe-Geräte')
+    p.add_argument('--ssids', type=int, default=15, help='Größe des SSID-Pools')
+    p.add_argument('--beacons', type=int, default=20, help='Kamera-Beacons (hotel_scan)')
+    p.add_argument('--runs', type=int, default=2, help='Durchläufe (1. kalt, Rest warm)')
+    p.add_argument('--deadline', type=float, default=analyze_pcap.DEADLINE_S,
+                   help='Enrichment-Deadline je Stufe (s)')
+    p.add_argument('--wigle-rate', type=float, default=0,
+                   help='WiGLE-Anfragen/s (Standard: wigle_lookup.RATE_LIMIT)')
+    p.add_argument('--shodan-key', action='store_true', help='Shodan Host-API mitmessen')
+    p.add_argument('--latency-ms', type=float, default=150)
+    p.add_argument('--jitter-ms', type=float, default=50)
+    p.add_argument('--error-rate', type=float, default=0.0)
+    p.add_argument('--rate-limit', type=float, default=0.0, help='Requests/s je Host (0 = aus)')
+    p.add_argument('--fixtures', help='aufgezeichnete Antworten (JSON-Lines)')
+    p.add_argument('--verbose', action='store_true')
+    args = p.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='[%(asctime)s] %(levelname)s %(name)s %(message)s')
+
+    srv = MockEnrichmentServer(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                               error_rate=args.error_rate, rate_limit=args.rate_limit,
+                               fixtures=args.fixtures, seed=1).start()
+
+    if not analyze_pcap._HAS_SHODAN:
+        # pcap_engine ohne read_pcap_data_ips: InternetDB-Pfad trotzdem messen
+        analyze_pcap.enrich_ip = shodan_lookup.enrich_ip
+        analyze_pcap.is_private_ip = shodan_lookup.is_private_ip
+        analyze_pcap._HAS_SHODAN = True
+
+    scored, suspicious = make_scans(args.devices, args.ssids)
+    mac_to_ips = make_ips(list(suspicious))
+    beacons = make_beacons(args.beacons)
+    print(f'Mock {srv.url}: {len(suspicious)} Geräte, '
+          f'{sum(len(v) for v in mac_to_ips.values())} IPs, {len(beacons)} Beacons, '
+          f'Latenz {args.latency_ms:.0f}±{args.jitter_ms:.0f} ms, '
+          f'Fehler {args.error_rate:.0%}, Rate-Limit {args.rate_limit or "-"}/s')
+
+    with tempfile.TemporaryDirectory(prefix='cyt_bench_') as tmp:
+        wigle_lookup.CACHE_FILE = os.path.join(tmp, 'wigle_cache.json')
+        shodan_lookup.CACHE_FILE = os.path.join(tmp, 'enrich_cache.json')
+        for n in range(1, args.runs + 1):
+            print_result(n, run_once(args, srv, tmp, scored, suspicious,
+                                     mac_to_ips, beacons))
+    srv.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,7 @@ bt_fingerprint.py - BT/BLE Device Fingerprinting für Chasing Your Tail NG v4.4
 Mappt Service UUIDs, Appearance Codes und Gerätenamen → Risikobewertung.
 Keine externen Abhängigkeiten.
 """
+from oui_attrs import CAMERA_OUIS, ATTR_CAMERA, ATTR_IOT_CHIP, attributes, camera_vendor
 
 # Risiko-Level
 RISK_NONE   = 'none'
@@ -314,79 +315,10 @@ _CAMERA_NAME_PATTERNS = [
 ]
 
 # ============================================================
-# KAMERA-HERSTELLER OUI (BT MAC Lookup)
+# KAMERA-HERSTELLER OUI (BT MAC Lookup) - gemeinsame Tabelle in oui_attrs
 # ============================================================
 
-CAMERA_OUI_PREFIXES = {
-    '9c:b8:b5': 'Hikvision',
-    'ac:cc:8e': 'Hikvision',
-    'c8:02:10': 'Hikvision',
-    'f0:9e:4a': 'Hikvision',
-    'b4:a3:82': 'Hikvision',
-    'd0:75:a7': 'Hikvision',
-    '54:c4:15': 'Hikvision',
-    'a0:e4:cb': 'Dahua',
-    '70:6a:eb': 'Dahua',
-    '7c:c2:c6': 'Reolink',
-    'ec:71:db': 'Wyze',
-    'a8:5b:4f': 'Wyze',
-    '2c:aa:8e': 'Arlo',
-    'e0:9a:d9': 'Arlo',
-    '30:8c:fb': 'Eufy',
-    '64:a2:f9': 'Ring',
-    'b0:09:da': 'Ring',
-    'c4:de:e2': 'Nest/Google',
-    '18:b4:30': 'Nest/Google',
-    # Espressif (ESP32/ESP8266) - häufig in DIY/Billig-Kameras
-    '68:02:b8': 'Espressif (IoT)',
-    '10:52:1c': 'Espressif (IoT)',
-    'a4:cf:12': 'Espressif (IoT)',
-    '24:0a:c4': 'Espressif (IoT)',
-    'cc:50:e3': 'Espressif (IoT)',
-    '84:f3:eb': 'Espressif (IoT)',
-    'ec:fa:bc': 'Espressif (IoT)',
-    '30:ae:a4': 'Espressif (IoT)',
-    '24:6f:28': 'Espressif (IoT)',
-    'c4:4f:33': 'Espressif (IoT)',
-    '7c:df:a1': 'Espressif (IoT)',
-    'b4:e6:2d': 'Espressif (IoT)',
-    '08:3a:f2': 'Espressif (IoT)',
-    'e8:68:e7': 'Espressif (IoT)',
-    # Realtek
-    '00:00:6c': 'Realtek (IoT)',
-    '00:e0:4c': 'Realtek (IoT)',
-    # Hikvision (weitere OUI-Blöcke)
-    '44:19:b6': 'Hikvision',
-    '40:59:c0': 'Hikvision',
-    'bc:ad:28': 'Hikvision',
-    'c0:56:e3': 'Hikvision',
-    # EZVIZ (Hikvision-Marke)
-    'c4:2f:90': 'EZVIZ/Hikvision',
-    '8c:e7:48': 'EZVIZ/Hikvision',
-    # Dahua (weitere OUI-Blöcke)
-    '3c:ef:8c': 'Dahua',
-    'e0:50:8b': 'Dahua',
-    '60:ed:e0': 'Dahua',
-    # IMOU (Dahua-Marke)
-    'f8:36:9b': 'IMOU/Dahua',
-    # Reolink (weitere OUI-Blöcke)
-    'e0:62:90': 'Reolink',
-    # Axis Communications (Profi-IP-Kameras)
-    '00:40:8c': 'Axis Communications',
-    # Tuya IoT (BK7231-Chip)
-    'd8:f1:5b': 'Tuya IoT',
-    'a4:50:46': 'Tuya IoT',
-    # Amazon Echo / Alexa (Mikrofon — BLE-Advertisement sichtbar)
-    'fc:65:de': 'Amazon Echo',
-    '40:b4:cd': 'Amazon Echo',
-    '74:c2:46': 'Amazon Echo',
-    '68:37:e9': 'Amazon Echo',
-    'f0:81:73': 'Amazon Echo',
-    # Raspberry Pi (DIY-Kamera / Surveillance-Plattform)
-    'b8:27:eb': 'Raspberry Pi',
-    'dc:a6:32': 'Raspberry Pi',
-    'e4:5f:01': 'Raspberry Pi',
-}
+CAMERA_OUI_PREFIXES = CAMERA_OUIS
 
 # ============================================================
 # FINGERPRINT FUNKTION
@@ -395,7 +327,7 @@ CAMERA_OUI_PREFIXES = {
 def fingerprint_device(mac, name='', uuids=None, appearance_code=None,
                        oui_vendor='', company_id=None,
                        addr_type=None, addr_subtype=None,
-                       msd_hex=None):
+                       msd_hex=None, oui_attrs=None):
     """
     Bewertet ein BT/BLE-Gerät anhand von UUIDs, Appearance, Name, OUI, Company ID.
 
@@ -408,6 +340,8 @@ def fingerprint_device(mac, name='', uuids=None, appearance_code=None,
         company_id:      BT SIG Company ID (int) aus Manufacturer Data
         addr_type:       'public' / 'random' / 'unknown' (BLE Address Type)
         addr_subtype:    'resolvable' / 'non_resolvable' / 'static' (nur bei random)
+        oui_attrs:       OUI-Attribut-Bitfeld (oui_attrs.attributes), sonst
+                         aus MAC + oui_vendor berechnet
 
     Returns:
         dict mit: risk, has_mic, has_camera, has_tracker, device_type, flags
@@ -472,17 +406,18 @@ def fingerprint_device(mac, name='', uuids=None, appearance_code=None,
                 flags.append(f'🎤 Headset/Speaker: "{name}"')
                 break
 
-    # 4. OUI check (Kamera-Hersteller via eigene DB)
-    mac_oui = mac.lower()[:8] if mac else ''
-    cam_vendor = CAMERA_OUI_PREFIXES.get(mac_oui)
-    if cam_vendor:
+    # 4. OUI-Attribute (vorberechnetes Bitfeld: Kamera-Hersteller, IoT-Chip)
+    if oui_attrs is None:
+        oui_attrs = attributes(mac.lower(), vendor=oui_vendor) if mac else 0
+    if oui_attrs & ATTR_CAMERA:
+        cam_vendor = camera_vendor(mac.lower()) or oui_vendor
         risk = _max_risk(risk, RISK_MEDIUM)
         flags.append(f'⚠ OUI Kamera-Hersteller: {cam_vendor}')
-        if 'Espressif' in cam_vendor or 'Realtek' in cam_vendor:
+        if oui_attrs & ATTR_IOT_CHIP:
             flags.append('⚠ IoT-Chip (DIY-Kamera möglich)')
 
-    # 5. IEEE OUI-Vendor (Espressif, Realtek, MediaTek = IoT-Hinweis)
-    if oui_vendor and any(v in oui_vendor for v in ['Espressif', 'Realtek', 'MediaTek']):
+    # 5. IoT-Chip-Hersteller (Espressif, Realtek, MediaTek)
+    if oui_attrs & ATTR_IOT_CHIP:
         risk = _max_risk(risk, RISK_MEDIUM)
         if not any('IoT' in f for f in flags):
             flags.append(f'⚠ IoT-Chip-Hersteller: {oui_vendor}')
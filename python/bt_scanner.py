@@ -5,8 +5,10 @@ Scannt BT Classic + BLE Geräte und korreliert mit WiFi-Probes.
 v4.4: BLE Advertisement Data (UUIDs, Appearance) via btmon + Fingerprinting.
 v4.5: SDP-Abfrage für BT Classic Geräte (sdptool browse).
 """
-import subprocess, threading, time, logging, os, json, re
+import subprocess, threading, time, logging, os, re
 from datetime import datetime
+from shared_state import atomic_write_json
+from gps_track import read_last_fix
 
 log = logging.getLogger('CYT-BT')
 
@@ -388,6 +390,7 @@ def _apply_fingerprinting(devices, oui_db=None):
         sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
         from bt_fingerprint import fingerprint_device
         from oui_lookup import lookup
+        from oui_attrs import attributes
     except ImportError as e:
         log.warning(f'Fingerprinting nicht verfügbar: {e}')
         return
@@ -400,6 +403,7 @@ def _apply_fingerprinting(devices, oui_db=None):
             uuids=dev.get('uuids', []),
             appearance_code=dev.get('appearance'),
             oui_vendor=vendor,
+            oui_attrs=attributes(mac, oui_db, vendor),
             company_id=dev.get('company_id'),
             addr_type=dev.get('addr_type'),
             addr_subtype=dev.get('addr_subtype'),
@@ -475,27 +479,17 @@ def get_gps_position():
     # every successful Mudi GPS poll. Reading the last line is cheap
     # and gives bt_scanner a real fix even when the pager has no local
     # GPS hardware.
+    # Letzter Fix per Seek vom Dateiende (gps_track.read_last_fix) statt
+    # die ganze, über Stunden wachsende Datei zeilenweise zu lesen.
     for track_path in ('/root/loot/argus/gps_track.csv',):
-        try:
-            with open(track_path) as f:
-                last = None
-                for line in f:
-                    line = line.strip()
-                    if line:
-                        last = line
-            if last:
-                parts = last.split(',')
-                if len(parts) >= 3:
-                    lat = float(parts[1])
-                    lon = float(parts[2])
-                    if lat != 0.0 or lon != 0.0:
-                        return {
-                            'lat': lat, 'lon': lon, 'alt': 0.0, 'speed': 0.0,
-                            'time': datetime.now().isoformat(),
-                            'fix': True, 'source': 'argus_track'
-                        }
-        except Exception:
-            pass
+        fix = read_last_fix(track_path)
+        if fix:
+            _, lat, lon = fix
+            return {
+                'lat': lat, 'lon': lon, 'alt': 0.0, 'speed': 0.0,
+                'time': datetime.now().isoformat(),
+                'fix': True, 'source': 'argus_track'
+            }
 
     # Skip the GPS_GET fallback entirely if the host already supplies GPS
     # (argus scan_engine writes gps_track.csv via Mudi). Avoids 3-5s per
@@ -542,17 +536,15 @@ def save_gps_track(gps_data, loot_dir):
                 f'{gps_data["fix"]}\n')
 
 def save_bt_scan(bt_devices, correlated, gps_data, output_path):
-    """Speichert BT-Scan-Ergebnisse als JSON."""
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    """Speichert BT-Scan-Ergebnisse als JSON (atomisch - analyze_pcap liest parallel)."""
     path = output_path
 
-    with open(path, 'w') as f:
-        json.dump({
-            'timestamp':   datetime.now().isoformat(),
-            'gps':         gps_data,
-            'bt_devices':  bt_devices,
-            'correlated':  correlated,
-        }, f, indent=2, default=str)
+    atomic_write_json(path, {
+        'timestamp':   datetime.now().isoformat(),
+        'gps':         gps_data,
+        'bt_devices':  bt_devices,
+        'correlated':  correlated,
+    }, indent=2, default=str)
 
     log.info(f'BT-Scan gespeichert: {path}')
     return path
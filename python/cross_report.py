@@ -11,57 +11,37 @@ Ausgabe:
 
 import argparse
 import re
-import math
 import os
 import sys
 import json
 from datetime import datetime, timedelta
 from collections import defaultdict
 
-RAT_HISTORY_FILE = "/root/loot/raypager/rat_history.json"
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from gps_track import GpsTrack
+from geo import leader_clusters, LeaderClusterer
+from time_join import window_join
+from feed_index import read_since, migrate_json_array, json_array_tail
+from shared_state import file_lock
 
+RAT_HISTORY_FILE = "/root/loot/raypager/rat_history.json"
+# JSONL-Feed: beim ersten Lauf aus dem JSON angelegt, neue JSON-Einträge
+# werden bei jedem Lauf nachgezogen (feed_index.migrate_json_array)
+RAT_HISTORY_JSONL = "/root/loot/raypager/rat_history.jsonl"
 
-# ── Haversine ─────────────────────────────────────────────────────────────────
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371000
-    p1, p2 = math.radians(lat1), math.radians(lat2)
-    dp = math.radians(lat2 - lat1)
-    dl = math.radians(lon2 - lon1)
-    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
-    return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+# Zeitfenster (±Sekunden) für Cell-Anomalie/SMS ↔ MAC-Korrelation
+CORR_WINDOW_SEC = 300
 
 
 # ── GPS Track ─────────────────────────────────────────────────────────────────
 def load_gps_track(path):
-    """Lädt gps_track.csv → [(datetime, lat, lon)]"""
-    entries = []
-    if not path or not os.path.exists(path):
-        return entries
-    with open(path) as f:
-        for line in f:
-            parts = line.strip().split(',')
-            if len(parts) < 3:
-                continue
-            try:
-                ts = datetime.strptime(parts[0], '%Y%m%d_%H%M%S')
-                lat, lon = float(parts[1]), float(parts[2])
-                if lat == 0.0 and lon == 0.0:
-                    continue
-                entries.append((ts, lat, lon))
-            except (ValueError, IndexError):
-                continue
-    return entries
+    """Lädt gps_track.csv → GpsTrack (sortierte Arrays, bisect-Index)"""
+    return GpsTrack.load(path)
 
 
 def find_nearest_gps(report_ts, gps_track, max_delta_sec=900):
     """Nächster GPS-Fix zu einem Report-Timestamp (max 15 min Abstand)."""
-    best, best_delta = None, float('inf')
-    for gts, lat, lon in gps_track:
-        delta = abs((report_ts - gts).total_seconds())
-        if delta < best_delta:
-            best_delta = delta
-            best = (lat, lon)
-    return best if best_delta <= max_delta_sec else None
+    return gps_track.nearest(report_ts, max_delta_sec)
 
 
 # ── Report Parser ─────────────────────────────────────────────────────────────
@@ -119,28 +99,54 @@ def parse_report_macs(filepath):
 # ── Standort-Clustering ───────────────────────────────────────────────────────
 def distinct_locations(coords, min_dist_m):
     """Anzahl Standort-Cluster (Haversine < min_dist_m = gleicher Ort)."""
-    clusters = []
-    for lat, lon in coords:
-        if not any(haversine(lat, lon, c[0], c[1]) < min_dist_m for c in clusters):
-            clusters.append((lat, lon))
+    clusters = leader_clusters(coords, min_dist_m)
     return len(clusters), clusters
 
 
 # ── Cell-Anomalien aus RAT-History ───────────────────────────────────────────
 
+def _rat_json_tail():
+    """
+    raypager schreibt weiter in rat_history.json: noch nicht übernommene
+    Einträge an den JSONL-Feed anhängen (beim ersten Lauf = Migration).
+    migrate_json_array parst dank <jsonl>.src nur den neuen Teil des Arrays.
+    Ohne Schreibrecht: dieselben Einträge nur zurückgeben.
+    """
+    if not os.path.exists(RAT_HISTORY_FILE):
+        return []
+    try:
+        # Lock: parallele Läufe sollen den Tail nicht doppelt anhängen
+        with file_lock(RAT_HISTORY_JSONL):
+            migrate_json_array(RAT_HISTORY_FILE, RAT_HISTORY_JSONL)
+        return []
+    except OSError:
+        pass
+    except ValueError:
+        return []   # Array unvollständig (raypager schreibt gerade)
+    try:
+        return json_array_tail(RAT_HISTORY_FILE, RAT_HISTORY_JSONL)[0]
+    except (OSError, ValueError):
+        return []
+
+
+def _rat_history_since(cutoff):
+    """
+    RAT-History-Einträge ab cutoff: JSONL-Feed per Zeitindex (nur neue
+    Zeilen) plus noch nicht übernommene JSON-Einträge (ohne Schreibrecht
+    und ohne JSONL: das ganze Array).
+    """
+    tail = [e for e in _rat_json_tail() if e["ts"] >= cutoff]
+    if os.path.exists(RAT_HISTORY_JSONL):
+        return [e for _, e in read_since(RAT_HISTORY_JSONL, lambda e: e["ts"], cutoff)] + tail
+    return tail
+
+
 def load_rat_anomalies(hours):
-    """Lädt RAT-Downgrades und No-Encryption Events aus rat_history.json."""
+    """Lädt RAT-Downgrades und No-Encryption Events aus rat_history(.jsonl)."""
     anomalies = []
     cutoff = datetime.utcnow().timestamp() - hours * 3600
-    try:
-        with open(RAT_HISTORY_FILE) as f:
-            history = json.load(f)
-    except (OSError, json.JSONDecodeError):
-        return anomalies
-    for entry in history:
+    for entry in _rat_history_since(cutoff):
         ts = entry.get("ts", 0)
-        if ts < cutoff:
-            continue
         if entry.get("downgrade"):
             anomalies.append({
                 "ts":      datetime.utcfromtimestamp(ts),
@@ -207,39 +213,148 @@ def load_rat_anomalies(hours):
 SILENT_SMS_FILE = "/root/loot/raypager/silent_sms.jsonl"
 
 
+def _sms_ts(e):
+    return datetime.fromisoformat(e.get("timestamp", "").rstrip("Z")).timestamp()
+
+
 def load_silent_sms(hours):
-    """Load flagged SMS from silent_sms.jsonl within the last `hours`."""
-    out = []
+    """Load flagged SMS from silent_sms.jsonl within the last `hours`.
+    Seeks via the sparse time index (feed_index) instead of decoding the
+    whole history."""
     cutoff = datetime.utcnow().timestamp() - hours * 3600
+    return [{
+        "ts":     datetime.utcfromtimestamp(ts),
+        "flags":  e.get("flags", []),
+        "sender": e.get("sender"),
+        "tp_pid": e.get("tp_pid"),
+        "tp_dcs": e.get("tp_dcs"),
+    } for ts, e in read_since(SILENT_SMS_FILE, _sms_ts, cutoff)]
+
+
+def _coincident_macs(report_idxs, reports):
+    """Hochrisiko-MACs aller Reports im Korrelationsfenster (sortiert, ohne Duplikate)."""
+    macs = set()
+    for i in report_idxs:
+        macs.update(reports[i]['high_macs'])
+    return sorted(macs)
+
+
+# ── Tages-Rollups ─────────────────────────────────────────────────────────────
+# Pro abgeschlossenem Tag einmal aus den Roh-Reports berechnet und unter
+# <report_dir>/rollups/rollup_YYYYMMDD.json abgelegt: pro MAC Sichtungen,
+# Standort-Cluster (Schwerpunkt + Anzahl), Top-Risiko und Hersteller, dazu
+# pro Report (ts, Hochrisiko-MACs) für die Zeitkorrelation. Lange Zeitfenster
+# kosten damit O(Tage × aktive MACs) statt O(Roh-Sichtungen). Nur der
+# laufende Tag und der angeschnittene erste Tag werden roh gelesen.
+ROLLUP_DIR = 'rollups'
+ROLLUP_VERSION = 2
+
+
+def _read_report(rf, ts, gps_track):
+    """Roh-Report → dict mit MACs, GPS und Hochrisiko-MACs."""
+    macs = parse_report_macs(rf)
+    gps = find_nearest_gps(ts, gps_track) if gps_track else None
+    return {
+        'file': rf, 'ts': ts, 'macs': macs, 'gps': gps,
+        # Einmal pro Report statt pro Anomalie
+        'high_macs': [m for m, d in macs.items() if d['risk'] == 'high'],
+    }
+
+
+def build_day_rollup(day, reports, min_dist_m):
+    """Tages-Rollup aus Roh-Reports (zeitlich sortiert) berechnen."""
+    macs = {}
+    places = {}
+    sums = {}       # mac → [[Σlat, Σlon], ...] je Cluster
+    for r in reports:
+        t = r['ts'].timestamp()
+        for mac, info in r['macs'].items():
+            m = macs.get(mac)
+            if m is None:
+                m = macs[mac] = {
+                    'count': 0, 'vendor': '', 'scan_type': info['scan_type'],
+                    'top_risk': 'low', 'first': t, 'last': t,
+                    'gps_count': 0, 'clusters': [],
+                }
+                places[mac] = LeaderClusterer(min_dist_m)
+                sums[mac] = []
+            m['count'] += 1
+            m['last'] = t
+            if not m['vendor'] and info['vendor']:
+                m['vendor'] = info['vendor']
+            if info['risk'] == 'high':
+                m['top_risk'] = 'high'
+            if r['gps']:
+                m['gps_count'] += 1
+                lat, lon = r['gps'][0], r['gps'][1]
+                idx, new = places[mac].add(lat, lon)
+                if new:
+                    m['clusters'].append([0.0, 0.0, 0])
+                    sums[mac].append([0.0, 0.0])
+                sums[mac][idx][0] += lat
+                sums[mac][idx][1] += lon
+                m['clusters'][idx][2] += 1
+    # Cluster-Schwerpunkte statt Leader-Punkte
+    for mac, m in macs.items():
+        for c, (s_lat, s_lon) in zip(m['clusters'], sums[mac]):
+            c[0] = round(s_lat / c[2], 6)
+            c[1] = round(s_lon / c[2], 6)
+    return {
+        'version': ROLLUP_VERSION,
+        'day': day,
+        'radius_m': min_dist_m,
+        'files': sorted(os.path.basename(r['file']) for r in reports),
+        'reports': [[r['ts'].timestamp(), r['high_macs']] for r in reports],
+        'macs': macs,
+    }
+
+
+def load_day_rollup(report_dir, day, files, min_dist_m, get_track):
+    """
+    Rollup für einen abgeschlossenen Tag laden oder (neu) berechnen.
+    files: [(pfad, ts)] der Reports dieses Tages. Neu berechnet wird nur,
+    wenn Reports hinzugekommen sind oder sich der Ortsradius geändert hat
+    (gelöschte Roh-Reports lassen das Rollup unverändert).
+    """
+    path = os.path.join(report_dir, ROLLUP_DIR, f'rollup_{day}.json')
+    names = {os.path.basename(rf) for rf, _ in files}
     try:
-        with open(SILENT_SMS_FILE) as f:
-            for line in f:
-                try:
-                    e = json.loads(line)
-                    ts_str = e.get("timestamp", "").rstrip("Z")
-                    ts = datetime.fromisoformat(ts_str).timestamp()
-                    if ts < cutoff:
-                        continue
-                    out.append({
-                        "ts":     datetime.utcfromtimestamp(ts),
-                        "flags":  e.get("flags", []),
-                        "sender": e.get("sender"),
-                        "tp_pid": e.get("tp_pid"),
-                        "tp_dcs": e.get("tp_dcs"),
-                    })
-                except (ValueError, KeyError):
-                    continue
-    except (OSError, json.JSONDecodeError):
+        with open(path) as f:
+            rollup = json.load(f)
+        if (rollup.get('version') == ROLLUP_VERSION
+                and rollup.get('radius_m') == min_dist_m
+                and names <= set(rollup.get('files', []))):
+            return rollup
+    except (OSError, ValueError):
         pass
-    return out
+
+    track = get_track()
+    reports = [_read_report(rf, ts, track) for rf, ts in files]
+    rollup = build_day_rollup(day, reports, min_dist_m)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(rollup, f, separators=(',', ':'))
+        os.replace(tmp, path)
+    except OSError as e:
+        sys.stderr.write(f'Rollup nicht schreibbar ({path}): {e}\n')
+    return rollup
 
 
 # ── Hauptanalyse ──────────────────────────────────────────────────────────────
-def analyze(report_dir, gps_track_path, hours, min_reports, min_dist_m, output):
+def analyze(report_dir, gps_track_path, hours, min_reports, min_dist_m, output,
+            corr_window=CORR_WINDOW_SEC, use_rollups=True):
     cutoff = datetime.utcnow() - timedelta(hours=hours)
-    gps_track = load_gps_track(gps_track_path)
 
-    # Reports im Zeitfenster laden
+    # GPS-Track nur laden wenn Roh-Reports verortet werden müssen
+    _track = []
+    def get_track():
+        if not _track:
+            _track.append(load_gps_track(gps_track_path))
+        return _track[0]
+
+    # Reports im Zeitfenster nach Tag gruppieren
     patterns = ('argus_report_', 'cyt_report_', 'hotel_scan_')
     candidates = sorted([
         os.path.join(report_dir, f)
@@ -247,14 +362,33 @@ def analyze(report_dir, gps_track_path, hours, min_reports, min_dist_m, output):
         if f.endswith('.md') and any(f.startswith(p) for p in patterns)
     ])
 
-    reports = []
+    by_day = defaultdict(list)
     for rf in candidates:
         ts = parse_report_ts(rf)
         if ts is None or ts < cutoff:
             continue
-        macs = parse_report_macs(rf)
-        gps = find_nearest_gps(ts, gps_track) if gps_track else None
-        reports.append({'file': rf, 'ts': ts, 'macs': macs, 'gps': gps})
+        by_day[ts.strftime('%Y%m%d')].append((rf, ts))
+
+    # Abgeschlossene, vollständig im Fenster liegende Tage → Rollup,
+    # laufender und angeschnittener erster Tag → roh
+    today = datetime.utcnow().strftime('%Y%m%d')
+    first_day = cutoff.strftime('%Y%m%d')
+    days = []           # [(day, rollup oder None, roh-Reports)]
+    for day in sorted(by_day):
+        if use_rollups and first_day < day < today:
+            days.append((day, load_day_rollup(report_dir, day, by_day[day],
+                                              min_dist_m, get_track), []))
+        else:
+            days.append((day, None, [_read_report(rf, ts, get_track())
+                                     for rf, ts in by_day[day]]))
+
+    # Reports für die Zeitkorrelation (ts + Hochrisiko-MACs)
+    reports = []
+    for _, rollup, raw in days:
+        if rollup:
+            reports.extend({'ts': datetime.fromtimestamp(t), 'high_macs': hm}
+                           for t, hm in rollup['reports'])
+        reports.extend(raw)
 
     n_reports = len(reports)
     rat_anomalies = load_rat_anomalies(hours)
@@ -269,43 +403,62 @@ def analyze(report_dir, gps_track_path, hours, min_reports, min_dist_m, output):
         print(f'CROSS_SUMMARY:0/{n_reports}')
         return
 
-    # MAC-Sichtungen aggregieren
-    mac_data = defaultdict(list)
-    for r in reports:
-        for mac, info in r['macs'].items():
-            mac_data[mac].append({
-                'ts': r['ts'],
-                'gps': r['gps'],
-                'risk': info['risk'],
-                'scan_type': info['scan_type'],
-                'vendor': info['vendor'],
-                'report': os.path.basename(r['file']),
-            })
+    # MAC-Sichtungen aggregieren (Tage chronologisch)
+    mac_data = {}
+    for day, rollup, raw in days:
+        if rollup:
+            for mac, m in rollup['macs'].items():
+                a = mac_data.setdefault(mac, {
+                    'count': 0, 'coords': [], 'sightings': [], 'risks': set(),
+                    'vendor': '', 'scan_type': m['scan_type'], 'gps_count': 0,
+                })
+                a['count'] += m['count']
+                a['gps_count'] += m['gps_count']
+                a['coords'].extend((c[0], c[1]) for c in m['clusters'])
+                a['risks'].add(m['top_risk'])
+                a['vendor'] = a['vendor'] or m['vendor']
+                a['sightings'].append({
+                    'ts': datetime.fromtimestamp(m['first']),
+                    'rollup': True,
+                    'count': m['count'],
+                    'n_locs': len(m['clusters']),
+                })
+        for r in raw:
+            for mac, info in r['macs'].items():
+                a = mac_data.setdefault(mac, {
+                    'count': 0, 'coords': [], 'sightings': [], 'risks': set(),
+                    'vendor': '', 'scan_type': info['scan_type'], 'gps_count': 0,
+                })
+                a['count'] += 1
+                if r['gps']:
+                    a['gps_count'] += 1
+                    a['coords'].append((r['gps'][0], r['gps'][1]))
+                a['risks'].add(info['risk'])
+                a['vendor'] = a['vendor'] or info['vendor']
+                a['sightings'].append({
+                    'ts': r['ts'],
+                    'gps': r['gps'],
+                    'report': os.path.basename(r['file']),
+                })
 
     # Filtern und bewerten
     results = []
-    for mac, sightings in mac_data.items():
-        if len(sightings) < min_reports:
+    for mac, a in mac_data.items():
+        if a['count'] < min_reports:
             continue
 
-        coords = [(s['gps'][0], s['gps'][1]) for s in sightings if s['gps']]
+        coords = a['coords']
         n_locs, loc_clusters = distinct_locations(coords, min_dist_m) if coords else (0, [])
-        has_gps = len(coords) > 0
-
-        risks = [s['risk'] for s in sightings]
-        top_risk = 'high' if 'high' in risks else 'low'
-        vendor = next((s['vendor'] for s in sightings if s['vendor']), 'Unbekannt')
-        scan_type = sightings[0]['scan_type']
 
         results.append({
             'mac': mac,
-            'vendor': vendor,
-            'scan_type': scan_type,
-            'top_risk': top_risk,
-            'count': len(sightings),
+            'vendor': a['vendor'] or 'Unbekannt',
+            'scan_type': a['scan_type'],
+            'top_risk': 'high' if 'high' in a['risks'] else 'low',
+            'count': a['count'],
             'n_locs': n_locs,
-            'has_gps': has_gps,
-            'sightings': sightings,
+            'has_gps': a['gps_count'] > 0,
+            'sightings': a['sightings'],
             'loc_clusters': loc_clusters,
         })
 
@@ -315,19 +468,19 @@ def analyze(report_dir, gps_track_path, hours, min_reports, min_dist_m, output):
     critical = [r for r in results if r['n_locs'] >= 2]
     persistent = [r for r in results if r['n_locs'] < 2]
 
-    # Korrelation: Cell-Anomalie ± 5min mit verdächtigen MACs
-    correlated = []
-    for anom in rat_anomalies:
-        anom_ts = anom["ts"]
-        coincident_macs = []
-        for r in reports:
-            if abs((r["ts"] - anom_ts).total_seconds()) <= 300:
-                high_macs = [m for m, d in r["macs"].items() if d["risk"] == "high"]
-                coincident_macs.extend(high_macs)
-        if coincident_macs:
-            correlated.append({**anom, "macs": list(set(coincident_macs))})
-        else:
-            correlated.append({**anom, "macs": []})
+    # Korrelation: Cell-Anomalie / Silent SMS ± corr_window mit verdächtigen MACs
+    # Zwei-Zeiger-Join über zeitlich sortierte Ströme statt Anomalie × Report
+    report_times = [r["ts"].timestamp() for r in reports]
+    anom_hits = window_join([a["ts"].timestamp() for a in rat_anomalies],
+                            report_times, corr_window)
+    correlated = [{**anom, "macs": _coincident_macs(hits, reports)}
+                  for anom, hits in zip(rat_anomalies, anom_hits)]
+
+    silent_sms = load_silent_sms(hours)
+    sms_hits = window_join([e["ts"].timestamp() for e in silent_sms],
+                           report_times, corr_window)
+    for e, hits in zip(silent_sms, sms_hits):
+        e["macs"] = _coincident_macs(hits, reports)
 
     # Report generieren
     n_cell_critical = sum(1 for a in correlated if a["type"] in ("RAT_DOWNGRADE", "NO_ENCRYPTION"))
@@ -364,6 +517,12 @@ def analyze(report_dir, gps_track_path, hours, min_reports, min_dist_m, output):
                 f"- **Gesehen in:**",
             ]
             for s in r['sightings']:
+                if s.get('rollup'):
+                    lines.append(
+                        f"  - {s['ts'].strftime('%d.%m.')} | {s['count']}× | "
+                        f"{s['n_locs']} Ort(e) | Tages-Rollup"
+                    )
+                    continue
                 gps_str = f"{s['gps'][0]:.5f},{s['gps'][1]:.5f}" if s['gps'] else 'kein GPS'
                 lines.append(
                     f"  - {s['ts'].strftime('%H:%M')} | {gps_str} | {s['report']}"
@@ -446,7 +605,6 @@ def analyze(report_dir, gps_track_path, hours, min_reports, min_dist_m, output):
         ]
 
     # ── Silent / Binary / OTA SMS Sektion ─────────────────────────────────────
-    silent_sms = load_silent_sms(hours)
     if silent_sms:
         lines += ['', '## 📨 Covert SMS', '']
         for e in silent_sms:
@@ -471,6 +629,11 @@ def analyze(report_dir, gps_track_path, hours, min_reports, min_dist_m, output):
                 lines.append(
                     "- **Bewertung:** Binäre SMS — häufig STK-Kommando oder Tracking-Payload"
                 )
+            if e["macs"]:
+                lines.append(
+                    f"- **⚠️ Gleichzeitig verdächtige MACs ({len(e['macs'])}):** "
+                    + ", ".join(f"`{m}`" for m in e["macs"])
+                )
             lines.append('')
 
     content = '\n'.join(lines) + '\n'
@@ -496,6 +659,10 @@ if __name__ == '__main__':
     ap.add_argument('--min-reports', type=int, default=2, help='Min. Sichtungen')
     ap.add_argument('--min-distance', type=float, default=200.0, help='Min. Ortsdistanz (m)')
     ap.add_argument('--output', default=None, help='Ausgabedatei (.md)')
+    ap.add_argument('--no-rollups', action='store_true',
+                    help='Tages-Rollups ignorieren, alles aus Roh-Reports berechnen')
+    ap.add_argument('--corr-window', type=float, default=CORR_WINDOW_SEC,
+                    help='Korrelationsfenster Cell-Anomalie/SMS ↔ MAC (±Sekunden)')
     args = ap.parse_args()
 
     analyze(
@@ -505,4 +672,6 @@ if __name__ == '__main__':
         min_reports=args.min_reports,
         min_dist_m=args.min_distance,
         output=args.output,
+        corr_window=args.corr_window,
+        use_rollups=not args.no_rollups,
     )
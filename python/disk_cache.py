@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+disk_cache.py - Persistenter Antwort-Cache (WiGLE, InternetDB, ...)
+Statt nach jedem Request die ganze JSON-Datei neu zu schreiben:
+
+  Snapshot   <pfad>           {'version': 1, 'entries': {key: [ts, ttl, wert]}}
+  Journal    <pfad>.journal   eine JSON-Zeile je neuem Eintrag (angehängt)
+
+put() sammelt Einträge im Speicher (write-behind); flush() hängt sie unter
+Lock als kleine Journal-Records an - nach flush_every Einträgen automatisch
+und einmal am Ende des Laufs (atexit). Wird das Journal zu groß, werden
+Snapshot + Journal zusammengeführt, abgelaufene Einträge verworfen und der
+Snapshot atomisch neu geschrieben (Kompaktierung).
+
+TTL je Eintrag; Wert None = negativer Eintrag ("nichts gefunden"/Fehler),
+typischerweise mit kürzerer TTL. LRU-Obergrenze max_entries im Speicher
+und im Snapshot. Einträge anderer Prozesse werden bei einem Cache-Miss
+nachgeladen (nur der neue Teil des Journals). Thread-sicher (RLock) für
+parallele Lookups (enrichment.py).
+Alter Cache im Format {key: wert} wird beim Laden übernommen.
+"""
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+
+from shared_state import file_lock, atomic_write_json, _stamp
+
+log = logging.getLogger('CYT-Cache')
+
+# Rückgabe von get() für "nicht im Cache" (None ist ein gültiger Negativ-Eintrag)
+MISS = object()
+
+_VERSION = 1
+
+
+class PersistentCache:
+    """
+    Schlüssel/Wert-Cache mit TTL, Negativ-Einträgen, LRU-Grenze und
+    Journal-Persistenz.
+    get(key, default=MISS)  Wert (auch None) oder default wenn fehlt/abgelaufen
+    put(key, wert, ttl)     Eintrag setzen (wert=None → negativ)
+    flush()                 ausstehende Einträge ins Journal schreiben
+    """
+
+    def __init__(self, path, default_ttl=7 * 86400, max_entries=5000,
+                 flush_every=25, journal_max=256 * 1024):
+        self.path = path
+        self.journal = path + '.journal'
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.flush_every = flush_every
+        self.journal_max = journal_max
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()   # key → [ts, ttl, wert], LRU-Reihenfolge
+        self._pending = {}              # noch nicht im Journal
+        self._snap_stamp = None
+        self._journal_pos = 0
+        self._lock = threading.RLock()
+        self._load()
+        atexit.register(self.flush)
+
+    # ── Laden ───────────────────────────────────────────────
+
+    def _apply(self, key, rec):
+        """Record übernehmen, wenn neuer als der vorhandene Eintrag."""
+        cur = self._entries.get(key)
+        if cur is None or rec[0] >= cur[0]:
+            self._entries[key] = rec
+
+    def _load(self):
+        """Snapshot + komplettes Journal lesen (ausstehende Einträge bleiben)."""
+        self._entries = OrderedDict()
+        self._snap_stamp = _stamp(self.path)
+        if self._snap_stamp is not None:
+            try:
+                with open(self.path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                log.warning(f'{self.path} nicht lesbar: {e}')
+                data = {}
+            if isinstance(data, dict) and data.get('version') == _VERSION:
+                for key, rec in data.get('entries', {}).items():
+                    self._entries[key] = rec
+            elif isinstance(data, dict):
+                # Alter Cache {key: wert} - Stand = Datei-mtime
+                ts = self._snap_stamp[0] / 1e9
+                for key, value in data.items():
+                    self._entries[key] = [ts, self.default_ttl, value]
+        self._journal_pos = 0
+        self._read_journal()
+        for key, rec in self._pending.items():
+            self._apply(key, rec)
+        self._evict()
+
+    def _read_journal(self):
+        """Neue Journal-Zeilen ab der letzten Position übernehmen."""
+        try:
+            with open(self.journal) as f:
+                f.seek(self._journal_pos)
+                while True:
+                    line = f.readline()
+                    if not line.endswith('\n'):
+                        break   # unvollständige Zeile: beim nächsten Mal
+                    self._journal_pos = f.tell()
+                    try:
+                        key, ts, ttl, value = json.loads(line)
+                    except ValueError:
+                        continue
+                    self._apply(key, [ts, ttl, value])
+        except OSError:
+            pass
+
+    def _refresh(self):
+        """Änderungen anderer Prozesse übernehmen (billig, wenn nichts neu ist)."""
+        if _stamp(self.path) != self._snap_stamp:
+            self._load()
+            return
+        try:
+            size = os.path.getsize(self.journal)
+        except OSError:
+            size = 0
+        if size < self._journal_pos:
+            self._load()         # Journal wurde kompaktiert
+        elif size > self._journal_pos:
+            self._read_journal()
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    # ── Zugriff ─────────────────────────────────────────────
+
+    def _lookup(self, key):
+        rec = self._entries.get(key)
+        if rec is None:
+            return None
+        if time.time() - rec[0] > rec[1]:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return rec
+
+    def get(self, key, default=MISS):
+        with self._lock:
+            rec = self._lookup(key)
+            if rec is None:
+                self._refresh()
+                rec = self._lookup(key)
+            if rec is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return rec[2]
+
+    def __contains__(self, key):
+        return self.get(key) is not MISS
+
+    def __len__(self):
+        return len(self._entries)
+
+    def put(self, key, value, ttl=None):
+        rec = [time.time(), self.default_ttl if ttl is None else ttl, value]
+        with self._lock:
+            self._entries[key] = rec
+            self._entries.move_to_end(key)
+            self._pending[key] = rec
+            self._evict()
+            if len(self._pending) >= self.flush_every:
+                self.flush()
+
+    # ── Persistenz ──────────────────────────────────────────
+
+    def flush(self):
+        """Ausstehende Einträge als Journal-Records anhängen (unter Lock)."""
+        if not self._pending:
+            return
+        try:
+            with self._lock, file_lock(self.path):
+                self._refresh()
+                with open(self.journal, 'a') as f:
+                    for key, rec in self._pending.items():
+                        f.write(json.dumps([key] + rec, separators=(',', ':')) + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+                    self._journal_pos = f.tell()
+                self._pending.clear()
+                if self._journal_pos > self.journal_max:
+                    self._compact_locked()
+        except OSError as e:
+            log.warning(f'Cache {self.path} nicht gespeichert: {e}')
+
+    def compact(self):
+        """Snapshot + Journal zusammenführen (unter Lock)."""
+        self.flush()
+        with self._lock, file_lock(self.path):
+            self._compact_locked()
+
+    def _compact_locked(self):
+        self._load()
+        now = time.time()
+        entries = {k: rec for k, rec in self._entries.items()
+                   if now - rec[0] <= rec[1]}
+        atomic_write_json(self.path, {'version': _VERSION, 'entries': entries})
+        open(self.journal, 'w').close()
+        self._snap_stamp = _stamp(self.path)
+        self._journal_pos = 0
+        log.info(f'Cache {os.path.basename(self.path)} kompaktiert: {len(entries)} Einträge')
+
+
+# ============================================================
+# MAIN (Statistik / Kompaktierung)
+# ============================================================
+if __name__ == '__main__':
+    import sys
+
+    logging.basicConfig(level=logging.INFO,
+                        format='[%(asctime)s] %(levelname)s %(message)s')
+    if len(sys.argv) < 2:
+        print(f'Usage: {sys.argv[0]} <cache.json> [--compact]')
+        sys.exit(1)
+    cache = PersistentCache(sys.argv[1])
+    now = time.time()
+    negative = sum(1 for rec in cache._entries.values() if rec[2] is None)
+    expired = sum(1 for rec in cache._entries.values() if now - rec[0] > rec[1])
+    print(f'{len(cache)} Einträge ({negative} negativ, {expired} abgelaufen)')
+    if '--compact' in sys.argv:
+        cache.compact()
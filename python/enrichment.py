@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+enrichment.py - Parallele Netz-Anreicherung vor dem Rendern eines Reports
+Statt InternetDB/Fingerbank/CVEDB/WiGLE inline beim Schreiben (ein Gerät
+nach dem anderen) werden alle Lookups vorab gesammelt (add), dedupliziert
+und über einen begrenzten Thread-Pool ausgeführt (run):
+
+  - max_workers Threads insgesamt
+  - je Provider höchstens limits[provider] gleichzeitig (API-Schonung)
+  - Gesamt-Deadline: danach wird nichts mehr gestartet, run() kehrt zurück;
+    der Report rendert mit dem, was da ist - der Rest gilt als ausstehend
+    (pending). Laufende Requests enden im Hintergrund (Daemon-Threads).
+
+Die Provider-Funktionen (shodan_lookup, wigle_lookup) cachen selbst;
+Ergebnisse, die nach der Deadline eintreffen, landen so für den nächsten
+Lauf im Cache.
+"""
+import time
+import queue
+import logging
+import threading
+from collections import deque
+
+log = logging.getLogger('CYT-Enrich')
+
+DEADLINE_S  = 45    # bis der Report spätestens gerendert wird
+MAX_WORKERS = 4
+
+# Gleichzeitige Anfragen je Provider
+DEFAULT_LIMITS = {
+    'internetdb': 2,
+    'shodan':     1,
+    'cvedb':      2,
+    'fingerbank': 2,
+    'wigle':      1,    # WiGLE-Client/Token-Bucket ist nicht thread-sicher
+}
+
+
+class EnrichmentStage:
+    """
+    stage.add(provider, key, fn, *args, **kwargs)   Lookup vormerken
+    stage.run()                                     bis Deadline ausführen
+    stage.result(provider, key, default)            Ergebnis (oder default)
+    stage.pending(provider, key)                    nicht rechtzeitig fertig?
+    stage.failed(provider, key)                     mit Exception abgebrochen?
+    """
+
+    def __init__(self, deadline_s=DEADLINE_S, max_workers=MAX_WORKERS, limits=None):
+        self.deadline_s = deadline_s
+        self.max_workers = max_workers
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self._jobs = {}                 # (provider, key) → (fn, args, kwargs)
+        self._queues = {}               # provider → deque of keys
+        self._results = {}
+        self._failed = set()
+        self._done = queue.Queue()
+
+    def add(self, provider, key, fn, *args, **kwargs):
+        """Lookup vormerken; gleicher (provider, key) wird nur einmal ausgeführt."""
+        job = (provider, key)
+        if job not in self._jobs:
+            self._jobs[job] = (fn, args, kwargs)
+            self._queues.setdefault(provider, deque()).append(job)
+        return job
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def _worker(self, job):
+        fn, args, kwargs = self._jobs[job]
+        try:
+            result, ok = fn(*args, **kwargs), True
+        except Exception as e:
+            log.warning(f'Enrichment {job[0]} {job[1]} fehlgeschlagen: '
+                        f'{type(e).__name__}: {e}')
+            result, ok = None, False
+        self._done.put((job, result, ok))
+
+    def _next_job(self, running):
+        """Nächster Job des ersten Providers mit freiem Limit."""
+        for provider, q in self._queues.items():
+            if q and running.get(provider, 0) < self.limits.get(provider, 1):
+                return q.popleft()
+        return None
+
+    def run(self):
+        """Alle Jobs bis zur Deadline ausführen. Returns: {fertig, ausstehend, fehler}."""
+        start = time.monotonic()
+        deadline = start + self.deadline_s
+        running = {}
+        active = 0
+        while True:
+            # Freie Worker mit Jobs füllen (Provider-Limits beachten)
+            while active < self.max_workers and time.monotonic() < deadline:
+                job = self._next_job(running)
+                if job is None:
+                    break
+                running[job[0]] = running.get(job[0], 0) + 1
+                active += 1
+                threading.Thread(target=self._worker, args=(job,), daemon=True,
+                                 name=f'enrich-{job[0]}').start()
+            if active == 0:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                job, result, ok = self._done.get(timeout=remaining)
+            except queue.Empty:
+                break
+            running[job[0]] -= 1
+            active -= 1
+            self._finish(job, result, ok)
+
+        # Nach der Deadline eingetroffene Ergebnisse noch mitnehmen
+        while True:
+            try:
+                job, result, ok = self._done.get_nowait()
+            except queue.Empty:
+                break
+            self._finish(job, result, ok)
+        stats = {'done': len(self._results),
+                 'pending': len(self._jobs) - len(self._results),
+                 'errors': len(self._failed)}
+        if self._jobs:
+            log.info(f'Enrichment: {stats["done"]}/{len(self._jobs)} Lookups in '
+                     f'{time.monotonic() - start:.1f}s'
+                     + (f', {stats["pending"]} ausstehend (Deadline {self.deadline_s}s)'
+                        if stats['pending'] else '')
+                     + (f', {stats["errors"]} fehlgeschlagen' if stats['errors'] else ''))
+        return stats
+
+    def _finish(self, job, result, ok):
+        self._results[job] = result
+        if not ok:
+            self._failed.add(job)
+
+    def result(self, provider, key, default=None):
+        return self._results.get((provider, key), default)
+
+    def pending(self, provider, key):
+        """True wenn vorgemerkt, aber bis zur Deadline nicht fertig geworden."""
+        job = (provider, key)
+        return job in self._jobs and job not in self._results
+
+    def failed(self, provider, key):
+        """True wenn der Lookup mit einer Exception abgebrochen ist (nicht Zeitlimit)."""
+        return (provider, key) in self._failed
+
+
+# ============================================================
+# MAIN (Test: langsamer Provider blockiert den Report nicht)
+# ============================================================
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO,
+                        format='[%(asctime)s] %(levelname)s %(message)s')
+
+    def slow(x, delay):
+        time.sleep(delay)
+        return x * 2
+
+    stage = EnrichmentStage(deadline_s=2.0, max_workers=4,
+                            limits={'fast': 3, 'slow': 1})
+    for i in range(6):
+        stage.add('fast', i, slow, i, 0.3)
+    for i in range(3):
+        stage.add('slow', i, slow, i, 1.5)
+    t0 = time.monotonic()
+    print(stage.run(), f'{time.monotonic() - t0:.1f}s')
+    print('fast:', [stage.result('fast', i) for i in range(6)])
+    print('slow:', [('⏳' if stage.pending('slow', i) else stage.result('slow', i))
+                    for i in range(3)])
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+feed_index.py - Zeitindizierter Leser für Append-Only JSONL-Feeds (raypager)
+rat_history / silent_sms wachsen über Monate; statt bei jedem Start die
+ganze Datei zu dekodieren, liegt neben dem Feed ein dünner Index
+<feed>.idx mit [ts, Byte-Offset]-Paaren (ca. alle STRIDE_BYTES).
+Abfragen springen per bisect + seek direkt zum ersten Eintrag im
+Zeitfenster und lesen nur neuere Zeilen.
+
+Der Index wird inkrementell erweitert (nur neu angehängte Zeilen werden
+einmal geparst). Schrumpft der Feed, ändert sich die Inode oder die erste
+Zeile (Rotation/Neuanlage/Kürzen - auch wenn er danach wieder über die
+alte Größe gewachsen ist), wird er neu aufgebaut. Ohne Schreibrecht
+funktioniert alles weiter - nur ohne Index.
+
+Index-Einträge speichern das Maximum aller Zeitstempel VOR dem Offset.
+Damit bleibt der Sprung korrekt, auch wenn der Feed nicht streng
+zeitlich sortiert ist.
+
+Migration: monolithisches JSON-Array (rat_history.json) → JSONL
+  python3 feed_index.py --migrate rat_history.json rat_history.jsonl
+Wiederholbar: <jsonl>.src merkt sich, bis zu welchem Byte das Array schon
+übernommen ist (plus Hash der Bytes davor). Schreibt raypager das Array
+mit neuen Einträgen am Ende neu, wird nur der Rest ab dort geparst.
+"""
+import os
+import re
+import json
+import hashlib
+import logging
+from bisect import bisect_left
+from collections import Counter
+
+log = logging.getLogger('CYT-Feed')
+
+# Abstand der Index-Einträge im Feed (Bytes)
+STRIDE_BYTES = 64 * 1024
+INDEX_VERSION = 2
+HEAD_BYTES = 4096    # Identität des Feeds: Hash der ersten Zeile (max.)
+_NEG_INF = float('-inf')
+_WS = re.compile(r'[ \t\n\r]*')
+
+
+def _index_path(path):
+    return path + '.idx'
+
+
+def _src_path(jsonl_path):
+    return jsonl_path + '.src'
+
+
+class FeedIndex:
+    """
+    Dünner Zeitindex für einen JSONL-Feed.
+    ts_func(obj) → Epoch-Sekunden; wirft bei unbrauchbaren Einträgen
+    ValueError/KeyError/TypeError (Zeile wird übersprungen).
+    """
+
+    def __init__(self, path, ts_func, stride=STRIDE_BYTES):
+        self.path = path
+        self.idx_path = _index_path(path)
+        self.ts_func = ts_func
+        self.stride = stride
+
+    def _line_ts(self, line):
+        try:
+            return float(self.ts_func(json.loads(line)))
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return None
+
+    def _load(self):
+        try:
+            with open(self.idx_path) as f:
+                idx = json.load(f)
+            if idx.get('version') == INDEX_VERSION:
+                return idx
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def _save(self, idx):
+        tmp = self.idx_path + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(idx, f, separators=(',', ':'))
+            os.replace(tmp, self.idx_path)
+        except OSError as e:
+            log.debug(f'Feed-Index nicht schreibbar ({self.idx_path}): {e}')
+
+    def _head(self):
+        """SHA-1 der ersten (vollständigen) Zeile oder None."""
+        try:
+            with open(self.path, 'rb') as f:
+                line = f.readline(HEAD_BYTES)
+        except OSError:
+            return None
+        return hashlib.sha1(line).hexdigest() if line.endswith(b'\n') else None
+
+    def refresh(self):
+        """Index auf aktuellen Dateistand bringen. Returns: Index-dict oder None."""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        size = st.st_size
+        head = self._head()
+        idx = self._load()
+        if (idx is None or size < idx['size'] or idx.get('ino') != st.st_ino
+                or (idx['size'] and idx.get('head') != head)):
+            idx = {'version': INDEX_VERSION, 'size': 0, 'max_ts': None,
+                   'ino': st.st_ino, 'head': head, 'entries': []}
+        if idx['head'] is None:
+            idx['head'] = head
+        if size == idx['size']:
+            return idx
+
+        entries = idx['entries']
+        max_ts = idx['max_ts']
+        last_entry = entries[-1][1] if entries else None
+        off = idx['size']
+        with open(self.path, 'rb') as f:
+            f.seek(off)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break   # unvollständige Zeile (Writer schreibt gerade)
+                if last_entry is None or off - last_entry >= self.stride:
+                    entries.append([max_ts, off])
+                    last_entry = off
+                ts = self._line_ts(line)
+                if ts is not None and (max_ts is None or ts > max_ts):
+                    max_ts = ts
+                off += len(line)
+        added = off - idx['size']
+        idx['size'] = off
+        idx['max_ts'] = max_ts
+        self._save(idx)
+        log.debug(f'Feed-Index {self.path}: +{added} Bytes, {len(entries)} Einträge')
+        return idx
+
+    def start_offset(self, cutoff_ts):
+        """Byte-Offset ab dem alle Einträge mit ts >= cutoff_ts liegen."""
+        idx = self.refresh()
+        if not idx or not idx['entries']:
+            return 0
+        keys = [_NEG_INF if m is None else m for m, _ in idx['entries']]
+        # Letzter Eintrag, vor dem alle Zeitstempel < cutoff sind
+        i = bisect_left(keys, cutoff_ts) - 1
+        return idx['entries'][i][1] if i >= 0 else 0
+
+    def iter_since(self, cutoff_ts):
+        """Liefert (ts, obj) für alle Einträge mit ts >= cutoff_ts (Dateireihenfolge)."""
+        start = self.start_offset(cutoff_ts)
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(start)
+                for line in f:
+                    try:
+                        obj = json.loads(line)
+                        ts = float(self.ts_func(obj))
+                    except (ValueError, KeyError, TypeError, AttributeError):
+                        continue
+                    if ts >= cutoff_ts:
+                        yield ts, obj
+        except OSError:
+            return
+
+
+def read_since(path, ts_func, cutoff_ts):
+    """Kurzform: alle (ts, obj) aus path mit ts >= cutoff_ts."""
+    return FeedIndex(path, ts_func).iter_since(cutoff_ts)
+
+
+def _dumps(entry):
+    return json.dumps(entry, separators=(',', ':'))
+
+
+def _sha1(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def _array_items(text, first=True):
+    """
+    Elemente eines JSON-Arrays. first=True: text beginnt vor '[', sonst
+    direkt hinter einem Element. Returns: [(obj, end_pos)].
+    Ohne schließendes ']' → JSONDecodeError (Writer schreibt gerade).
+    """
+    dec = json.JSONDecoder()
+    items = []
+    expect = '[' if first else ','
+    pos = 0
+    while True:
+        pos = _WS.match(text, pos).end()
+        c = text[pos:pos + 1]
+        if c == ']' and expect == ',':
+            return items
+        if c != expect:
+            raise json.JSONDecodeError(f"'{expect}' erwartet", text, pos)
+        pos = _WS.match(text, pos + 1).end()
+        if expect == '[' and text[pos:pos + 1] == ']':
+            return items
+        expect = ','
+        obj, pos = dec.raw_decode(text, pos)
+        items.append((obj, pos))
+
+
+def _src_state(json_path, jsonl_path):
+    """Gespeicherter Übernahme-Stand, falls er noch zu JSON und JSONL passt."""
+    try:
+        with open(_src_path(jsonl_path)) as f:
+            state = json.load(f)
+        if state['jsonl_ino'] != os.stat(jsonl_path).st_ino:
+            return None
+        off = state['offset']
+        with open(json_path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            if st.st_size == state['size'] and st.st_mtime == state['mtime']:
+                return state
+            if st.st_size < off:
+                return None
+            head = f.read(min(off, HEAD_BYTES))
+            f.seek(max(0, off - HEAD_BYTES))
+            last = f.read(off - f.tell())
+        if _sha1(head) == state['head'] and _sha1(last) == state['last']:
+            return state
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def _dedup_against_feed(entries, jsonl_path, ts_key):
+    """
+    Ohne Übernahme-Stand: ts < max_ts des Feeds gilt als übernommen; bei
+    ts == max_ts wird über den Inhalt abgeglichen (mehrere Einträge pro
+    Sekunde), neuere Einträge sind neu.
+    """
+    idx = FeedIndex(jsonl_path, lambda e: e[ts_key]).refresh()
+    last_ts = idx['max_ts'] if idx else None
+    if last_ts is None:
+        return entries
+    seen = Counter(_dumps(e) for _, e in
+                   read_since(jsonl_path, lambda e: e[ts_key], last_ts))
+    keep = []
+    for entry in entries:
+        if entry[ts_key] < last_ts:
+            continue
+        key = _dumps(entry)
+        if entry[ts_key] == last_ts and seen[key]:
+            seen[key] -= 1
+            continue
+        keep.append(entry)
+    return keep
+
+
+def json_array_tail(json_path, jsonl_path, ts_key='ts'):
+    """
+    Noch nicht übernommene Einträge des JSON-Arrays, ohne zu schreiben.
+    Mit gültigem <jsonl>.src wird nur der Teil hinter dem gemerkten Offset
+    geparst, sonst das ganze Array (_dedup_against_feed).
+    Returns: (Einträge, neuer Stand für <jsonl>.src ohne jsonl_ino)
+    """
+    state = _src_state(json_path, jsonl_path)
+    off = state['offset'] if state else 0
+    with open(json_path, 'rb') as f:
+        st = os.fstat(f.fileno())
+        if state and st.st_size == state['size'] and st.st_mtime == state['mtime']:
+            return [], state
+        f.seek(off)
+        text = f.read().decode('utf-8')
+        items = _array_items(text, first=not off)
+        end = off + len(text[:items[-1][1]].encode('utf-8')) if items else off
+        f.seek(0)
+        head = f.read(min(end, HEAD_BYTES))
+        f.seek(max(0, end - HEAD_BYTES))
+        last = f.read(end - f.tell())
+    new = [obj for obj, _ in items
+           if isinstance(obj, dict) and obj.get(ts_key) is not None]
+    if not state and os.path.exists(jsonl_path):
+        new = _dedup_against_feed(new, jsonl_path, ts_key)
+    return new, {'offset': end, 'head': _sha1(head), 'last': _sha1(last),
+                 'size': st.st_size, 'mtime': st.st_mtime}
+
+
+def migrate_json_array(json_path, jsonl_path, ts_key='ts'):
+    """
+    Hängt Einträge eines JSON-Arrays an einen JSONL-Feed an.
+    Wiederholbar: nur noch nicht übernommene Einträge (json_array_tail),
+    der Stand landet in <jsonl>.src. Returns: Anzahl übernommener Einträge.
+    """
+    new, state = json_array_tail(json_path, jsonl_path, ts_key)
+    if not new and 'jsonl_ino' in state:
+        return 0    # Array unverändert
+    with open(jsonl_path, 'a') as f:
+        for entry in new:
+            f.write(_dumps(entry) + '\n')
+    state['jsonl_ino'] = os.stat(jsonl_path).st_ino
+    tmp = _src_path(jsonl_path) + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp, _src_path(jsonl_path))
+    if new:
+        log.info(f'Migration {json_path} → {jsonl_path}: {len(new)} Einträge')
+    return len(new)
+
+
+# ============================================================
+# MAIN
+# ============================================================
+if __name__ == '__main__':
+    import argparse
+    import time
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    parser = argparse.ArgumentParser(description='JSONL-Feed Index / Migration')
+    parser.add_argument('--migrate', nargs=2, metavar=('JSON', 'JSONL'),
+                        help='JSON-Array nach JSONL übernehmen (inkrementell)')
+    parser.add_argument('--ts-key', default='ts',
+                        help='Feld mit Epoch-Zeitstempel (Default: ts)')
+    parser.add_argument('--feed', help='JSONL-Feed indizieren und Statistik ausgeben')
+    parser.add_argument('--hours', type=float, default=24)
+    args = parser.parse_args()
+
+    if args.migrate:
+        migrate_json_array(args.migrate[0], args.migrate[1], args.ts_key)
+    if args.feed:
+        fi = FeedIndex(args.feed, lambda e: e[args.ts_key])
+        t0 = time.time()
+        idx = fi.refresh()
+        cutoff = time.time() - args.hours * 3600
+        n = sum(1 for _ in fi.iter_since(cutoff))
+        print(f'{args.feed}: {idx["size"] if idx else 0} Bytes, '
+              f'{len(idx["entries"]) if idx else 0} Index-Einträge, '
+              f'{n} Einträge in {args.hours:.0f}h ({time.time() - t0:.3f}s)')
@@ -0,0 +1,524 @@
+#!/usr/bin/env python3
+"""
+geo.py - Gemeinsame Geo-Funktionen (Distanz, Raster-Clustering, Trajektorien)
+Räumliches Clustering über ein Raster mit Zellgröße = Distanzschwelle:
+jeder Punkt wird nur mit Punkten aus Nachbarzellen verglichen (nahezu
+linear statt O(n²)), mit billigem equirektangulärem Vorfilter vor der
+exakten Haversine-Distanz.
+Batch-APIs (ein Punkt gegen viele, Punkte gegen Zonen) mit vorberechneten
+Radiant/cos(lat)-Werten für feste Zonenlisten. Ist numpy vorhanden
+(Analyse-Rechner), wird vektorisiert gerechnet - auf dem Pager reines Python.
+ZoneIndex: Zonen aus config.json + Watch-List einmal pro Lauf in ein
+Raster kompiliert - "welche Zonen enthalten den Punkt" prüft nur die
+Zonen der eigenen Zelle exakt, auch für ganze Gerätelisten.
+Kompakte Trajektorien pro Gerät: ein Punkt pro Ort statt pro Frame,
+daraus "an N verschiedenen Orten gesehen" innerhalb eines Scans.
+"""
+import math
+import logging
+from collections import defaultdict
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+log = logging.getLogger('CYT-GEO')
+
+EARTH_RADIUS_M = 6371000
+M_PER_DEG = EARTH_RADIUS_M * math.pi / 180   # ~111,2 km pro Breitengrad
+
+# Neuer Trajektorienpunkt erst ab dieser Bewegung (Meter)
+TRAJ_MIN_MOVE_M = 100
+# Radius für "verschiedene Orte" (wie cross_report --min-distance)
+PLACE_RADIUS_M = 200
+# Standortverlauf (SuspectsDB / WatchList): Zusammenfassungsradius + Obergrenze
+VISIT_MERGE_M = 100
+MAX_VISITS = 200
+# Ab so vielen Punkten lohnt sich numpy (Konvertierungs-Overhead)
+NUMPY_MIN_POINTS = 64
+# Rasterzelle des Zonenindex; Nächste-Zone-Suche ab ZONE_SCAN_M linear
+ZONE_CELL_M = 1000
+ZONE_SCAN_M = 64000
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Abstand in Metern zwischen zwei GPS-Koordinaten"""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = math.radians(lat2 - lat1)
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return EARTH_RADIUS_M * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def _hav_rad(p1, l1, cos1, p2, l2, cos2):
+    """Haversine auf vorberechneten Radiant-/cos-Werten (Meter)."""
+    a = math.sin((p2 - p1) / 2) ** 2 + cos1 * cos2 * math.sin((l2 - l1) / 2) ** 2
+    return EARTH_RADIUS_M * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def _np_distances(lat, lon, lat_rad, lon_rad, cos_lat):
+    """numpy-Pfad: Distanzen von (lat, lon) zu Arrays in Radiant."""
+    p1, l1 = math.radians(lat), math.radians(lon)
+    a = (np.sin((lat_rad - p1) / 2) ** 2
+         + math.cos(p1) * cos_lat * np.sin((lon_rad - l1) / 2) ** 2)
+    return EARTH_RADIUS_M * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def distances_from(lat, lon, points):
+    """
+    Distanzen (Meter) von (lat, lon) zu vielen Punkten [(lat, lon), ...].
+    Returns: Liste in Eingabereihenfolge.
+    """
+    points = list(points)
+    if np is not None and len(points) >= NUMPY_MIN_POINTS:
+        arr = np.radians(np.asarray(points, dtype=float))
+        return _np_distances(lat, lon, arr[:, 0], arr[:, 1],
+                             np.cos(arr[:, 0])).tolist()
+    p1, l1 = math.radians(lat), math.radians(lon)
+    cos1 = math.cos(p1)
+    out = []
+    for lat2, lon2 in points:
+        p2 = math.radians(lat2)
+        out.append(_hav_rad(p1, l1, cos1, p2, math.radians(lon2), math.cos(p2)))
+    return out
+
+
+class ZoneSet:
+    """
+    Feste Zonenliste (dicts mit lat, lon, radius_m, name) mit vorberechneten
+    Radiant- und cos(lat)-Werten. Zonen mit 0/0 oder ohne Koordinaten werden
+    ignoriert.
+    """
+
+    def __init__(self, zones, default_radius_m=100):
+        self.zones = [z for z in zones
+                      if z.get('lat') is not None and z.get('lon') is not None
+                      and not (z['lat'] == 0 and z['lon'] == 0)]
+        self.radii = [z.get('radius_m', default_radius_m) for z in self.zones]
+        self._lat = [math.radians(z['lat']) for z in self.zones]
+        self._lon = [math.radians(z['lon']) for z in self.zones]
+        self._cos = [math.cos(p) for p in self._lat]
+        self._np = None
+        if np is not None and len(self.zones) >= NUMPY_MIN_POINTS:
+            self._np = (np.array(self._lat), np.array(self._lon),
+                        np.array(self._cos), np.array(self.radii, dtype=float))
+
+    def __len__(self):
+        return len(self.zones)
+
+    def __bool__(self):
+        return bool(self.zones)
+
+    def distances(self, lat, lon):
+        """Distanz (Meter) von (lat, lon) zu jeder Zone (Zonen-Reihenfolge)."""
+        if self._np is not None:
+            lat_r, lon_r, cos_r, _ = self._np
+            return _np_distances(lat, lon, lat_r, lon_r, cos_r).tolist()
+        p1, l1 = math.radians(lat), math.radians(lon)
+        cos1 = math.cos(p1)
+        return [_hav_rad(p1, l1, cos1, p2, l2, c2)
+                for p2, l2, c2 in zip(self._lat, self._lon, self._cos)]
+
+    def containing(self, lat, lon):
+        """Zonen die (lat, lon) enthalten: [(zone, dist_m)], nächste zuerst."""
+        hits = [(z, d) for z, d, r in zip(self.zones, self.distances(lat, lon), self.radii)
+                if d <= r]
+        hits.sort(key=lambda h: h[1])
+        return hits
+
+    def nearest(self, lat, lon):
+        """Nächste Zone unabhängig vom Radius: (zone, dist_m) oder None."""
+        if not self.zones:
+            return None
+        dists = self.distances(lat, lon)
+        i = min(range(len(dists)), key=dists.__getitem__)
+        return self.zones[i], dists[i]
+
+    def locate(self, lat, lon):
+        """
+        Ein Durchlauf für beide Fragen: (in_radius, nearest) als
+        (zone, dist_m) bzw. None - in_radius = nächste enthaltende Zone.
+        """
+        in_radius = None
+        nearest = None
+        for z, d, r in zip(self.zones, self.distances(lat, lon), self.radii):
+            if d <= r and (in_radius is None or d < in_radius[1]):
+                in_radius = (z, d)
+            if nearest is None or d < nearest[1]:
+                nearest = (z, d)
+        return in_radius, nearest
+
+    def points_in_any_zone(self, points):
+        """Für jeden Punkt [(lat, lon), ...]: liegt er in mindestens einer Zone?"""
+        points = list(points)
+        if not self.zones or not points:
+            return [False] * len(points)
+        if np is not None and len(points) * len(self.zones) >= NUMPY_MIN_POINTS:
+            lat_r, lon_r, cos_r, radii = self._np or (
+                np.array(self._lat), np.array(self._lon),
+                np.array(self._cos), np.array(self.radii, dtype=float))
+            pts = np.radians(np.asarray(points, dtype=float))
+            p1 = pts[:, 0:1]
+            l1 = pts[:, 1:2]
+            a = (np.sin((lat_r - p1) / 2) ** 2
+                 + np.cos(p1) * cos_r * np.sin((lon_r - l1) / 2) ** 2)
+            d = EARTH_RADIUS_M * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+            return (d <= radii).any(axis=1).tolist()
+        out = []
+        zones = list(zip(self._lat, self._lon, self._cos, self.radii))
+        for lat, lon in points:
+            p1, l1 = math.radians(lat), math.radians(lon)
+            cos1 = math.cos(p1)
+            out.append(any(_hav_rad(p1, l1, cos1, p2, l2, c2) <= r
+                           for p2, l2, c2, r in zones))
+        return out
+
+
+def _prefilter_ok(lat1, lon1, cos_lat1, lat2, lon2, radius_m):
+    """
+    Equirektangulärer Vorfilter: False wenn der Punkt sicher außerhalb
+    radius_m liegt (5% Toleranz, ohne trigonometrische Funktionen).
+    """
+    dy = (lat2 - lat1) * M_PER_DEG
+    dx = (lon2 - lon1) * M_PER_DEG * cos_lat1
+    lim = radius_m * 1.05 + 1.0
+    return dx * dx + dy * dy <= lim * lim
+
+
+class GridIndex:
+    """
+    Raster-Index mit quadratischen Grad-Zellen (Kantenlänge cell_m in
+    Breitenrichtung). In Längenrichtung schrumpfen die Zellen mit cos(lat),
+    deshalb wird der Suchring in Längenrichtung pro Abfrage breiter.
+    Datumsgrenze (±180°) wird nicht überbrückt.
+    """
+
+    def __init__(self, cell_m):
+        self.cell_m = float(cell_m)
+        self.dlat = self.cell_m / M_PER_DEG
+        self.cells = defaultdict(list)
+
+    def key(self, lat, lon):
+        return (math.floor(lat / self.dlat), math.floor(lon / self.dlat))
+
+    def add(self, lat, lon, item):
+        self.cells[self.key(lat, lon)].append(item)
+
+    def neighbour_keys(self, lat, lon, radius_m):
+        """Alle Zellen, die den Kreis (lat, lon, radius_m) schneiden können."""
+        cy, cx = self.key(lat, lon)
+        ry = math.ceil(radius_m / self.cell_m)
+        # Schmalste Zellbreite im Suchband (polnächste Breite)
+        edge = min(89.9, abs(lat) + ry * self.dlat)
+        rx = math.ceil(ry / math.cos(math.radians(edge)))
+        for y in range(cy - ry, cy + ry + 1):
+            for x in range(cx - rx, cx + rx + 1):
+                yield (y, x)
+
+    def candidates(self, lat, lon, radius_m):
+        """Items aus allen Zellen im Umkreis (ungefiltert)."""
+        cells = self.cells
+        for k in self.neighbour_keys(lat, lon, radius_m):
+            items = cells.get(k)
+            if items:
+                yield from items
+
+
+class LeaderClusterer:
+    """
+    Greedy Leader-Clustering: ein Punkt gehört zum ersten (ältesten) Leader
+    mit Abstand < radius_m, sonst wird er selbst Leader. Gleiches Ergebnis
+    wie die lineare Schleife über alle Leader, aber per Raster-Index.
+    """
+
+    def __init__(self, radius_m):
+        self.radius_m = radius_m
+        self.grid = GridIndex(radius_m)
+        self.leaders = []
+
+    def find(self, lat, lon):
+        """Index des ersten Leaders mit Abstand < radius_m oder None."""
+        r = self.radius_m
+        cos_lat = math.cos(math.radians(lat))
+        best = None
+        for idx in self.grid.candidates(lat, lon, r):
+            if best is not None and idx >= best:
+                continue
+            llat, llon = self.leaders[idx]
+            if (_prefilter_ok(lat, lon, cos_lat, llat, llon, r)
+                    and haversine(lat, lon, llat, llon) < r):
+                best = idx
+        return best
+
+    def add(self, lat, lon):
+        """Ordnet Punkt zu. Returns: (leader_index, neu_angelegt)"""
+        idx = self.find(lat, lon)
+        if idx is not None:
+            return idx, False
+        self.leaders.append((lat, lon))
+        self.grid.add(lat, lon, len(self.leaders) - 1)
+        return len(self.leaders) - 1, True
+
+    def __len__(self):
+        return len(self.leaders)
+
+
+def leader_clusters(coords, radius_m):
+    """Leader-Positionen [(lat, lon)] für coords (Iterable von (lat, lon))."""
+    lc = LeaderClusterer(radius_m)
+    for lat, lon in coords:
+        lc.add(lat, lon)
+    return lc.leaders
+
+
+def radius_clusters(points, radius_m, lat_key='lat', lon_key='lon'):
+    """
+    Radius-Clustering wie surveillance_analyzer (Punkte in Eingabereihenfolge):
+    der erste freie Punkt sammelt alle freien Punkte mit Abstand <= radius_m.
+    points: Liste von dicts. Returns: Liste von Member-Listen (Reihenfolge
+    wie Eingabe).
+    """
+    grid = GridIndex(radius_m)
+    for i, p in enumerate(points):
+        grid.add(p[lat_key], p[lon_key], i)
+
+    used = [False] * len(points)
+    clusters = []
+    for i, p in enumerate(points):
+        if used[i]:
+            continue
+        used[i] = True
+        lat, lon = p[lat_key], p[lon_key]
+        cos_lat = math.cos(math.radians(lat))
+        members = [i]
+        for k in grid.neighbour_keys(lat, lon, radius_m):
+            cell = grid.cells.get(k)
+            if not cell:
+                continue
+            rest = []
+            for j in cell:
+                if used[j]:
+                    continue
+                q = points[j]
+                if (_prefilter_ok(lat, lon, cos_lat, q[lat_key], q[lon_key], radius_m)
+                        and haversine(lat, lon, q[lat_key], q[lon_key]) <= radius_m):
+                    used[j] = True
+                    members.append(j)
+                else:
+                    rest.append(j)
+            # Zelle kompaktieren - vergebene Punkte nie wieder prüfen
+            if rest:
+                grid.cells[k] = rest
+            else:
+                del grid.cells[k]
+        members.sort()
+        clusters.append([points[j] for j in members])
+    return clusters
+
+
+# ── Zonenindex ──────────────────────────────────────────────────────────────
+class ZoneIndex:
+    """
+    Kompilierter Zonenindex: jede Zone steht in allen Rasterzellen, die ihr
+    Radius-Kreis berühren kann. containing() schlägt nur die Zelle des
+    Punkts nach und rechnet dann exakt (Haversine, d <= radius_m).
+    nearest() sucht in wachsenden Ringen um den Punkt, ab ZONE_SCAN_M linear.
+
+    Identische Zonen (name, lat, lon, radius_m) werden einmal gespeichert und
+    merken sich ihre Eigentümer (z.B. Watch-List-MAC, None = ohne).
+    owner=... filtert Abfragen auf die Zonen eines Eigentümers, owner=None
+    fragt alle Zonen ab.
+    Zonen mit 0/0 oder ohne Koordinaten werden ignoriert (wie ZoneSet).
+    """
+
+    def __init__(self, zones=(), default_radius_m=100, cell_m=ZONE_CELL_M):
+        self.default_radius_m = default_radius_m
+        self.grid = GridIndex(cell_m)      # Zellen → Zonen (Radius-Abdeckung)
+        self.centres = GridIndex(cell_m)   # Zellen → Zonen (Mittelpunkt)
+        self.zones = []
+        self.radii = []
+        self.owners = []
+        self._rad = []                     # (lat_rad, lon_rad, cos_lat)
+        self._ids = {}
+        for z in zones:
+            self.add(z)
+
+    def __len__(self):
+        return len(self.zones)
+
+    def __bool__(self):
+        return bool(self.zones)
+
+    def add(self, zone, owner=None):
+        """Zone eintragen. Returns: Zonen-Index oder None (ungültig)."""
+        lat, lon = zone.get('lat'), zone.get('lon')
+        if lat is None or lon is None or (lat == 0 and lon == 0):
+            return None
+        r = zone.get('radius_m', self.default_radius_m)
+        key = (zone.get('name'), lat, lon, r)
+        i = self._ids.get(key)
+        if i is None:
+            i = self._ids[key] = len(self.zones)
+            self.zones.append(zone)
+            self.radii.append(r)
+            self.owners.append(set())
+            p = math.radians(lat)
+            self._rad.append((p, math.radians(lon), math.cos(p)))
+            for k in self.grid.neighbour_keys(lat, lon, r):
+                self.grid.cells[k].append(i)
+            self.centres.add(lat, lon, i)
+        self.owners[i].add(owner)
+        return i
+
+    def _dist(self, i, p1, l1, cos1):
+        p2, l2, c2 = self._rad[i]
+        return _hav_rad(p1, l1, cos1, p2, l2, c2)
+
+    def _owned(self, i, owner):
+        return owner is None or owner in self.owners[i]
+
+    def containing(self, lat, lon, owner=None):
+        """Zonen die (lat, lon) enthalten: [(zone, dist_m)], nächste zuerst."""
+        cand = self.grid.cells.get(self.grid.key(lat, lon))
+        if not cand:
+            return []
+        p1, l1 = math.radians(lat), math.radians(lon)
+        cos1 = math.cos(p1)
+        hits = []
+        for i in cand:
+            if self._owned(i, owner):
+                d = self._dist(i, p1, l1, cos1)
+                if d <= self.radii[i]:
+                    hits.append((self.zones[i], d))
+        hits.sort(key=lambda h: h[1])
+        return hits
+
+    def nearest(self, lat, lon, owner=None):
+        """Nächste Zone unabhängig vom Radius: (zone, dist_m) oder None."""
+        p1, l1 = math.radians(lat), math.radians(lon)
+        cos1 = math.cos(p1)
+        radius = self.centres.cell_m
+        while radius < ZONE_SCAN_M:
+            best = None
+            for i in self.centres.candidates(lat, lon, radius):
+                if self._owned(i, owner):
+                    d = self._dist(i, p1, l1, cos1)
+                    if best is None or d < best[1]:
+                        best = (i, d)
+            # Alle Mittelpunkte im Umkreis radius wurden gesehen → exakt
+            if best is not None and best[1] <= radius:
+                return self.zones[best[0]], best[1]
+            radius *= 2
+        best = None
+        for i in range(len(self.zones)):
+            if self._owned(i, owner):
+                d = self._dist(i, p1, l1, cos1)
+                if best is None or d < best[1]:
+                    best = (i, d)
+        return (self.zones[best[0]], best[1]) if best else None
+
+    def locate(self, lat, lon, owner=None):
+        """(in_radius, nearest) als (zone, dist_m) bzw. None - wie ZoneSet.locate."""
+        hits = self.containing(lat, lon, owner)
+        return (hits[0] if hits else None), self.nearest(lat, lon, owner)
+
+    def containing_many(self, queries):
+        """
+        Batch: queries = Iterable von (key, lat, lon, owner).
+        Returns: {key: [(zone, dist_m), ...]} (auch leere Listen).
+        """
+        return {key: self.containing(lat, lon, owner)
+                for key, lat, lon, owner in queries}
+
+
+# ── Trajektorien ──────────────────────────────────────────────────────────────
+def extend_trajectory(traj, ts, lat, lon, min_move_m=TRAJ_MIN_MOVE_M):
+    """
+    Hängt eine Beobachtung an eine kompakte Trajektorie an (in-place).
+    Punkte: {lat, lon, first_ts, last_ts, count}. Liegt die Beobachtung
+    innerhalb min_move_m vom letzten Punkt, wird nur dieser verlängert.
+    """
+    if traj:
+        last = traj[-1]
+        if haversine(last['lat'], last['lon'], lat, lon) <= min_move_m:
+            last['last_ts'] = max(last['last_ts'], ts)
+            last['first_ts'] = min(last['first_ts'], ts)
+            last['count'] += 1
+            return traj
+    traj.append({'lat': round(lat, 6), 'lon': round(lon, 6),
+                 'first_ts': ts, 'last_ts': ts, 'count': 1})
+    return traj
+
+
+def add_visit(visits, ts, lat, lon, merge_m=VISIT_MERGE_M, max_visits=MAX_VISITS):
+    """
+    Sichtung in einen kompakten Besuchsverlauf eintragen (in-place).
+    Aufeinanderfolgende Sichtungen innerhalb merge_m werden zu einem Besuch
+    {lat, lon, first_ts, last_ts, count, ts} zusammengefasst ('ts' = letzte
+    Sichtung, kompatibel zum alten {ts, lat, lon}-Format). Über max_visits
+    werden die ältesten Besuche verworfen. Returns: aktueller Besuch.
+    """
+    extend_trajectory(visits, ts, lat, lon, merge_m)
+    visits[-1]['ts'] = visits[-1]['last_ts']
+    if max_visits and len(visits) > max_visits:
+        del visits[:len(visits) - max_visits]
+    return visits[-1]
+
+
+def compact_visits(locations, merge_m=VISIT_MERGE_M, max_visits=MAX_VISITS):
+    """Alten Punktverlauf [{ts, lat, lon}] bzw. Besuche in Besuchsliste umwandeln."""
+    visits = []
+    for loc in locations:
+        if loc.get('lat') is None or loc.get('lon') is None:
+            continue
+        if 'count' in loc:
+            # Bereits Besuch - nur bei Nähe zum Vorgänger verschmelzen
+            n = len(visits)
+            add_visit(visits, loc.get('first_ts', loc.get('ts', '')),
+                      loc['lat'], loc['lon'], merge_m, 0)
+            cur = visits[-1]
+            if len(visits) == n:
+                # Verschmolzen - add_visit hat bereits 1 gezählt
+                cur['count'] += loc['count'] - 1
+            else:
+                cur['count'] = loc['count']
+            cur['last_ts'] = max(cur['last_ts'], loc.get('last_ts', cur['last_ts']))
+            cur['ts'] = cur['last_ts']
+        else:
+            add_visit(visits, loc.get('ts', ''), loc['lat'], loc['lon'], merge_m, 0)
+    if max_visits and len(visits) > max_visits:
+        del visits[:len(visits) - max_visits]
+    return visits
+
+
+def merge_trajectories(trajs, min_move_m=TRAJ_MIN_MOVE_M):
+    """Führt Trajektorien mehrerer Scans zeitlich sortiert zusammen."""
+    points = sorted((p for t in trajs if t for p in t),
+                    key=lambda p: p['first_ts'])
+    merged = []
+    for p in points:
+        n = len(merged)
+        extend_trajectory(merged, p['first_ts'], p['lat'], p['lon'], min_move_m)
+        cur = merged[-1]
+        if len(merged) == n:
+            # In bestehenden Punkt eingeflossen - Zähler/Zeit übernehmen
+            cur['count'] += p['count'] - 1
+        else:
+            cur['count'] = p['count']
+        cur['last_ts'] = max(cur['last_ts'], p['last_ts'])
+    return merged
+
+
+def count_places(points, radius_m=PLACE_RADIUS_M):
+    """
+    Anzahl unterschiedlicher Orte (Leader-Clustering mit radius_m).
+    points: Iterable von (lat, lon) oder Trajektorienpunkten (dict).
+    """
+    lc = LeaderClusterer(radius_m)
+    for p in points:
+        if isinstance(p, dict):
+            lc.add(p['lat'], p['lon'])
+        else:
+            lc.add(p[0], p[1])
+    return len(lc)
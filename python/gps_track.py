@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+gps_track.py - Indizierter GPS-Track (gps_track.csv)
+Lädt den Track einmal in sortierte Parallel-Arrays (Zeit/Lat/Lon) und
+beantwortet Nearest-Fix- und Interpolations-Abfragen per bisect
+(O(log n) statt linearem Scan pro Report/Frame).
+Der letzte Fix wird per Seek vom Dateiende gelesen - kein Full-Scan.
+Für zeitlich geordnete Abfragen (Frame-Geotagging) gibt es TrackCursor.
+
+Zeilenformate (beide werden gelesen, Header/Müll wird übersprungen):
+  payload.sh:     20250513_142501,lat,lon,alt
+  bt_scanner.py:  2025-05-13T14:25:01.123456,lat,lon,alt,speed,fix
+
+Zeitstempel sind naive Lokalzeit (wie Report-Dateinamen) und werden
+intern als Epoch-Sekunden (float) gespeichert.
+"""
+import os
+import logging
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+
+log = logging.getLogger('CYT-GPS')
+
+DEFAULT_PATH = '/root/loot/chasing_your_tail/gps_track.csv'
+
+
+def parse_ts(text):
+    """'YYYYmmdd_HHMMSS' oder ISO-8601 → Epoch-Sekunden, None wenn unlesbar."""
+    text = text.strip()
+    try:
+        if len(text) == 15 and text[8] == '_':
+            # Manuell statt strptime (~10x schneller bei 1-Hz-Tracks)
+            return datetime(int(text[0:4]), int(text[4:6]), int(text[6:8]),
+                            int(text[9:11]), int(text[11:13]),
+                            int(text[13:15])).timestamp()
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        return None
+
+
+def _parse_coords(parts):
+    """(lat, lon) aus CSV-Feldern, None bei Fehler oder 0/0 (kein Fix)."""
+    if len(parts) < 3:
+        return None
+    try:
+        lat, lon = float(parts[1]), float(parts[2])
+    except ValueError:
+        return None
+    if lat == 0.0 and lon == 0.0:
+        return None
+    return lat, lon
+
+
+def parse_line(line):
+    """CSV-Zeile → (epoch, lat, lon) oder None."""
+    parts = line.strip().split(',')
+    coords = _parse_coords(parts)
+    if coords is None:
+        return None
+    ts = parse_ts(parts[0])
+    if ts is None:
+        return None
+    return ts, coords[0], coords[1]
+
+
+def to_epoch(ts):
+    """datetime oder Zahl → Epoch-Sekunden (float)."""
+    if isinstance(ts, datetime):
+        return ts.timestamp()
+    return float(ts)
+
+
+class GpsTrack:
+    """
+    GPS-Track als sortierte Parallel-Arrays (array('d'), ~24 Byte/Fix).
+    Ein mehrtägiger 1-Hz-Track (~260k Fixes) belegt so ~6 MB statt
+    ~60 MB als Liste von Tupeln mit datetime-Objekten.
+    """
+
+    __slots__ = ('times', 'lats', 'lons')
+
+    def __init__(self, fixes=()):
+        self.times = array('d')
+        self.lats  = array('d')
+        self.lons  = array('d')
+        in_order = True
+        last = float('-inf')
+        for ts, lat, lon in fixes:
+            if ts < last:
+                in_order = False
+            last = ts
+            self.times.append(ts)
+            self.lats.append(lat)
+            self.lons.append(lon)
+        if not in_order:
+            self._sort()
+
+    def _sort(self):
+        order = sorted(range(len(self.times)), key=self.times.__getitem__)
+        self.times = array('d', (self.times[i] for i in order))
+        self.lats  = array('d', (self.lats[i] for i in order))
+        self.lons  = array('d', (self.lons[i] for i in order))
+
+    @classmethod
+    def load(cls, path):
+        """Lädt gps_track.csv. Leerer Track wenn Datei fehlt/unlesbar."""
+        if not path or not os.path.exists(path):
+            return cls()
+        try:
+            with open(path, errors='ignore') as f:
+                track = cls(fix for fix in map(parse_line, f) if fix)
+        except OSError as e:
+            log.warning(f'GPS-Track Lesefehler: {e}')
+            return cls()
+        log.debug(f'GPS-Track geladen: {len(track)} Fixes ({path})')
+        return track
+
+    def __len__(self):
+        return len(self.times)
+
+    def __bool__(self):
+        return len(self.times) > 0
+
+    def __iter__(self):
+        return zip(self.times, self.lats, self.lons)
+
+    def last(self):
+        """Letzter Fix als (epoch, lat, lon) oder None."""
+        if not self.times:
+            return None
+        return self.times[-1], self.lats[-1], self.lons[-1]
+
+    def _closest(self, i, t, max_delta_sec):
+        """Index des nächsten Fix zu t bei Einfügeposition i, None wenn zu weit."""
+        n = len(self.times)
+        if i <= 0:
+            best = 0
+        elif i >= n:
+            best = n - 1
+        else:
+            best = i if self.times[i] - t < t - self.times[i - 1] else i - 1
+        if abs(self.times[best] - t) > max_delta_sec:
+            return None
+        return best
+
+    def _position(self, i, t, max_gap_sec, max_delta_sec):
+        """Interpolierte Position zu t bei Einfügeposition i (bisect_left)."""
+        n = len(self.times)
+        if i < n and self.times[i] == t:
+            return self.lats[i], self.lons[i]
+        if 0 < i < n:
+            t0, t1 = self.times[i - 1], self.times[i]
+            if t1 - t0 <= max_gap_sec:
+                f = (t - t0) / (t1 - t0)
+                return (self.lats[i - 1] + (self.lats[i] - self.lats[i - 1]) * f,
+                        self.lons[i - 1] + (self.lons[i] - self.lons[i - 1]) * f)
+        best = self._closest(i, t, max_delta_sec)
+        if best is None:
+            return None
+        return self.lats[best], self.lons[best]
+
+    def nearest_index(self, ts, max_delta_sec=900):
+        """Index des zeitlich nächsten Fix (max. max_delta_sec entfernt) oder None."""
+        if not self.times:
+            return None
+        t = to_epoch(ts)
+        return self._closest(bisect_left(self.times, t), t, max_delta_sec)
+
+    def nearest(self, ts, max_delta_sec=900):
+        """Nächster GPS-Fix zu ts als (lat, lon), None wenn > max_delta_sec."""
+        i = self.nearest_index(ts, max_delta_sec)
+        if i is None:
+            return None
+        return self.lats[i], self.lons[i]
+
+    def position_at(self, ts, max_gap_sec=900, max_delta_sec=900):
+        """
+        Interpolierte Position zum Zeitpunkt ts als (lat, lon).
+        Liegt ts zwischen zwei Fixes mit Abstand <= max_gap_sec, wird linear
+        interpoliert; sonst nächster Fix (max. max_delta_sec) oder None.
+        """
+        if not self.times:
+            return None
+        t = to_epoch(ts)
+        return self._position(bisect_left(self.times, t), t,
+                              max_gap_sec, max_delta_sec)
+
+    def cursor(self, max_gap_sec=900, max_delta_sec=900):
+        """TrackCursor für zeitlich geordnete Abfragen (Sort-Merge-Join)."""
+        return TrackCursor(self, max_gap_sec, max_delta_sec)
+
+
+class TrackCursor:
+    """
+    Monotoner Zeiger in einen GpsTrack für zeitlich sortierte Abfragen
+    (PCAP-Frames, BT-Scans). Statt pro Frame zu bisecten läuft der Zeiger
+    mit den Frames vorwärts - Sort-Merge-Join, Gesamtkosten O(Frames + Fixes).
+    Große Sprünge werden per bisect ab der aktuellen Position überbrückt,
+    Rücksprünge in der Zeit (Uhr-Korrektur, mehrere PCAPs) per bisect neu
+    positioniert.
+    """
+
+    __slots__ = ('track', 'i', 'last_t', 'max_gap_sec', 'max_delta_sec')
+
+    # Maximale lineare Schritte bevor auf bisect gewechselt wird
+    _WALK = 8
+
+    def __init__(self, track, max_gap_sec=900, max_delta_sec=900):
+        self.track = track
+        self.i = 0
+        self.last_t = float('-inf')
+        self.max_gap_sec = max_gap_sec
+        self.max_delta_sec = max_delta_sec
+
+    def position_at(self, ts):
+        """Interpolierte Position zu ts als (lat, lon) oder None."""
+        times = self.track.times
+        n = len(times)
+        if not n:
+            return None
+        t = to_epoch(ts)
+        if t < self.last_t:
+            self.i = bisect_left(times, t, 0, self.i)
+        else:
+            i = self.i
+            stop = min(n, i + self._WALK)
+            while i < stop and times[i] < t:
+                i += 1
+            if i == stop and i < n and times[i] < t:
+                i = bisect_left(times, t, i)
+            self.i = i
+        self.last_t = t
+        return self.track._position(self.i, t, self.max_gap_sec,
+                                    self.max_delta_sec)
+
+
+def read_last_fix(path, max_scan_bytes=65536):
+    """
+    Letzter gültiger Fix (lat/lon != 0) per Seek vom Dateiende.
+    Liest blockweise rückwärts (max. max_scan_bytes) statt die ganze Datei.
+    Returns: (epoch oder None, lat, lon) oder None.
+    """
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+            pos = end
+            tail = b''
+            block = 4096
+            while pos > 0 and end - pos < max_scan_bytes:
+                step = min(block, pos)
+                pos -= step
+                f.seek(pos)
+                tail = f.read(step) + tail
+                lines = tail.split(b'\n')
+                # Erste Zeile ist evtl. abgeschnitten - nur bei Dateianfang gültig
+                complete = lines if pos == 0 else lines[1:]
+                for raw in reversed(complete):
+                    parts = raw.decode('utf-8', errors='ignore').strip().split(',')
+                    coords = _parse_coords(parts)
+                    if coords:
+                        return parse_ts(parts[0]), coords[0], coords[1]
+                tail = lines[0] if pos > 0 else b''
+    except OSError as e:
+        log.debug(f'GPS-Track nicht lesbar: {path}: {e}')
+    return None
+
+
+# ============================================================
+# MAIN (Test)
+# ============================================================
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--track', default=DEFAULT_PATH)
+    parser.add_argument('--at', help='Zeitpunkt (YYYYmmdd_HHMMSS oder ISO)')
+    args = parser.parse_args()
+
+    track = GpsTrack.load(args.track)
+    print(f'{len(track)} Fixes, letzter Fix (Seek): {read_last_fix(args.track)}')
+    if args.at:
+        t = parse_ts(args.at)
+        print(f'nearest:     {track.nearest(t)}')
+        print(f'position_at: {track.position_at(t)}')
@@ -12,7 +12,11 @@ from datetime import datetime
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from pcap_engine import read_pcap_beacons
 from mac_ignore import MacIgnoreSet
+from shared_state import atomic_write_json
+from enrichment import EnrichmentStage, DEADLINE_S
+import http_pool
 from oui_lookup import load_oui_db, lookup
+from oui_attrs import CAMERA_OUIS, ATTR_CAMERA, ATTR_IOT_CHIP, attributes, camera_vendor
 from bt_fingerprint import (
     fingerprint_device, risk_emoji, RISK_HIGH, RISK_MEDIUM, CAMERA_OUI_PREFIXES
 )
@@ -58,89 +62,8 @@ CAMERA_SSID_PATTERNS = [
 ]
 
 # Bekannte versteckte SSID-Indikator-Hersteller (BSSID OUI → Kamera)
-CAMERA_WIFI_OUIS = {
-    '9c:b8:b5': 'Hikvision',
-    'ac:cc:8e': 'Hikvision',
-    'c8:02:10': 'Hikvision',
-    'f0:9e:4a': 'Hikvision',
-    'b4:a3:82': 'Hikvision',
-    'd0:75:a7': 'Hikvision',
-    '54:c4:15': 'Hikvision',
-    'a0:e4:cb': 'Dahua',
-    '70:6a:eb': 'Dahua',
-    '7c:c2:c6': 'Reolink',
-    'ec:71:db': 'Wyze',
-    'a8:5b:4f': 'Wyze',
-    '2c:aa:8e': 'Arlo',
-    'e0:9a:d9': 'Arlo',
-    '30:8c:fb': 'Eufy',
-    '64:a2:f9': 'Ring',
-    'b0:09:da': 'Ring',
-    'c4:de:e2': 'Nest/Google',
-    '18:b4:30': 'Nest/Google',
-    # Espressif (häufig in DIY/Billig-IP-Kameras)
-    '68:02:b8': 'Espressif (IoT)',
-    '10:52:1c': 'Espressif (IoT)',
-    'a4:cf:12': 'Espressif (IoT)',
-    '24:0a:c4': 'Espressif (IoT)',
-    'cc:50:e3': 'Espressif (IoT)',
-    '84:f3:eb': 'Espressif (IoT)',
-    'ec:fa:bc': 'Espressif (IoT)',
-    '30:ae:a4': 'Espressif (IoT)',
-    '24:6f:28': 'Espressif (IoT)',
-    'c4:4f:33': 'Espressif (IoT)',
-    '7c:df:a1': 'Espressif (IoT)',
-    'b4:e6:2d': 'Espressif (IoT)',
-    '08:3a:f2': 'Espressif (IoT)',
-    'e8:68:e7': 'Espressif (IoT)',
-    # Realtek IoT
-    '00:00:6c': 'Realtek (IoT)',
-    '00:e0:4c': 'Realtek (IoT)',
-    # D-Link Kameras
-    'd4:2b:4f': 'D-Link Camera',
-    '1c:7e:e5': 'D-Link Camera',
-    # TP-Link Kameras
-    '90:72:40': 'TP-Link Camera',
-    '50:c7:bf': 'TP-Link Camera',
-    '54:af:97': 'TP-Link Camera',
-    # Foscam
-    'b0:be:76': 'Foscam',
-    '00:26:61': 'Foscam',
-    # Amcrest
-    'b4:f1:e8': 'Amcrest',
-    # Hikvision (weitere OUI-Blöcke)
-    '44:19:b6': 'Hikvision',
-    '40:59:c0': 'Hikvision',
-    'bc:ad:28': 'Hikvision',
-    'c0:56:e3': 'Hikvision',
-    # EZVIZ (Hikvision-Marke)
-    'c4:2f:90': 'EZVIZ/Hikvision',
-    '8c:e7:48': 'EZVIZ/Hikvision',
-    # Dahua (weitere OUI-Blöcke)
-    '3c:ef:8c': 'Dahua',
-    'e0:50:8b': 'Dahua',
-    '60:ed:e0': 'Dahua',
-    # IMOU (Dahua-Marke)
-    'f8:36:9b': 'IMOU/Dahua',
-    # Reolink (weitere OUI-Blöcke)
-    'e0:62:90': 'Reolink',
-    # Axis Communications (Profi-IP-Kameras)
-    '00:40:8c': 'Axis Communications',
-    # Tuya IoT (BK7231-Chip — verbreitet in Budget-Kameras und Smart-Geräten)
-    'd8:f1:5b': 'Tuya IoT',
-    'a4:50:46': 'Tuya IoT',
-    '50:02:91': 'Tuya IoT',
-    # Amazon Echo / Alexa (Mikrofon-Geräte — in Hotelzimmern ungewöhnlich)
-    'fc:65:de': 'Amazon Echo',
-    '40:b4:cd': 'Amazon Echo',
-    '74:c2:46': 'Amazon Echo',
-    '68:37:e9': 'Amazon Echo',
-    'f0:81:73': 'Amazon Echo',
-    # Raspberry Pi (DIY-Kamera / Surveillance-Plattform)
-    'b8:27:eb': 'Raspberry Pi',
-    'dc:a6:32': 'Raspberry Pi',
-    'e4:5f:01': 'Raspberry Pi',
-}
+# Gemeinsame Tabelle mit bt_fingerprint, siehe oui_attrs.CAMERA_OUIS
+CAMERA_WIFI_OUIS = CAMERA_OUIS
 
 # ============================================================
 # WIFI BEACON ANALYSE
@@ -183,13 +106,16 @@ def _rssi_to_distance(rssi):
 
 
 def analyze_beacons(beacons, oui_db=None, fingerbank_key=None,
-                    mac_to_dhcp=None):
+                    mac_to_dhcp=None, deadline_s=DEADLINE_S):
     """
     Analysiert Beacon-Frame-Daten auf Kamera-Verdacht.
-    Optional: Fingerbank-Lookup und CVEDB-CVEs.
+    Optional: Fingerbank-Lookup und CVEDB-CVEs - erst nach der (lokalen)
+    Klassifizierung, parallel und bis deadline_s; nicht rechtzeitig
+    beantwortete Lookups werden als ausstehend markiert.
     Returns: list of suspect dicts, sorted by risk descending.
     """
     suspects = []
+    cam_vendors = {}    # bssid → Kamera-Hersteller (für CVEDB)
     mac_to_dhcp = mac_to_dhcp or {}
 
     for bssid, data in beacons.items():
@@ -210,17 +136,18 @@ def analyze_beacons(beacons, oui_db=None, fingerbank_key=None,
                 reasons.append(f'📷 Kamera-SSID: "{ssid}" (Muster: {pattern})')
                 break
 
-        # 2. OUI-Lookup
-        oui = bssid[:8]
-        cam_vendor = CAMERA_WIFI_OUIS.get(oui)
-        if cam_vendor:
+        # 2. OUI-Attribute (ein Lookup: Kamera-Hersteller, IoT-Chip)
+        ieee_vendor = lookup(bssid, oui_db) if oui_db else 'Unbekannt'
+        attrs = attributes(bssid, oui_db, ieee_vendor)
+        cam_vendor = None
+        if attrs & ATTR_CAMERA:
+            cam_vendor = camera_vendor(bssid) or ieee_vendor
             if risk != RISK_HIGH:
                 risk = RISK_MEDIUM
             reasons.append(f'⚠ Kamera-Hersteller OUI: {cam_vendor}')
 
-        # 3. IEEE OUI-Lookup (Espressif / Realtek = IoT-Hinweis)
-        ieee_vendor = lookup(bssid, oui_db) if oui_db else 'Unbekannt'
-        if ieee_vendor and any(v in ieee_vendor for v in ['Espressif', 'Realtek', 'MediaTek']):
+        # 3. IoT-Chip (Espressif / Realtek / MediaTek)
+        if attrs & ATTR_IOT_CHIP:
             if risk != RISK_HIGH:
                 risk = RISK_MEDIUM
             if not cam_vendor:
@@ -232,41 +159,6 @@ def analyze_beacons(beacons, oui_db=None, fingerbank_key=None,
                 risk = 'low'
             reasons.append('⚠ Versteckte SSID (leerer Beacon)')
 
-        # 5. Fingerbank Lookup (wenn Key vorhanden)
-        fb_result = None
-        if _HAS_SHODAN and fingerbank_key and risk != 'none':
-            try:
-                dhcp_fp = mac_to_dhcp.get(bssid.lower())
-                fb_result = fingerbank_lookup(
-                    bssid, fingerbank_key, dhcp_fingerprint=dhcp_fp
-                )
-                if fb_result:
-                    reasons.append(
-                        f'🔍 Fingerbank: {fb_result["device_name"]} '
-                        f'({fb_result["category"]}, Score: {fb_result["score"]})'
-                    )
-                    if fb_result['risk'] == 'high' and risk != RISK_HIGH:
-                        risk = RISK_HIGH
-                    elif fb_result['risk'] == 'medium' and risk == 'low':
-                        risk = RISK_MEDIUM
-            except Exception as e:
-                log.debug(f'Fingerbank-Lookup fehlgeschlagen: {bssid}: {e}')
-
-        # 6. CVEDB Lookup für Kamera-Hersteller
-        cves = []
-        vendor_name = cam_vendor or ''
-        if _HAS_SHODAN and vendor_name and risk != 'none':
-            try:
-                cves = cvedb_for_vendor(vendor_name)
-                if cves:
-                    kev_count = sum(1 for c in cves if c.get('kev'))
-                    reasons.append(
-                        f'🛡 {len(cves)} CVEs bekannt'
-                        + (f' ({kev_count} KEV!)' if kev_count else '')
-                    )
-            except Exception as e:
-                log.debug(f'CVEDB-Lookup fehlgeschlagen: {vendor_name}: {e}')
-
         if risk == 'none':
             continue
 
@@ -281,14 +173,77 @@ def analyze_beacons(beacons, oui_db=None, fingerbank_key=None,
             'reasons':     reasons,
             'vendor':      cam_vendor or ieee_vendor or 'Unbekannt',
             'distance_est': _rssi_to_distance(rssi),
-            'cves':        cves,
-            'fingerbank':  fb_result,
+            'cves':        [],
+            'fingerbank':  None,
         })
 
+        cam_vendors[bssid] = cam_vendor
+
+    if _HAS_SHODAN and suspects:
+        _enrich_suspects(suspects, cam_vendors, fingerbank_key, mac_to_dhcp,
+                         deadline_s)
+
     suspects.sort(key=lambda x: [RISK_HIGH, RISK_MEDIUM, 'low', 'none'].index(x['risk']))
     return suspects
 
 
+def _enrich_suspects(suspects, cam_vendors, fingerbank_key, mac_to_dhcp, deadline_s):
+    """
+    5./6. Fingerbank je BSSID und CVEDB je Kamera-Hersteller über eine
+    gemeinsame Enrichment-Stage (parallel, Deadline). Ergänzt reasons,
+    risk, fingerbank und cves der Verdächtigen in-place.
+    """
+    stage = EnrichmentStage(deadline_s=deadline_s)
+    for s in suspects:
+        if fingerbank_key:
+            stage.add('fingerbank', s['bssid'], fingerbank_lookup, s['bssid'],
+                      fingerbank_key,
+                      dhcp_fingerprint=mac_to_dhcp.get(s['bssid'].lower()))
+        vendor_name = cam_vendors.get(s['bssid'])
+        if vendor_name:
+            # gleicher Hersteller → ein Lookup
+            stage.add('cvedb', vendor_name, cvedb_for_vendor, vendor_name)
+    stage.run()
+
+    for s in suspects:
+        # 5. Fingerbank Lookup (wenn Key vorhanden)
+        if fingerbank_key:
+            fb_result = stage.result('fingerbank', s['bssid'])
+            if stage.pending('fingerbank', s['bssid']):
+                s['reasons'].append('⏳ Fingerbank: ausstehend (Zeitlimit)')
+            elif stage.failed('fingerbank', s['bssid']):
+                s['reasons'].append('⚠ Fingerbank: Abfrage fehlgeschlagen')
+            elif fb_result:
+                s['fingerbank'] = fb_result
+                s['reasons'].append(
+                    f'🔍 Fingerbank: {fb_result["device_name"]} '
+                    f'({fb_result["category"]}, Score: {fb_result["score"]})'
+                )
+                if fb_result['risk'] == 'high':
+                    s['risk'] = RISK_HIGH
+                elif fb_result['risk'] == 'medium' and s['risk'] == 'low':
+                    s['risk'] = RISK_MEDIUM
+
+        # 6. CVEDB Lookup für Kamera-Hersteller
+        vendor_name = cam_vendors.get(s['bssid'])
+        if not vendor_name:
+            continue
+        if stage.pending('cvedb', vendor_name):
+            s['reasons'].append('⏳ CVEs: ausstehend (Zeitlimit)')
+            continue
+        if stage.failed('cvedb', vendor_name):
+            s['reasons'].append('⚠ CVEs: Abfrage fehlgeschlagen')
+            continue
+        cves = stage.result('cvedb', vendor_name) or []
+        if cves:
+            s['cves'] = cves
+            kev_count = sum(1 for c in cves if c.get('kev'))
+            s['reasons'].append(
+                f'🛡 {len(cves)} CVEs bekannt'
+                + (f' ({kev_count} KEV!)' if kev_count else '')
+            )
+
+
 # ============================================================
 # BLE SCAN (Hotel-Modus: länger, kamera-fokussiert)
 # ============================================================
@@ -532,8 +487,9 @@ def main():
     except Exception:
         pass
 
-    # Config laden (Fingerbank-Key)
+    # Config laden (Fingerbank-Key, Enrichment-Deadline)
     fingerbank_key = None
+    enrich_deadline_s = DEADLINE_S
     config_path = os.path.join(
         os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
         'config.json'
@@ -542,6 +498,7 @@ def main():
         with open(config_path) as f:
             cfg = json.load(f)
         fingerbank_key = cfg.get('fingerbank_api_key', '')
+        enrich_deadline_s = cfg.get('enrichment', {}).get('deadline_s', DEADLINE_S)
     except Exception:
         pass
 
@@ -573,9 +530,11 @@ def main():
     wifi_suspects = [s for s in analyze_beacons(
                          beacons, oui_db,
                          fingerbank_key=fingerbank_key,
-                         mac_to_dhcp=mac_to_dhcp)
+                         mac_to_dhcp=mac_to_dhcp,
+                         deadline_s=enrich_deadline_s)
                      if s['bssid'].lower() not in ignore_macs]
     log.info(f'WiFi Verdächtige: {len(wifi_suspects)}')
+    http_pool.log_stats()
 
     # BLE Scan
     ble_all      = {}
@@ -621,9 +580,7 @@ def main():
     # Suspects-Datei exportieren (für standalone camera_activity.py)
     if wifi_suspects:
         suspects_path = os.path.join(args.output_dir, 'suspects.json')
-        os.makedirs(args.output_dir, exist_ok=True)
-        with open(suspects_path, 'w') as f:
-            json.dump(wifi_suspects, f, indent=2)
+        atomic_write_json(suspects_path, wifi_suspects, indent=2)
         print(f'SUSPECTS_FILE:{suspects_path}')
 
     # Report generieren
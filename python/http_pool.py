@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+http_pool.py - Gemeinsame HTTP-Transportschicht für alle Enrichment-Clients
+(WiGLE, InternetDB/CVEDB/Shodan/Fingerbank, ip-api, IEEE-OUI-Download).
+
+urllib.request.urlopen baut je Request eine neue Verbindung auf - über den
+mobilen Uplink kostet das jedes Mal DNS + TCP + TLS-Handshake. Hier:
+
+  - persistente http.client-Verbindungen je (Schema, Host, Port), nach der
+    Antwort zurück in den Pool (Keep-alive); max. MAX_IDLE je Host,
+    ungenutzt länger als IDLE_S → verworfen
+  - vom Server geschlossene Keep-alive-Verbindung → sofort einmal mit
+    frischer Verbindung wiederholen (zählt nicht als Retry)
+  - gemeinsame Retry-Politik: Netzwerkfehler und RETRY_STATUS mit
+    exponentiellem Backoff (Retry-After wird beachtet, max. BACKOFF_MAX)
+  - gemeinsamer Timeout (Verbindungsaufbau und Lesen)
+  - Metriken je Host: Requests, neue/wiederverwendete Verbindungen,
+    Fehler, Latenz (Ø/max)
+
+Thread-sicher (enrichment.py ruft parallel). Redirects (GET) werden bis
+MAX_REDIRECTS verfolgt. Proxy-Variablen (https_proxy) werden - anders als
+bei urllib - nicht ausgewertet.
+
+HTTPPool(mock='http://127.0.0.1:8765') leitet alle Requests (unverschlüsselt)
+an mock_enrichment_server.py um; der echte Host steht im Host-Header. Nur
+explizit (bench_enrichment.py) - der gemeinsame POOL geht immer ins Netz.
+
+  get(url, headers, timeout)      → Response (status, headers, data, json())
+  stream(url, headers, timeout)   → Context-Manager, lesbare Antwort
+  HTTPError                       Status >= 400 nach allen Retries
+"""
+import ssl
+import json
+import time
+import random
+import logging
+import threading
+import http.client
+import urllib.parse
+from contextlib import contextmanager
+
+log = logging.getLogger('CYT-HTTP')
+
+DEFAULT_TIMEOUT = 10
+MAX_IDLE        = 2      # offene Verbindungen je Host im Pool
+IDLE_S          = 30     # danach hat der Server sie meist schon geschlossen
+RETRIES         = 1
+BACKOFF_S       = 0.5
+BACKOFF_MAX     = 4.0
+RETRY_STATUS    = (429, 500, 502, 503, 504)
+MAX_REDIRECTS   = 3
+
+# Fehler einer wiederverwendeten Verbindung, die der Server inzwischen
+# geschlossen hat (Keep-alive-Timeout auf Serverseite)
+_STALE = (http.client.RemoteDisconnected, http.client.BadStatusLine,
+          ConnectionResetError, BrokenPipeError, ConnectionAbortedError)
+
+
+class HTTPError(OSError):
+    """HTTP-Status >= 400 (nach allen Retries)."""
+
+    def __init__(self, code, url, reason='', data=b''):
+        super().__init__(f'HTTP {code} {reason}'.strip() + f': {url}')
+        self.code = code
+        self.url = url
+        self.reason = reason
+        self.data = data
+
+
+class Response:
+    """Vollständig gelesene Antwort."""
+
+    def __init__(self, status, reason, headers, data, url):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.data = data
+        self.url = url
+
+    def json(self):
+        return json.loads(self.data.decode('utf-8'))
+
+
+class _HostStats:
+    __slots__ = ('requests', 'new', 'reused', 'errors', 'retries',
+                 'latency', 'latency_max')
+
+    def __init__(self):
+        self.requests = self.new = self.reused = 0
+        self.errors = self.retries = 0
+        self.latency = self.latency_max = 0.0
+
+
+class HTTPPool:
+    """
+    Verbindungs-Pool mit Retry/Backoff und Latenz-Metriken je Host.
+    Eine Instanz (POOL) wird von allen Clients geteilt.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, retries=RETRIES,
+                 backoff_s=BACKOFF_S, max_idle=MAX_IDLE, idle_s=IDLE_S, mock=None):
+        self.timeout = timeout
+        self.mock = mock
+        self.retries = retries
+        self.backoff_s = backoff_s
+        self.max_idle = max_idle
+        self.idle_s = idle_s
+        self._idle = {}         # (schema, host, port[, mock-host]) → [(conn, zuletzt benutzt)]
+        self._stats = {}        # host → _HostStats
+        self._lock = threading.Lock()
+        self._ssl = None
+
+    # ── Verbindungen ────────────────────────────────────────
+
+    def _context(self):
+        if self._ssl is None:
+            self._ssl = ssl.create_default_context()
+        return self._ssl
+
+    def _acquire(self, origin, timeout):
+        """(conn, wiederverwendet?) - Idle-Verbindung aus dem Pool oder neu."""
+        now = time.monotonic()
+        with self._lock:
+            idle = self._idle.get(origin, [])
+            while idle:
+                conn, last = idle.pop()
+                if now - last < self.idle_s and conn.sock is not None:
+                    conn.timeout = timeout
+                    conn.sock.settimeout(timeout)
+                    return conn, True
+                conn.close()
+        scheme, host, port = origin[:3]
+        if scheme == 'https':
+            conn = http.client.HTTPSConnection(host, port, timeout=timeout,
+                                               context=self._context())
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        return conn, False
+
+    def _release(self, origin, conn, resp):
+        """Verbindung zurück in den Pool, wenn die Antwort vollständig gelesen ist."""
+        if resp is None or resp.will_close or not resp.isclosed() or conn.sock is None:
+            conn.close()
+            return
+        with self._lock:
+            idle = self._idle.setdefault(origin, [])
+            if len(idle) < self.max_idle:
+                idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def close(self):
+        """Alle Idle-Verbindungen schließen."""
+        with self._lock:
+            for idle in self._idle.values():
+                for conn, _ in idle:
+                    conn.close()
+            self._idle.clear()
+
+    # ── Requests ────────────────────────────────────────────
+
+    def _host_stats(self, host):
+        with self._lock:
+            st = self._stats.get(host)
+            if st is None:
+                st = self._stats[host] = _HostStats()
+            return st
+
+    def _split(self, url):
+        """URL → (origin, Pfad, Host-Header); mit Mock: origin = Mock-Server."""
+        u = urllib.parse.urlsplit(url)
+        if u.scheme not in ('http', 'https') or not u.hostname:
+            raise ValueError(f'Ungültige URL: {url}')
+        path = u.path or '/'
+        if u.query:
+            path += '?' + u.query
+        if self.mock:
+            # eigene Verbindungen je echtem Host, wie ohne Mock
+            m = urllib.parse.urlsplit(self.mock)
+            return (m.scheme, m.hostname, m.port or 80, u.netloc), path, u.netloc
+        port = u.port or (443 if u.scheme == 'https' else 80)
+        return (u.scheme, u.hostname, port), path, None
+
+    def _send(self, origin, path, headers, timeout, st):
+        """
+        Ein Request auf einer (möglichst wiederverwendeten) Verbindung.
+        Returns: (conn, resp) - Body noch ungelesen.
+        """
+        for attempt in (0, 1):
+            conn, reused = self._acquire(origin, timeout)
+            try:
+                conn.request('GET', path, headers=headers)
+                resp = conn.getresponse()
+            except _STALE:
+                conn.close()
+                if reused and attempt == 0:
+                    continue    # Server hat Keep-alive beendet: frisch verbinden
+                raise
+            except Exception:
+                conn.close()
+                raise
+            with self._lock:
+                if reused:
+                    st.reused += 1
+                else:
+                    st.new += 1
+            return conn, resp
+
+    def _backoff(self, attempt, resp_headers=None):
+        delay = self.backoff_s * (2 ** attempt)
+        retry_after = resp_headers.get('Retry-After') if resp_headers else None
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        return min(BACKOFF_MAX, delay) * random.uniform(0.8, 1.2)
+
+    @contextmanager
+    def _open(self, url, headers, timeout, retries, retry_status):
+        """Request mit Retries/Redirects; liefert (conn, resp, origin) zum Lesen."""
+        timeout = self.timeout if timeout is None else timeout
+        retries = self.retries if retries is None else retries
+        retry_status = RETRY_STATUS if retry_status is None else retry_status
+        headers = dict(headers or {})
+        headers.setdefault('Accept-Encoding', 'identity')
+        redirects = 0
+        attempt = 0
+        while True:
+            origin, path, host = self._split(url)
+            if host:
+                headers['Host'] = host
+            st = self._host_stats(host or origin[1])
+            t0 = time.monotonic()
+            try:
+                conn, resp = self._send(origin, path, headers, timeout, st)
+            except (OSError, http.client.HTTPException) as e:
+                with self._lock:
+                    st.requests += 1
+                    st.errors += 1
+                if attempt < retries:
+                    attempt += 1
+                    with self._lock:
+                        st.retries += 1
+                    log.debug(f'{origin[1]}: {e} - Retry {attempt}/{retries}')
+                    time.sleep(self._backoff(attempt - 1))
+                    continue
+                raise
+
+            location = resp.getheader('Location')
+            if (resp.status in (301, 302, 303, 307, 308) and location
+                    and redirects < MAX_REDIRECTS):
+                resp.read()
+                self._release(origin, conn, resp)
+                with self._lock:
+                    st.requests += 1
+                url = urllib.parse.urljoin(url, location)
+                redirects += 1
+                continue
+
+            if resp.status >= 400:
+                data = resp.read()
+                self._release(origin, conn, resp)
+                with self._lock:
+                    st.requests += 1
+                    st.errors += 1
+                if resp.status in retry_status and attempt < retries:
+                    attempt += 1
+                    with self._lock:
+                        st.retries += 1
+                    log.debug(f'{origin[1]}: HTTP {resp.status} - Retry {attempt}/{retries}')
+                    time.sleep(self._backoff(attempt - 1, resp.headers))
+                    continue
+                raise HTTPError(resp.status, url, resp.reason, data)
+
+            try:
+                yield conn, resp, origin
+            except BaseException:
+                conn.close()
+                raise
+            finally:
+                elapsed = time.monotonic() - t0
+                with self._lock:
+                    st.requests += 1
+                    st.latency += elapsed
+                    st.latency_max = max(st.latency_max, elapsed)
+            self._release(origin, conn, resp)
+            return
+
+    def get(self, url, headers=None, timeout=None, retries=None, retry_status=None):
+        """GET, Body vollständig gelesen. Raises HTTPError / OSError."""
+        with self._open(url, headers, timeout, retries, retry_status) as (conn, resp, _):
+            data = resp.read()
+        return Response(resp.status, resp.reason, resp.headers, data, url)
+
+    def get_json(self, url, headers=None, timeout=None, retries=None, retry_status=None):
+        return self.get(url, headers, timeout, retries, retry_status).json()
+
+    @contextmanager
+    def stream(self, url, headers=None, timeout=None, retries=None, retry_status=None):
+        """
+        GET als lesbarer Stream (große Downloads, zeilenweise parsen).
+        Die Verbindung geht nur zurück in den Pool, wenn bis zum Ende gelesen wurde.
+        """
+        with self._open(url, headers, timeout, retries, retry_status) as (conn, resp, _):
+            yield resp
+
+    # ── Metriken ────────────────────────────────────────────
+
+    def stats(self):
+        """{host: {requests, new, reused, errors, retries, avg_ms, max_ms}}"""
+        with self._lock:
+            out = {}
+            for host, st in self._stats.items():
+                ok = st.requests - st.errors
+                out[host] = {
+                    'requests': st.requests, 'new': st.new, 'reused': st.reused,
+                    'errors': st.errors, 'retries': st.retries,
+                    'avg_ms': round(st.latency / ok * 1000) if ok > 0 else None,
+                    'max_ms': round(st.latency_max * 1000),
+                }
+            return out
+
+    def log_stats(self, level=logging.INFO):
+        for host, s in sorted(self.stats().items()):
+            log.log(level, f'HTTP {host}: {s["requests"]} Requests, '
+                           f'{s["new"]} neue/{s["reused"]} wiederverwendete Verbindungen, '
+                           f'{s["errors"]} Fehler, Ø {s["avg_ms"]} ms (max {s["max_ms"]} ms)')
+
+
+# Gemeinsamer Pool aller Clients
+POOL = HTTPPool()
+
+
+def get(url, headers=None, timeout=None, retries=None, retry_status=None):
+    return POOL.get(url, headers, timeout, retries, retry_status)
+
+
+def get_json(url, headers=None, timeout=None, retries=None, retry_status=None):
+    return POOL.get_json(url, headers, timeout, retries, retry_status)
+
+
+def stream(url, headers=None, timeout=None, retries=None, retry_status=None):
+    return POOL.stream(url, headers, timeout, retries, retry_status)
+
+
+def log_stats(level=logging.INFO):
+    POOL.log_stats(level)
+
+
+# ============================================================
+# MAIN (Test: mehrere Requests an denselben Host)
+# ============================================================
+if __name__ == '__main__':
+    import sys
+
+    logging.basicConfig(level=logging.DEBUG,
+                        format='[%(asctime)s] %(levelname)s %(message)s')
+    urls = sys.argv[1:] or ['https://internetdb.shodan.io/1.1.1.1'] * 3
+    for url in urls:
+        t0 = time.monotonic()
+        try:
+            r = get(url, headers={'User-Agent': 'ArgusP/1.0'})
+            print(f'{r.status} {len(r.data)} Bytes {(time.monotonic() - t0) * 1000:.0f} ms  {url}')
+        except (OSError, ValueError) as e:
+            print(f'Fehler: {e}')
+    log_stats()
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+mock_enrichment_server.py - Lokaler Ersatz für die Enrichment-Dienste
+(WiGLE, InternetDB, CVEDB, Shodan Host, Fingerbank, ip-api), um Latenz,
+Rate-Limits und Caching offline messen zu können.
+
+Umleitung: http_pool.HTTPPool(mock='http://127.0.0.1:8765') schickt alle
+Requests hierher, der echte Host steht im Host-Header (bench_enrichment.py).
+
+Antworten:
+  - aufgezeichnete Antworten (--fixtures, JSON-Lines {host, path, status, body})
+    für exakt gleichen Host + Pfad inkl. Query
+  - sonst synthetisch, deterministisch aus dem Request abgeleitet
+    (gleiche Anfrage → gleiche Antwort, keine echten Daten)
+  - --record: unbekannte Requests an den echten Dienst weiterreichen und
+    die Antwort an die Fixtures-Datei anhängen (Standard: DEFAULT_FIXTURES;
+    enthält echte Daten - nicht committen, siehe hooks/pre-commit)
+
+Verhalten: --latency-ms/--jitter-ms je Antwort, --error-rate (503),
+--rate-limit (Requests/s je Host, Token-Bucket → 429 mit Retry-After).
+Zähler je Host: Requests, 429, 503, Replays; Verbindungen gesamt (Keep-alive).
+"""
+import os
+import sys
+import json
+import time
+import random
+import signal
+import hashlib
+import logging
+import argparse
+import threading
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+log = logging.getLogger('CYT-Mock')
+
+DEFAULT_PORT = 8765
+DEFAULT_FIXTURES = '/root/loot/chasing_your_tail/enrich_fixtures.jsonl'
+RATE_BURST   = 5
+
+
+def _h(*parts):
+    """Deterministischer Hash (int) aus den Request-Teilen."""
+    return int(hashlib.sha1('|'.join(map(str, parts)).encode()).hexdigest()[:12], 16)
+
+
+def _fake_mac(n):
+    return ':'.join(f'{(n >> (8 * i)) & 0xff:02X}' for i in range(6))
+
+
+# ── Synthetische Antworten je Dienst ─────────────────────────────────────────
+
+def _wigle(path, q):
+    """api.wigle.net /api/v2/{network,bluetooth}/search"""
+    if not path.endswith('/search'):
+        return 404, {'success': False, 'message': 'not found'}
+    per_page = int(q.get('resultsPerPage', 10))
+    if 'latrange1' in q and 'ssid' not in q:
+        # Kachel-/Bbox-Suche: 0..20 Netze gleichmäßig in der Box
+        lat1, lat2 = float(q['latrange1']), float(q['latrange2'])
+        lon1, lon2 = float(q['longrange1']), float(q['longrange2'])
+        seed = _h(q['latrange1'], q['longrange1'])
+        n = min(per_page, seed % 21)
+        results = []
+        for i in range(n):
+            k = _h(seed, i)
+            results.append({
+                'netid':    _fake_mac(k),
+                'ssid':     f'mock-{k % 10000:04d}',
+                'trilat':   lat1 + (lat2 - lat1) * (k % 997) / 997,
+                'trilong':  lon1 + (lon2 - lon1) * (k % 991) / 991,
+                'lasttime': '2025-01-01T00:00:00.000Z',
+            })
+        return 200, {'success': True, 'totalResults': n, 'results': results}
+    key = q.get('netid') or q.get('ssid', '')
+    seed = _h(path, key)
+    if seed % 3 == 0:
+        return 200, {'success': True, 'totalResults': 0, 'results': []}
+    n = min(per_page, 1 + seed % 3)
+    results = [{
+        'netid':     q.get('netid', _fake_mac(_h(seed, i))).replace('%3A', ':'),
+        'ssid':      q.get('ssid', f'mock-{seed % 10000:04d}'),
+        'trilat':    (seed % 180000) / 1000 - 90,
+        'trilong':   (seed % 360000) / 1000 - 180,
+        'country':   'XX', 'region': 'Mock', 'city': f'Mockstadt {seed % 50}',
+        'firsttime': '2024-01-01T00:00:00.000Z',
+        'lasttime':  '2025-01-01T00:00:00.000Z',
+    } for i in range(n)]
+    return 200, {'success': True, 'totalResults': n, 'results': results}
+
+
+def _internetdb(path, q):
+    ip = path.strip('/')
+    seed = _h('idb', ip)
+    if seed % 3 == 0:
+        return 404, {'detail': 'No information available'}
+    return 200, {
+        'ip': ip, 'ports': [p for p in (22, 80, 443, 554, 8080) if _h(seed, p) % 2],
+        'hostnames': [], 'cpes': [], 'tags': ['mock'] if seed % 5 == 0 else [],
+        'vulns': [f'CVE-2024-{seed % 9000 + 1000}'] if seed % 4 == 0 else [],
+    }
+
+
+def _cvedb(path, q):
+    product = q.get('cpe') or q.get('product', '')
+    seed = _h('cve', product, q.get('is_kev', ''))
+    n = 0 if q.get('is_kev') and seed % 2 else min(int(q.get('limit', 5)), seed % 4)
+    return 200, {'cves': [{
+        'cve_id': f'CVE-20{20 + i}-{(seed + i) % 9000 + 1000}',
+        'cvss': round(5 + (seed + i) % 50 / 10, 1),
+        'kev': bool(q.get('is_kev')),
+        'epss': round(((seed >> i) % 1000) / 1000, 3),
+        'propose_action': '',
+    } for i in range(n)]}
+
+
+def _shodan_host(path, q):
+    ip = path.rsplit('/', 1)[-1]
+    seed = _h('host', ip)
+    if seed % 3 == 0:
+        return 404, {'error': 'No information available for that IP.'}
+    return 200, {
+        'org': f'Mock ISP {seed % 20}', 'isp': 'Mock', 'asn': f'AS{seed % 65000}',
+        'ports': [80, 443], 'vulns': [], 'tags': [], 'hostnames': [],
+        'data': [{'product': 'nginx', 'version': '1.0'}],
+    }
+
+
+def _fingerbank(path, q):
+    seed = _h('fb', q.get('mac', ''), q.get('dhcp_fingerprint', ''))
+    if seed % 4 == 0:
+        return 404, {'errors': 'Unknown device'}
+    categories = ['IP Camera', 'IoT Device', 'Smart Home Device', 'Phone']
+    return 200, {'score': 20 + seed % 80, 'device': {
+        'name': f'Mock Device {seed % 100}',
+        'parents': [{'name': categories[seed % len(categories)]}],
+    }}
+
+
+def _ip_api(path, q):
+    return 200, {'status': 'success', 'lat': 0.0, 'lon': 0.0, 'city': 'Mockstadt'}
+
+
+PROVIDERS = {
+    'api.wigle.net':        _wigle,
+    'internetdb.shodan.io': _internetdb,
+    'cvedb.shodan.io':      _cvedb,
+    'api.shodan.io':        _shodan_host,
+    'api.fingerbank.org':   _fingerbank,
+    'ip-api.com':           _ip_api,
+}
+
+
+# ── Server ───────────────────────────────────────────────────────────────────
+
+class _Bucket:
+    """Nicht-blockierender Token-Bucket: take() → 0 oder Sekunden bis frei."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'    # Keep-alive wie bei den echten Diensten
+
+    def log_message(self, fmt, *args):
+        log.debug(fmt % args)
+
+    def setup(self):
+        super().setup()
+        # Host erst mit dem ersten Request bekannt → Verbindungen gesamt ('*')
+        self.server.mock.count('*', 'connections')
+
+    def do_GET(self):
+        mock = self.server.mock
+        host = (self.headers.get('Host') or '').split(':')[0].lower()
+        status, body, extra = mock.respond(host, self.path)
+        data = json.dumps(body).encode() if not isinstance(body, bytes) else body
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for k, v in extra.items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class MockEnrichmentServer:
+    """
+    srv = MockEnrichmentServer(latency_ms=150).start()   → Basis-URL
+    http_pool.POOL = http_pool.HTTPPool(mock=srv.url)
+    srv.stats()  /  srv.stop()
+    """
+
+    def __init__(self, port=0, latency_ms=0, jitter_ms=0, error_rate=0.0,
+                 rate_limit=0.0, fixtures=None, record=False, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.fixtures_path = fixtures
+        self.record = record
+        self._fixtures = {}
+        self._buckets = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._rand = random.Random(seed)
+        if fixtures and os.path.exists(fixtures):
+            self._load_fixtures(fixtures)
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.mock = self
+        self.url = f'http://127.0.0.1:{self._httpd.server_port}'
+
+    def _load_fixtures(self, path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                    self._fixtures[(rec['host'], rec['path'])] = (rec['status'], rec['body'])
+                except (ValueError, KeyError):
+                    continue
+        log.info(f'{len(self._fixtures)} aufgezeichnete Antworten aus {path}')
+
+    def start(self):
+        threading.Thread(target=self._httpd.serve_forever, daemon=True,
+                         name='mock-enrich').start()
+        log.info(f'Mock-Enrichment-Server: {self.url}')
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def count(self, host, what, n=1):
+        with self._lock:
+            c = self._counts.setdefault(host or '*', {})
+            c[what] = c.get(what, 0) + n
+
+    def stats(self):
+        with self._lock:
+            return {h: dict(c) for h, c in self._counts.items()}
+
+    def reset(self):
+        """Zähler und Rate-Limit-Buckets zurücksetzen (neuer Messlauf)."""
+        with self._lock:
+            self._counts.clear()
+            self._buckets.clear()
+
+    def _upstream(self, host, path):
+        """Aufnahme: Request an den echten Dienst, Antwort anhängen."""
+        import http_pool
+        pool = http_pool.HTTPPool(retries=0)
+        try:
+            resp = pool.get(f'https://{host}{path}', headers={'User-Agent': 'ArgusP/1.0'})
+            status, body = resp.status, resp.json()
+        except http_pool.HTTPError as e:
+            status, body = e.code, None
+        except (OSError, ValueError) as e:
+            log.warning(f'Aufnahme {host}{path} fehlgeschlagen: {e}')
+            return 502, {'error': str(e)}
+        with self._lock:
+            self._fixtures[(host, path)] = (status, body)
+            with open(self.fixtures_path, 'a') as f:
+                f.write(json.dumps({'host': host, 'path': path,
+                                    'status': status, 'body': body}) + '\n')
+        return status, body
+
+    def respond(self, host, raw_path):
+        """(status, body, extra_headers) für einen Request."""
+        self.count(host, 'requests')
+        delay = self.latency_ms + self._rand.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        if self.rate_limit:
+            with self._lock:
+                bucket = self._buckets.setdefault(host, _Bucket(self.rate_limit, RATE_BURST))
+                wait = bucket.take()
+            if wait:
+                self.count(host, '429')
+                return 429, {'message': 'rate limited'}, {'Retry-After': str(max(1, round(wait)))}
+        if self.error_rate and self._rand.random() < self.error_rate:
+            self.count(host, '503')
+            return 503, {'message': 'mock error'}, {}
+
+        fixture = self._fixtures.get((host, raw_path))
+        if fixture:
+            self.count(host, 'replayed')
+            return fixture[0], fixture[1], {}
+        if self.record and self.fixtures_path:
+            status, body = self._upstream(host, raw_path)
+            return status, body, {}
+        handler = PROVIDERS.get(host)
+        if handler is None:
+            return 404, {'error': f'unbekannter Host {host}'}, {}
+        u = urllib.parse.urlsplit(raw_path)
+        query = dict(urllib.parse.parse_qsl(u.query))
+        status, body = handler(u.path, query)
+        return status, body, {}
+
+
+# ============================================================
+# MAIN
+# ============================================================
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='Mock-Server für Enrichment-Dienste')
+    p.add_argument('--port', type=int, default=DEFAULT_PORT)
+    p.add_argument('--latency-ms', type=float, default=150)
+    p.add_argument('--jitter-ms', type=float, default=50)
+    p.add_argument('--error-rate', type=float, default=0.0, help='Anteil 503-Antworten (0..1)')
+    p.add_argument('--rate-limit', type=float, default=0.0, help='Requests/s je Host (0 = aus)')
+    p.add_argument('--fixtures', help='aufgezeichnete Antworten (JSON-Lines)')
+    p.add_argument('--record', action='store_true',
+                   help='unbekannte Requests an echte Dienste weiterreichen und aufzeichnen')
+    p.add_argument('--debug', action='store_true')
+    args = p.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO,
+                        format='[%(asctime)s] %(levelname)s %(message)s')
+    if args.record and not args.fixtures:
+        args.fixtures = DEFAULT_FIXTURES
+    srv = MockEnrichmentServer(args.port, args.latency_ms, args.jitter_ms,
+                               args.error_rate, args.rate_limit,
+                               args.fixtures, args.record).start()
+    print(f'Mock-Server: {srv.url}  → http_pool.HTTPPool(mock={srv.url!r})', flush=True)
+    # kill (SIGTERM) wie Ctrl-C: Zähler ausgeben und beenden
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        while True:
+            time.sleep(3600)
+    except (KeyboardInterrupt, SystemExit):
+        for host, c in sorted(srv.stats().items()):
+            print(host, c)
+        srv.stop()
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+oui_attrs.py - Vorberechnete OUI-Attribute (Kamera, IoT-Chip, Tracker, ...)
+Eine gemeinsame Kamera-/IoT-OUI-Tabelle statt getrennter Listen in
+hotel_scan und bt_fingerprint, plus Hersteller-Regeln für die IEEE-Namen
+(Espressif, Realtek, MediaTek, ...). Beim Schreiben des OUI-Index wird
+daraus einmal oui_attrs.bin gebaut (Präfix → Bitfeld); die Analyzer
+klassifizieren eine BSSID/BT-Adresse dann mit einem Dict-Lookup statt
+wiederholter String-Vergleiche pro Gerät.
+"""
+import os
+import struct
+import logging
+
+from shared_state import file_lock, atomic_file
+
+log = logging.getLogger('CYT-OUI')
+
+# Attribut-Bits
+ATTR_CAMERA   = 0x01   # Kamera-Hersteller
+ATTR_IOT_CHIP = 0x02   # IoT-Chip (ESP32/ESP8266, Realtek, MediaTek, Tuya)
+ATTR_TRACKER  = 0x04   # Tracker-Hersteller
+ATTR_AUDIO    = 0x08   # Mikrofon-/Audio-Gerät
+ATTR_RPI      = 0x10   # Raspberry Pi
+
+ATTR_NAMES = {
+    ATTR_CAMERA:   'camera',
+    ATTR_IOT_CHIP: 'iot_chip',
+    ATTR_TRACKER:  'tracker',
+    ATTR_AUDIO:    'audio',
+    ATTR_RPI:      'rpi',
+}
+
+# ============================================================
+# KAMERA-/IOT-HERSTELLER OUI (WiFi BSSID + BT MAC)
+# ============================================================
+CAMERA_OUIS = {
+    '9c:b8:b5': 'Hikvision',
+    'ac:cc:8e': 'Hikvision',
+    'c8:02:10': 'Hikvision',
+    'f0:9e:4a': 'Hikvision',
+    'b4:a3:82': 'Hikvision',
+    'd0:75:a7': 'Hikvision',
+    '54:c4:15': 'Hikvision',
+    'a0:e4:cb': 'Dahua',
+    '70:6a:eb': 'Dahua',
+    '7c:c2:c6': 'Reolink',
+    'ec:71:db': 'Wyze',
+    'a8:5b:4f': 'Wyze',
+    '2c:aa:8e': 'Arlo',
+    'e0:9a:d9': 'Arlo',
+    '30:8c:fb': 'Eufy',
+    '64:a2:f9': 'Ring',
+    'b0:09:da': 'Ring',
+    'c4:de:e2': 'Nest/Google',
+    '18:b4:30': 'Nest/Google',
+    # Espressif (ESP32/ESP8266) - häufig in DIY/Billig-IP-Kameras
+    '68:02:b8': 'Espressif (IoT)',
+    '10:52:1c': 'Espressif (IoT)',
+    'a4:cf:12': 'Espressif (IoT)',
+    '24:0a:c4': 'Espressif (IoT)',
+    'cc:50:e3': 'Espressif (IoT)',
+    '84:f3:eb': 'Espressif (IoT)',
+    'ec:fa:bc': 'Espressif (IoT)',
+    '30:ae:a4': 'Espressif (IoT)',
+    '24:6f:28': 'Espressif (IoT)',
+    'c4:4f:33': 'Espressif (IoT)',
+    '7c:df:a1': 'Espressif (IoT)',
+    'b4:e6:2d': 'Espressif (IoT)',
+    '08:3a:f2': 'Espressif (IoT)',
+    'e8:68:e7': 'Espressif (IoT)',
+    # Realtek IoT
+    '00:00:6c': 'Realtek (IoT)',
+    '00:e0:4c': 'Realtek (IoT)',
+    # D-Link Kameras
+    'd4:2b:4f': 'D-Link Camera',
+    '1c:7e:e5': 'D-Link Camera',
+    # TP-Link Kameras
+    '90:72:40': 'TP-Link Camera',
+    '50:c7:bf': 'TP-Link Camera',
+    '54:af:97': 'TP-Link Camera',
+    # Foscam
+    'b0:be:76': 'Foscam',
+    '00:26:61': 'Foscam',
+    # Amcrest
+    'b4:f1:e8': 'Amcrest',
+    # Hikvision (weitere OUI-Blöcke)
+    '44:19:b6': 'Hikvision',
+    '40:59:c0': 'Hikvision',
+    'bc:ad:28': 'Hikvision',
+    'c0:56:e3': 'Hikvision',
+    # EZVIZ (Hikvision-Marke)
+    'c4:2f:90': 'EZVIZ/Hikvision',
+    '8c:e7:48': 'EZVIZ/Hikvision',
+    # Dahua (weitere OUI-Blöcke)
+    '3c:ef:8c': 'Dahua',
+    'e0:50:8b': 'Dahua',
+    '60:ed:e0': 'Dahua',
+    # IMOU (Dahua-Marke)
+    'f8:36:9b': 'IMOU/Dahua',
+    # Reolink (weitere OUI-Blöcke)
+    'e0:62:90': 'Reolink',
+    # Axis Communications (Profi-IP-Kameras)
+    '00:40:8c': 'Axis Communications',
+    # Tuya IoT (BK7231-Chip — verbreitet in Budget-Kameras und Smart-Geräten)
+    'd8:f1:5b': 'Tuya IoT',
+    'a4:50:46': 'Tuya IoT',
+    '50:02:91': 'Tuya IoT',
+    # Amazon Echo / Alexa (Mikrofon-Geräte — in Hotelzimmern ungewöhnlich)
+    'fc:65:de': 'Amazon Echo',
+    '40:b4:cd': 'Amazon Echo',
+    '74:c2:46': 'Amazon Echo',
+    '68:37:e9': 'Amazon Echo',
+    'f0:81:73': 'Amazon Echo',
+    # Raspberry Pi (DIY-Kamera / Surveillance-Plattform)
+    'b8:27:eb': 'Raspberry Pi',
+    'dc:a6:32': 'Raspberry Pi',
+    'e4:5f:01': 'Raspberry Pi',
+}
+
+# Zusatz-Attribute einzelner Tabellen-Labels (alle Einträge sind ATTR_CAMERA)
+_LABEL_ATTRS = [
+    ('(IoT)',        ATTR_IOT_CHIP),
+    ('Tuya',         ATTR_IOT_CHIP),
+    ('Amazon Echo',  ATTR_AUDIO),
+    ('Raspberry Pi', ATTR_RPI),
+]
+
+# IEEE-Herstellernamen (Teilstring) → Attribute
+VENDOR_RULES = [
+    ('Espressif',               ATTR_IOT_CHIP),
+    ('Realtek',                 ATTR_IOT_CHIP),
+    ('MediaTek',                ATTR_IOT_CHIP),
+    ('Raspberry Pi',            ATTR_RPI),
+    ('Hikvision',               ATTR_CAMERA),
+    ('Zhejiang Dahua',          ATTR_CAMERA),
+    ('Axis Communications',     ATTR_CAMERA),
+    ('Tile, Inc',               ATTR_TRACKER),
+    ('Chipolo',                 ATTR_TRACKER),
+    ('GN Audio',                ATTR_AUDIO),
+    ('Sennheiser',              ATTR_AUDIO),
+    ('Bose Corporation',        ATTR_AUDIO),
+]
+
+ATTR_FILE = 'oui_attrs.bin'
+
+# Binärformat: Magic, Version, Anzahl | Records (Präfix, Bits, Attribute)
+_MAGIC   = b'CYTA'
+_VERSION = 1
+_HEADER  = struct.Struct('>4sHI')
+_RECORD  = struct.Struct('>QBB')
+
+# Präfixlängen, spezifischste zuerst (wie oui_lookup)
+PREFIX_BITS = (36, 28, 24)
+
+
+def _oui_int(oui):
+    return int(oui.replace(':', '').replace('-', ''), 16)
+
+
+def vendor_attrs(vendor):
+    """Attribute aus einem IEEE-Herstellernamen (Regeln)."""
+    attrs = 0
+    if vendor:
+        for needle, bits in VENDOR_RULES:
+            if needle in vendor:
+                attrs |= bits
+    return attrs
+
+
+def _static_table():
+    """{24-Bit-OUI: Attribute} aus CAMERA_OUIS."""
+    table = {}
+    for oui, label in CAMERA_OUIS.items():
+        attrs = ATTR_CAMERA
+        for needle, bits in _LABEL_ATTRS:
+            if needle in label:
+                attrs |= bits
+        table[_oui_int(oui)] = attrs
+    return table
+
+
+_STATIC = _static_table()
+_CAMERA_LABELS = {_oui_int(k): v for k, v in CAMERA_OUIS.items()}
+
+
+def build_attr_table(entries):
+    """
+    entries: Iterable von ((bits, präfix), vendor) - wie oui_lookup.write_index.
+    Returns: {(bits, präfix): Attribute} - nur Präfixe mit Attributen.
+    """
+    table = {(24, k): v for k, v in _STATIC.items()}
+    for (bits, prefix), vendor in entries:
+        attrs = vendor_attrs(vendor)
+        if attrs:
+            table[(bits, prefix)] = table.get((bits, prefix), 0) | attrs
+    return table
+
+
+def write_attr_table(path, table):
+    """Attributtabelle atomisch schreiben (unter Lock)."""
+    with file_lock(path):
+        with atomic_file(path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, len(table)))
+            for (bits, prefix), attrs in sorted(table.items()):
+                f.write(_RECORD.pack(prefix, bits, attrs))
+    _tables.pop(path, None)
+    log.info(f'OUI-Attribute gespeichert: {len(table)} Präfixe ({path})')
+
+
+def load_attr_table(path):
+    """
+    Attributtabelle laden → {bits: {präfix: Attribute}} oder None.
+    Einige hundert Records - ein iter_unpack, kein Parsen von Text.
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, count = _HEADER.unpack_from(data, 0)
+        if magic != _MAGIC or version != _VERSION:
+            return None
+        tiers = {bits: {} for bits in PREFIX_BITS}
+        body = data[_HEADER.size:_HEADER.size + count * _RECORD.size]
+        for prefix, bits, attrs in _RECORD.iter_unpack(body):
+            if bits in tiers:
+                tiers[bits][prefix] = attrs
+        return tiers
+    except (OSError, struct.error):
+        return None
+
+
+_tables = {}
+
+
+def _table_for(db):
+    """Attributtabelle neben dem OUI-Index von db (einmal pro Prozess geladen)."""
+    path = getattr(db, 'path', None)
+    if not path:
+        return None
+    attr_path = os.path.join(os.path.dirname(path), ATTR_FILE)
+    if attr_path not in _tables:
+        _tables[attr_path] = load_attr_table(attr_path)
+    return _tables[attr_path]
+
+
+def attributes(mac, db=None, vendor=None):
+    """
+    Attribut-Bitfeld für eine MAC/BSSID.
+    db:     OuiIndex (oui_lookup) - nutzt die vorberechnete oui_attrs.bin
+    vendor: IEEE-Herstellername, falls ohne Tabelle (Fallback über Regeln)
+    """
+    try:
+        digits = mac.replace(':', '').replace('-', '')[:12]
+        value = int(digits, 16)
+    except (ValueError, AttributeError):
+        return 0
+    have = 4 * len(digits)
+    tiers = _table_for(db)
+    if tiers is not None:
+        for bits in PREFIX_BITS:
+            if bits <= have:
+                attrs = tiers[bits].get(value >> (have - bits))
+                if attrs is not None:
+                    return attrs
+        return 0
+    if have < 24:
+        return 0
+    return _STATIC.get(value >> (have - 24), 0) | vendor_attrs(vendor)
+
+
+def camera_vendor(mac):
+    """Label aus der Kamera-/IoT-Tabelle (z.B. 'Hikvision') oder None."""
+    try:
+        return _CAMERA_LABELS.get(_oui_int(mac[:8]))
+    except (ValueError, TypeError):
+        return None
+
+
+def attr_names(attrs):
+    """Bitfeld → Liste lesbarer Namen."""
+    return [name for bit, name in ATTR_NAMES.items() if attrs & bit]
+
+
+# ============================================================
+# MAIN (Test)
+# ============================================================
+if __name__ == '__main__':
+    import sys
+    for mac in sys.argv[1:] or ['9c:b8:b5:11:22:33', '24:0a:c4:11:22:33',
+                                'b8:27:eb:11:22:33', 'fc:65:de:11:22:33']:
+        a = attributes(mac)
+        print(f'{mac}  0x{a:02x}  {",".join(attr_names(a)) or "-"}  '
+              f'{camera_vendor(mac) or ""}')
@@ -3,48 +3,407 @@
 oui_lookup.py - Offline OUI/MAC Hersteller-Lookup
 Lädt IEEE OUI Liste und cached sie lokal.
 Wird bei Internetverbindung automatisch aktualisiert.
+Cache als sortierte Binärtabelle (oui_index.bin), per mmap + binärer Suche
+gelesen - kein JSON-Parsen beim Start. Alter oui_cache.json wird einmalig
+übernommen.
+Neben MA-L (24 Bit, oui.txt) auch MA-M (28 Bit, mam.txt), MA-S und IAB
+(36 Bit, oui36.txt / iab.txt): je Präfixlänge eine Tabelle, Lookup prüft
+von spezifisch nach allgemein (36 → 28 → 24) - längster Präfix gewinnt.
+Daneben oui_attrs.bin: vorberechnete Attribute je Präfix (oui_attrs.py).
+Update parst die Registries zeilenweise aus dem Stream und sortiert
+extern: Blöcke zu RUN_RECORDS Einträgen gehen sortiert in temp-Dateien
+neben dem Index, ein Merge schreibt Records und Vendor-Blob direkt in die
+neue Indexdatei. Im Speicher liegen höchstens ein Block, eine Zeile je
+Block-Datei und VENDOR_CACHE Vendor-Offsets - unabhängig von der Größe
+der Registries. oui_index.bin wird nur ersetzt, wenn sich der Inhalt
+geändert hat. Offline: --import oui.txt [mam.txt ...].
 """
-import os, re, logging, urllib.request, json
+import os, re, io, sys, gzip, logging, json, mmap, struct, time
+import hashlib, heapq, shutil, tempfile
 from datetime import datetime, timedelta
+from shared_state import file_lock
+import http_pool
+from oui_attrs import ATTR_FILE, build_attr_table, write_attr_table
 
 log = logging.getLogger('CYT-OUI')
 
 OUI_URL       = 'https://standards-oui.ieee.org/oui/oui.txt'
-OUI_CACHE     = '/root/loot/chasing_your_tail/oui_cache.json'
+# Registries: (Name, URL) - MA-L zuerst (Pflicht), Rest optional
+REGISTRIES    = [
+    ('oui',   OUI_URL),
+    ('mam',   'https://standards-oui.ieee.org/oui28/mam.txt'),
+    ('oui36', 'https://standards-oui.ieee.org/oui36/oui36.txt'),
+    ('iab',   'https://standards-oui.ieee.org/iab/iab.txt'),
+]
+OUI_CACHE     = '/root/loot/chasing_your_tail/oui_cache.json'   # Legacy
+OUI_INDEX     = '/root/loot/chasing_your_tail/oui_index.bin'
 UPDATE_DAYS   = 365  # Wöchentlich updaten
 
-def _parse_oui_txt(text):
-    """Parst IEEE oui.txt Format."""
-    db = {}
-    for line in text.split('\n'):
-        m = re.match(r'^([0-9A-F]{2}-[0-9A-F]{2}-[0-9A-F]{2})\s+\(hex\)\s+(.+)$', line.strip())
+# Präfixlängen, spezifischste zuerst
+PREFIX_BITS   = (36, 28, 24)
+
+# Externes Sortieren beim Update: Einträge je sortiertem Block (temp-Datei)
+RUN_RECORDS   = 8192
+# Vendor-Strings, deren Blob-Offset zum Wiederverwenden gemerkt wird
+VENDOR_CACHE  = 4096
+
+# Binärformat v2: Header | Tier-Tabelle | Records je Tier | Vendor-Blob
+# Header: Magic, Version, Anzahl Tiers, Blob-Offset, Stand (Epoch)
+_MAGIC    = b'CYTO'
+_VERSION  = 2
+_HEADER   = struct.Struct('>4sHHId')
+# Tier: Präfix-Bits, reserviert, Anzahl Records, Offset der Records
+_TIER     = struct.Struct('>HHII')
+# Record: Präfix, (Vendor-Offset << 8) | Vendor-Länge
+_RECORD   = struct.Struct('>QI')
+# v1 (nur 24 Bit): Magic, Version, reserviert, Anzahl, Blob-Offset, Stand
+_HEADER_V1 = struct.Struct('>4sHHIId')
+_RECORD_V1 = struct.Struct('>II')
+
+_HEX_RE    = re.compile(r'^([0-9A-F]{2})-([0-9A-F]{2})-([0-9A-F]{2})\s+\(hex\)\s+(.*)$')
+_BASE16_RE = re.compile(r'^([0-9A-F]{6})(?:-([0-9A-F]{6}))?\s+\(base 16\)\s*(.*)$')
+
+def _parse_registry(lines):
+    """
+    Parst IEEE-Registry (oui.txt, mam.txt, oui36.txt, iab.txt) zeilenweise.
+    lines: Iterable von Textzeilen (Datei, HTTP-Stream).
+    Yields: ((bits, präfix), vendor) in Dateireihenfolge.
+    MA-L: "286FB9  (base 16)  Vendor" → 24 Bit
+    MA-M/MA-S/IAB: "(hex)"-Zeile liefert die 24-Bit-Basis, die folgende
+    "400000-4FFFFF (base 16)"-Zeile den Bereich darunter.
+    """
+    base, base_vendor = None, ''
+    for line in lines:
+        line = line.strip()
+        m = _HEX_RE.match(line)
         if m:
-            oui    = m.group(1).replace('-', ':').lower()
-            vendor = m.group(2).strip()
-            db[oui] = vendor
-    return db
+            base = int(m.group(1) + m.group(2) + m.group(3), 16)
+            base_vendor = m.group(4).strip()
+            continue
+        m = _BASE16_RE.match(line)
+        if not m:
+            continue
+        # Gleiche Herstellernamen nur einmal im Speicher
+        vendor = sys.intern(m.group(3).strip() or base_vendor)
+        start = int(m.group(1), 16)
+        if m.group(2) is None:
+            yield (24, start), vendor
+            continue
+        if base is None:
+            continue
+        size = int(m.group(2), 16) - start + 1
+        bits = 48 - (size.bit_length() - 1)
+        if bits == 24:
+            yield (24, base), vendor
+        elif bits in PREFIX_BITS:
+            yield (bits, (base << (bits - 24)) | (start >> (48 - bits))), vendor
+
+class _SortedRuns:
+    """
+    Externes Sortieren für den Index-Neubau. add() sammelt Einträge, je
+    RUN_RECORDS sortiert in eine temp-Datei (Run) unter dirname; merged()
+    liefert alle per heapq.merge in Index-Reihenfolge (Tier wie
+    PREFIX_BITS, dann Präfix). Bei gleichem Präfix gewinnt der zuletzt
+    hinzugefügte Eintrag, underlay()-Einträge verlieren immer.
+    """
+
+    def __init__(self, dirname=None):
+        if dirname and not os.path.isdir(dirname):
+            dirname = None
+        self.dir = tempfile.mkdtemp(prefix='.oui_runs_', dir=dirname)
+        self._buf = []
+        self._runs = []
+        self._seq = 0
+        self._under = 0
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _put(self, key, vendor, seq):
+        bits, prefix = key
+        if bits not in PREFIX_BITS:
+            return
+        self._buf.append((PREFIX_BITS.index(bits), prefix, seq,
+                          vendor.replace('\t', ' ').replace('\n', ' ')))
+        self.count += 1
+        if len(self._buf) >= RUN_RECORDS:
+            self._spill()
+
+    def add(self, key, vendor):
+        self._put(key, vendor, self._seq)
+        self._seq += 1
+
+    def extend(self, items):
+        for key, vendor in items:
+            self.add(key, vendor)
+
+    def underlay(self, items):
+        """Einträge mit niedrigerer Priorität als alle add() (z.B. bestehender Index)."""
+        for key, vendor in items:
+            self._under -= 1
+            self._put(key, vendor, self._under)
+
+    def _spill(self):
+        self._buf.sort()
+        path = os.path.join(self.dir, f'run{len(self._runs)}')
+        with open(path, 'w', encoding='utf-8') as f:
+            for tier, prefix, seq, vendor in self._buf:
+                f.write(f'{tier}\t{prefix:x}\t{seq}\t{vendor}\n')
+        self._runs.append(path)
+        self._buf = []
+
+    @staticmethod
+    def _read(path):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                tier, prefix, seq, vendor = line.rstrip('\n').split('\t', 3)
+                yield int(tier), int(prefix, 16), int(seq), vendor
+
+    def merged(self):
+        """Yields: ((bits, präfix), vendor), sortiert und ohne Duplikate."""
+        self._buf.sort()
+        prev = None
+        for rec in heapq.merge(*(self._read(p) for p in self._runs), self._buf):
+            if prev is not None and rec[:2] != prev[:2]:
+                yield (PREFIX_BITS[prev[0]], prev[1]), prev[3]
+            prev = rec
+        if prev is not None:
+            yield (PREFIX_BITS[prev[0]], prev[1]), prev[3]
+
+class OuiIndex:
+    """
+    Binärer OUI-Index (oui_index.bin), per mmap eingeblendet.
+    Aufbau: Header | Tiers | sortierte Records (Präfix, Vendor-Offset/Länge)
+    | Vendor-Blob. Suche per binärer Suche direkt im mmap - kein Parsen beim
+    Start, Vendor-Strings werden erst bei einem Treffer dekodiert.
+    Pro Lookup höchstens eine binäre Suche je Tier (konstant 3).
+    dict-ähnlich: get(), len().
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = struct.unpack_from('>4sH', self._mm, 0)
+        if magic != _MAGIC or version not in (1, _VERSION):
+            raise ValueError(f'{path}: kein OUI-Index v{_VERSION}')
+        # Tiers: (bits, count, offset, record_struct), spezifischste zuerst
+        if version == 1:
+            _, _, _, count, self._blob, self.updated_ts = \
+                _HEADER_V1.unpack_from(self._mm, 0)
+            self._tiers = [(24, count, _HEADER_V1.size, _RECORD_V1)]
+        else:
+            _, _, n_tiers, self._blob, self.updated_ts = _HEADER.unpack_from(self._mm, 0)
+            self._tiers = []
+            for i in range(n_tiers):
+                bits, _, count, off = _TIER.unpack_from(
+                    self._mm, _HEADER.size + i * _TIER.size)
+                self._tiers.append((bits, count, off, _RECORD))
+        self._count = sum(t[1] for t in self._tiers)
+        self.version = version
+        self.path = path
+        # mtime = letzte Prüfung gegen IEEE (auch ohne geänderten Inhalt)
+        self.checked_ts = os.stat(path).st_mtime
+
+    @property
+    def updated(self):
+        return datetime.fromtimestamp(self.updated_ts).isoformat() if self.updated_ts else ''
+
+    @property
+    def checked(self):
+        return datetime.fromtimestamp(self.checked_ts).isoformat() if self.checked_ts else ''
+
+    def __len__(self):
+        return self._count
+
+    def __bool__(self):
+        return self._count > 0
+
+    def _find(self, tier, key):
+        _, count, base, rec = tier
+        mm, unpack, size = self._mm, rec.unpack_from, rec.size
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            k, ref = unpack(mm, base + mid * size)
+            if k < key:
+                lo = mid + 1
+            elif k > key:
+                hi = mid
+            else:
+                off = self._blob + (ref >> 8)
+                return mm[off:off + (ref & 0xFF)].decode('utf-8', errors='replace')
+        return None
 
-def _load_cache():
-    """Lädt OUI-Cache von Disk."""
-    if os.path.exists(OUI_CACHE):
+    def get(self, mac, default=None):
+        """
+        mac: 'aa:bb:cc' oder volle MAC → Hersteller des längsten passenden
+        Präfixes oder default. Tiers länger als die übergebenen Ziffern
+        werden übersprungen.
+        """
         try:
-            with open(OUI_CACHE) as f:
-                data = json.load(f)
-            return data.get('db', {}), data.get('updated', '')
-        except Exception:
-            pass
-    return {}, ''
-
-def _save_cache(db):
-    """Speichert OUI-Cache auf Disk."""
-    os.makedirs(os.path.dirname(OUI_CACHE), exist_ok=True)
-    with open(OUI_CACHE, 'w') as f:
-        json.dump({
-            'updated': datetime.now().isoformat(),
-            'count':   len(db),
-            'db':      db
-        }, f)
-    log.info(f'OUI-Cache gespeichert: {len(db)} Einträge')
+            digits = mac.replace(':', '').replace('-', '')[:12]
+            value = int(digits, 16)
+        except (ValueError, AttributeError):
+            return default
+        have = 4 * len(digits)
+        for tier in self._tiers:
+            bits = tier[0]
+            if bits <= have and tier[1]:
+                vendor = self._find(tier, value >> (have - bits))
+                if vendor is not None:
+                    return vendor
+        return default
+
+    def __contains__(self, mac):
+        return self.get(mac) is not None
+
+    def items(self):
+        """Alle ((bits, präfix), vendor) - für Neuaufbau abgeleiteter Tabellen."""
+        for tier in self._tiers:
+            bits, count, base, rec = tier
+            for i in range(count):
+                key, ref = rec.unpack_from(self._mm, base + i * rec.size)
+                off = self._blob + (ref >> 8)
+                yield (bits, key), self._mm[off:off + (ref & 0xFF)].decode(
+                    'utf-8', errors='replace')
+
+def _index_digest(path):
+    """SHA-1 über Tier-Tabelle, Records und Blob eines v2-Index (ohne Header)."""
+    digest = hashlib.sha1()
+    try:
+        with open(path, 'rb') as f:
+            magic, version = struct.unpack('>4sH', f.read(6))
+            if magic != _MAGIC or version != _VERSION:
+                return None
+            f.seek(_HEADER.size)
+            for chunk in iter(lambda: f.read(65536), b''):
+                digest.update(chunk)
+    except (OSError, struct.error):
+        return None
+    return digest.digest()
+
+def write_index(path, items, updated_ts=None):
+    """
+    Binären Index schreiben (unter Lock). Aufbau in einer temp-Datei neben
+    path: Records und Vendor-Blob (eigene temp-Datei, danach angehängt)
+    werden aus dem sortierten Merge gestreamt, Header und Tier-Tabelle am
+    Ende vorn eingetragen. Gleiche Vendor-Strings werden im Blob nur einmal
+    abgelegt, solange ihr Offset im VENDOR_CACHE steht.
+    Ersetzt path nur, wenn sich Tier-Tabelle/Records/Blob vom bestehenden
+    Index unterscheiden - sonst wird nur die mtime (= geprüft) erneuert.
+    items: _SortedRuns oder Iterable von ((bits, präfix), vendor).
+    Returns: (Anzahl Einträge, veröffentlicht?)
+    """
+    dirname = os.path.dirname(path) or '.'
+    if not isinstance(items, _SortedRuns):
+        with _SortedRuns(dirname) as runs:
+            runs.extend(items)
+            return write_index(path, runs, updated_ts)
+    if updated_ts is None:
+        updated_ts = time.time()
+
+    counts = dict.fromkeys(PREFIX_BITS, 0)
+    records_at = _HEADER.size + len(PREFIX_BITS) * _TIER.size
+    with file_lock(path):
+        fd, tmp = tempfile.mkstemp(dir=dirname, suffix='.tmp',
+                                   prefix='.' + os.path.basename(path) + '.')
+        try:
+            with os.fdopen(fd, 'w+b') as f, tempfile.TemporaryFile(dir=dirname) as blob:
+                f.seek(records_at)
+                offsets = {}
+                blob_len = 0
+                chunk = bytearray()
+                for (bits, key), vendor in items.merged():
+                    counts[bits] += 1
+                    raw = vendor.encode('utf-8')[:255]
+                    off = offsets.get(raw)
+                    if off is None:
+                        if len(offsets) >= VENDOR_CACHE:
+                            offsets.clear()
+                        off = offsets[raw] = blob_len
+                        blob.write(raw)
+                        blob_len += len(raw)
+                    chunk += _RECORD.pack(key, (off << 8) | len(raw))
+                    if len(chunk) >= 65536:
+                        f.write(chunk)
+                        chunk = bytearray()
+                f.write(chunk)
+                blob_at = f.tell()
+                blob.seek(0)
+                shutil.copyfileobj(blob, f, 65536)
+                # Anzahl je Tier steht erst nach dem Merge fest
+                f.seek(0)
+                f.write(_HEADER.pack(_MAGIC, _VERSION, len(PREFIX_BITS), blob_at, updated_ts))
+                pos = records_at
+                for bits in PREFIX_BITS:
+                    f.write(_TIER.pack(bits, 0, counts[bits], pos))
+                    pos += counts[bits] * _RECORD.size
+                f.flush()
+                os.fsync(f.fileno())
+            changed = _index_digest(tmp) != _index_digest(path)
+            if changed:
+                os.replace(tmp, path)
+                os.utime(path, (updated_ts, updated_ts))
+            else:
+                os.unlink(tmp)
+                os.utime(path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+    total = sum(counts.values())
+    if changed or not os.path.exists(_attr_path(path)):
+        write_attr_table(_attr_path(path), build_attr_table(OuiIndex(path).items()))
+    if changed:
+        log.info(f'OUI-Index gespeichert: {total} Einträge '
+                 f'({", ".join(f"{b} Bit: {counts[b]}" for b in PREFIX_BITS)})')
+    else:
+        log.info(f'OUI-Index unverändert ({total} Einträge)')
+    return total, changed
+
+def _attr_path(index_path):
+    return os.path.join(os.path.dirname(index_path), ATTR_FILE)
+
+def _open_index():
+    """Vorhandenen Binärindex öffnen oder None (fehlende Attribute nachbauen)."""
+    if os.path.exists(OUI_INDEX):
+        try:
+            db = OuiIndex(OUI_INDEX)
+        except (OSError, ValueError, struct.error) as e:
+            log.warning(f'OUI-Index defekt: {e}')
+            return None
+        if not os.path.exists(_attr_path(OUI_INDEX)):
+            write_attr_table(_attr_path(OUI_INDEX), build_attr_table(db.items()))
+        return db
+    return None
+
+def _import_legacy_cache():
+    """Alten JSON-Cache (oui_cache.json) einmalig in den Binärindex übernehmen."""
+    if not os.path.exists(OUI_CACHE):
+        return None
+    try:
+        with open(OUI_CACHE) as f:
+            data = json.load(f)
+        updated = data.get('updated', '')
+        updated_ts = datetime.fromisoformat(updated).timestamp() if updated else 0
+        write_index(OUI_INDEX, (((24, int(k.replace(':', ''), 16)), v)
+                                for k, v in data.get('db', {}).items()), updated_ts)
+        os.replace(OUI_CACHE, OUI_CACHE + '.imported')
+        log.info(f'OUI-Cache {OUI_CACHE} in Binärindex übernommen')
+    except Exception as e:
+        log.warning(f'OUI-Cache Import fehlgeschlagen: {e}')
+        return None
+    return _open_index()
 
 def _needs_update(updated_str):
     """Prüft ob Cache aktualisiert werden muss."""
@@ -56,50 +415,108 @@ def _needs_update(updated_str):
     except Exception:
         return True
 
-def _download_oui(timeout=5):
-    """Lädt OUI-Liste von IEEE herunter."""
-    try:
-        log.info('Lade OUI-Liste von IEEE...')
-        request = urllib.request.Request(OUI_URL, headers={
-            'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36'
-        })
-        req = urllib.request.urlopen(request, timeout=timeout)
-        text = req.read().decode('utf-8', errors='ignore')
-        db = _parse_oui_txt(text)
-        if len(db) > 1000:
-            log.info(f'OUI-Liste geladen: {len(db)} Einträge')
-            return db
-    except Exception as e:
-        log.warning(f'OUI Download fehlgeschlagen: {e}')
-    return None
+def _download_oui(runs, timeout=5):
+    """
+    Lädt OUI-Registries von IEEE herunter; Einträge gehen zeilenweise
+    geparst direkt in runs (_SortedRuns).
+    Returns: Anzahl Einträge oder None (MA-L fehlgeschlagen).
+    """
+    for name, url in REGISTRIES:
+        before = runs.count
+        try:
+            log.info(f'Lade OUI-Liste {name} von IEEE...')
+            # alle Registries liegen auf einem Host: eine Verbindung (Keep-alive)
+            with http_pool.stream(url, headers={
+                'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36'
+            }, timeout=timeout) as req:
+                runs.extend(_parse_registry(
+                    io.TextIOWrapper(req, encoding='utf-8', errors='ignore')))
+            count = runs.count - before
+            log.info(f'OUI-Liste {name} geladen: {count} Einträge')
+            if name == 'oui' and count <= 1000:
+                return None
+        except Exception as e:
+            log.warning(f'OUI Download {name} fehlgeschlagen: {e}')
+            if name == 'oui':
+                return None
+    return runs.count
+
+def _open_registry(path):
+    """Lokale Registry-Datei (auch .gz) als Zeilen-Stream öffnen."""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='ignore')
+    return open(path, encoding='utf-8', errors='ignore')
+
+def import_registry(paths, index_path=None):
+    """
+    Offline-Update aus lokalen IEEE-Dateien (oui.txt, mam.txt, oui36.txt,
+    iab.txt, optional .gz). Ohne vollständiges MA-L (oui.txt) werden die
+    Dateien über den bestehenden Index gelegt statt ihn zu ersetzen.
+    Returns: (Anzahl Einträge, veröffentlicht?) oder None.
+    """
+    index_path = index_path or OUI_INDEX
+    with _SortedRuns(os.path.dirname(index_path)) as runs:
+        ma_l = 0
+        for path in paths:
+            before = runs.count
+            try:
+                with _open_registry(path) as f:
+                    for key, vendor in _parse_registry(f):
+                        runs.add(key, vendor)
+                        ma_l += key[0] == 24
+            except OSError as e:
+                log.warning(f'OUI-Import {path} fehlgeschlagen: {e}')
+                return None
+            log.info(f'OUI-Liste {path} gelesen: {runs.count - before} Einträge')
+        if not runs.count:
+            log.warning('OUI-Import: keine Einträge gefunden')
+            return None
+        if ma_l <= 1000 and os.path.exists(index_path):
+            try:
+                runs.underlay(OuiIndex(index_path).items())
+            except (OSError, ValueError, struct.error) as e:
+                log.warning(f'OUI-Index defekt, Import ersetzt ihn: {e}')
+        return write_index(index_path, runs)
 
 def load_oui_db(force_update=False):
     """
     Lädt OUI-Datenbank - aus Cache oder frisch von IEEE.
     Bei Internetverbindung wird wöchentlich aktualisiert.
     """
-    db, updated = _load_cache()
+    db = _open_index() or _import_legacy_cache()
+    updated = db.updated if db is not None else ''
+    checked = db.checked if db is not None else ''
 
-    if force_update or _needs_update(updated) or len(db) < 100:
-        new_db = _download_oui()
-        if new_db:
-            db = new_db
-            _save_cache(db)
-        elif not db:
-            log.warning('Kein OUI-Cache und kein Internet - Lookup nicht verfügbar')
+    # v1-Index (nur MA-L) → bei Gelegenheit um MA-M/MA-S ergänzen
+    stale = db is not None and db.version < _VERSION
+    if force_update or stale or _needs_update(checked) or len(db or ()) < 100:
+        with _SortedRuns(os.path.dirname(OUI_INDEX)) as runs:
+            if _download_oui(runs):
+                _, changed = write_index(OUI_INDEX, runs)
+                if changed or db is None:
+                    db = _open_index()
+                else:
+                    db.checked_ts = time.time()
+                updated = db.updated if db is not None else ''
+            elif not db:
+                log.warning('Kein OUI-Cache und kein Internet - Lookup nicht verfügbar')
 
+    if db is None:
+        return {}
     log.info(f'OUI-DB: {len(db)} Einträge (Stand: {updated[:10] if updated else "unbekannt"})')
     return db
 
 def lookup(mac, db):
     """
-    Sucht Hersteller für eine MAC-Adresse.
+    Sucht Hersteller für eine MAC-Adresse (längster bekannter Präfix).
     Returns: Herstellername oder 'Unbekannt'
     """
     if not mac or not db:
         return 'Unbekannt'
-    oui = mac.lower().replace('-', ':')[:8]
-    return db.get(oui, 'Unbekannt')
+    mac = mac.lower().replace('-', ':')
+    if isinstance(db, OuiIndex):
+        return db.get(mac, 'Unbekannt')
+    return db.get(mac[:8], 'Unbekannt')
 
 def lookup_many(macs, db):
     """Lookup für mehrere MACs auf einmal."""
@@ -113,11 +530,16 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--update', action='store_true', help='Cache aktualisieren')
     parser.add_argument('--lookup', help='MAC-Adresse nachschlagen')
+    parser.add_argument('--import', dest='import_files', nargs='+', metavar='FILE',
+                        help='Registry aus lokalen Dateien übernehmen (offline)')
     args = parser.parse_args()
 
     logging.basicConfig(level=logging.INFO,
                         format='[%(asctime)s] %(levelname)s %(message)s')
 
+    if args.import_files:
+        import_registry(args.import_files)
+
     db = load_oui_db(force_update=args.update)
 
     if args.lookup:
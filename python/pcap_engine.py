@@ -11,13 +11,16 @@ import json
 import logging
 from collections import defaultdict
 from datetime import datetime
+from geo import extend_trajectory, merge_trajectories, count_places
 
 log = logging.getLogger('CYT-PCAP')
 
-def read_pcap_probes(filepath):
+def read_pcap_probes(filepath, gps_track=None):
     """
     Liest Probe-Requests direkt aus PCAP-Datei.
     Gibt {mac: {count, first_seen, last_seen, ssids}} zurück.
+    Mit gps_track (GpsTrack) wird jeder Frame per Sort-Merge-Join mit dem
+    Track geotaggt (interpolierte Position) → 'trajectory' + 'n_places'.
     """
     devices = defaultdict(lambda: {
         'count': 0,
@@ -27,12 +30,17 @@ def read_pcap_probes(filepath):
         'rssi_max': None,
         'rssi_last': None,
         'rssi_seen': 0,
+        'trajectory': [],
+        'geo_ts': None,
     })
 
     if not os.path.exists(filepath):
         log.error(f"PCAP nicht gefunden: {filepath}")
         return {}
 
+    # Frames kommen zeitlich sortiert → Cursor läuft mit (O(Frames + Fixes))
+    cursor = gps_track.cursor() if gps_track else None
+
     try:
         with open(filepath, 'rb') as f:
             # Global Header
@@ -120,6 +128,12 @@ def read_pcap_probes(filepath):
                 # Binärmüll-SSIDs filtern
                 if ssid and ssid.isprintable() and len(ssid) > 1:
                     d['ssids'].add(ssid)
+                # Geotagging: Probe-Bursts derselben Sekunde nur einmal
+                if cursor is not None and d['geo_ts'] != ts_sec:
+                    d['geo_ts'] = ts_sec
+                    fix = cursor.position_at(ts_sec + ts_usec / 1e6)
+                    if fix:
+                        extend_trajectory(d['trajectory'], ts_sec, fix[0], fix[1])
 
     except Exception as e:
         log.error(f"PCAP-Lesefehler: {e}")
@@ -136,6 +150,8 @@ def read_pcap_probes(filepath):
             'rssi_max': data['rssi_max'],
             'rssi_last': data['rssi_last'],
             'rssi_seen': data['rssi_seen'],
+            'trajectory': data['trajectory'],
+            'n_places': count_places(data['trajectory']),
         }
 
     log.info(f"PCAP gelesen: {len(result)} Geräte gefunden")
@@ -189,16 +205,20 @@ def _parse_radiotap_rssi(data):
     return None
 
 
-def read_pcap_beacons(filepath):
+def read_pcap_beacons(filepath, gps_track=None):
     """
     Liest Beacon Frames (FC=0x80) direkt aus PCAP-Datei.
     Gibt {bssid: {ssid, channel, rssi, beacon_count, hidden}} zurück.
     Für Hotel-Scan Modus 4.
+    Mit gps_track (GpsTrack) zusätzlich 'lat'/'lon' (Position beim
+    stärksten Beacon), 'rssi_best' und 'last_seen' (Epoch) - für die
+    Offline-WiGLE-Datenbank (wigle_offline.py).
     """
     beacons = defaultdict(lambda: {
         'ssid': '', 'channel': None, 'rssi': None,
         'beacon_count': 0, 'hidden': False
     })
+    cursor = gps_track.cursor() if gps_track else None
 
     if not os.path.exists(filepath):
         log.error(f"PCAP nicht gefunden: {filepath}")
@@ -275,6 +295,15 @@ def read_pcap_beacons(filepath):
 
                 b = beacons[bssid]
                 b['beacon_count'] += 1
+                if cursor is not None:
+                    ts = ts_sec + ts_usec / 1e6
+                    b['last_seen'] = ts
+                    best = b.get('rssi_best')
+                    if 'lat' not in b or (rssi is not None and (best is None or rssi > best)):
+                        pos = cursor.position_at(ts)
+                        if pos:
+                            b['lat'], b['lon'] = pos
+                            b['rssi_best'] = rssi
                 if ssid:
                     b['ssid'] = ssid
                 elif b['beacon_count'] == 1:
@@ -317,10 +346,12 @@ def analyze_persistence(*scans, threshold=0.6, min_appearances=2):
         rssi_max = None
         rssi_last = None
         last_seen_ts = -1
+        trajs = []
         for scan in scans:
             if mac in scan:
                 entry = scan[mac]
                 all_ssids.update(entry.get('ssids', []))
+                trajs.append(entry.get('trajectory'))
                 rmax = entry.get('rssi_max')
                 if rmax is not None and (rssi_max is None or rmax > rssi_max):
                     rssi_max = rmax
@@ -331,6 +362,7 @@ def analyze_persistence(*scans, threshold=0.6, min_appearances=2):
                     last_seen_ts = ls
 
         if total_appearances >= min_appearances:
+            trajectory = merge_trajectories(trajs)
             scored[mac] = {
                 'persistence_score': round(score, 3),
                 'appearances': total_appearances,
@@ -339,6 +371,8 @@ def analyze_persistence(*scans, threshold=0.6, min_appearances=2):
                 'ssids': list(all_ssids),
                 'rssi_max': rssi_max,
                 'rssi_last': rssi_last,
+                'trajectory': trajectory,
+                'n_places': count_places(trajectory),
                 'suspicious': score >= threshold
             }
 
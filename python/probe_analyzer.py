@@ -3,10 +3,10 @@
 probe_analyzer.py - Pineapple Pager Edition
 Post-Processing: Analysiert gesammelte Probe-Daten mit optionaler WiGLE-API.
 OpenWrt-Anpassungen:
-  - urllib statt requests (stdlib, kein pip nötig)
+  - http_pool (http.client) statt requests (stdlib, kein pip nötig)
   - Kein pandas (kein pip-compile auf MIPS)
   - Credentials aus config.json (kein cryptography-Paket)
-  - Fallback auf urllib wenn requests nicht verfügbar
+  - WiGLE über wigle_lookup (gemeinsamer Cache, Token-Bucket, Zeitbudget)
 """
 
 import sqlite3
@@ -15,97 +15,15 @@ import os
 import sys
 import logging
 import argparse
-import base64
 import glob
 from datetime import datetime, timedelta
 from collections import defaultdict
 
-# Requests oder urllib als Fallback
-try:
-    import requests
-    HAS_REQUESTS = True
-except ImportError:
-    import urllib.request
-    import urllib.error
-    HAS_REQUESTS = False
-    logging.getLogger('CYT-Probe').warning(
-        "'requests' nicht verfügbar - nutze urllib (stdlib)"
-    )
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from wigle_lookup import WiGLEClient, WiGLEScheduler
 
 log = logging.getLogger('CYT-Probe')
 
-# ============================================================
-# WIGLE API - kompatibel mit requests UND urllib
-# ============================================================
-class WiGLEClient:
-    """Leichtgewichtiger WiGLE-API-Client ohne externe Abhängigkeiten."""
-
-    BASE_URL = 'https://api.wigle.net/api/v2'
-
-    def __init__(self, api_name, api_token):
-        # Basic Auth aus API-Name und Token
-        credentials = f'{api_name}:{api_token}'
-        self.auth_header = 'Basic ' + base64.b64encode(
-            credentials.encode()
-        ).decode()
-        self.enabled = bool(api_name and api_token)
-
-    def search_ssid(self, ssid, lat_min=-90, lat_max=90,
-                    lon_min=-180, lon_max=180, max_results=5):
-        """Sucht SSID in WiGLE-Datenbank, gibt Standortliste zurück."""
-        if not self.enabled:
-            return []
-
-        url = f'{self.BASE_URL}/network/search'
-        params = {
-            'ssid': ssid,
-            'latrange1': lat_min,
-            'latrange2': lat_max,
-            'longrange1': lon_min,
-            'longrange2': lon_max,
-            'resultsPerPage': max_results
-        }
-
-        try:
-            if HAS_REQUESTS:
-                resp = requests.get(
-                    url,
-                    params=params,
-                    headers={'Authorization': self.auth_header},
-                    timeout=10
-                )
-                resp.raise_for_status()
-                data = resp.json()
-            else:
-                # urllib Fallback
-                param_str = '&'.join(f'{k}={v}' for k, v in params.items())
-                full_url = f'{url}?{param_str}'
-                req = urllib.request.Request(
-                    full_url,
-                    headers={'Authorization': self.auth_header}
-                )
-                with urllib.request.urlopen(req, timeout=10) as resp:
-                    data = json.loads(resp.read().decode())
-
-            results = data.get('results', [])
-            locations = []
-            for r in results:
-                if r.get('trilat') and r.get('trilong'):
-                    locations.append({
-                        'ssid': r.get('ssid', ssid),
-                        'bssid': r.get('netid', ''),
-                        'lat': r['trilat'],
-                        'lon': r['trilong'],
-                        'lastupdt': r.get('lastupdt', ''),
-                        'encryption': r.get('encryption', 'unknown')
-                    })
-            log.info(f"WiGLE: '{ssid}' → {len(locations)} Standorte")
-            return locations
-
-        except Exception as e:
-            log.warning(f"WiGLE-Abfrage fehlgeschlagen für '{ssid}': {e}")
-            return []
-
 # ============================================================
 # PROBE-DATEN AUS KISMET-LOGS LADEN
 # ============================================================
@@ -214,18 +132,18 @@ def analyze_probes(probe_data, wigle_client=None, config=None):
     for ssid, macs in top_ssids[:5]:
         log.info(f"  '{ssid}': {len(macs)} Geräte suchen danach")
 
-    # WiGLE-Abfragen für Top-SSIDs
+    # WiGLE-Abfragen für Top-SSIDs (häufigste zuerst, unter Zeitbudget)
     wigle_results = {}
-    if wigle_client and wigle_client.enabled:
+    if wigle_client:
         log.info("Starte WiGLE-Abfragen (verbraucht API-Credits)...")
-        for ssid, macs in top_ssids[:10]:  # Max 10 Abfragen
-            locations = wigle_client.search_ssid(
-                ssid,
-                lat_min=search_bounds.get('lat_min', -90),
-                lat_max=search_bounds.get('lat_max', 90),
-                lon_min=search_bounds.get('lon_min', -180),
-                lon_max=search_bounds.get('lon_max', 180)
-            )
+        bounds = (search_bounds.get('lat_min', -90), search_bounds.get('lat_max', 90),
+                  search_bounds.get('lon_min', -180), search_bounds.get('lon_max', 180))
+        sched = WiGLEScheduler(wigle_client)
+        keys = [(ssid, macs, sched.add('ssid_loc', (ssid, bounds, 5), len(macs)))
+                for ssid, macs in top_ssids[:10]]  # Max 10 Abfragen
+        sched.run()
+        for ssid, macs, key in keys:
+            locations = sched.result(*key)
             if locations:
                 wigle_results[ssid] = {
                     'locations': locations,
@@ -336,6 +254,8 @@ def main():
 
     # Analysieren
     analysis = analyze_probes(probe_data, wigle_client, config)
+    if wigle_client:
+        wigle_client.flush()
 
     # Report speichern
     save_probe_report(analysis, args.output_dir)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+shared_state.py - Prozessübergreifend sicherer Zustand in JSON-Dateien
+payload.sh lässt bt_scanner.py im Hintergrund laufen, während analyze_pcap,
+watchlist_add und hotel_scan dieselben Dateien (watch_list.json,
+wigle_cache.json, oui_cache.json, ...) lesen und schreiben.
+
+  file_lock()          fcntl-Advisory-Lock auf <datei>.lock (exklusiv/geteilt)
+  atomic_file()        temp-Datei im selben Verzeichnis + fsync + os.replace -
+  atomic_write_json()  Leser sehen immer entweder den alten oder neuen Stand
+  JsonState            Lesen mit Reload nur bei geänderter Datei (mtime/Größe/
+                       Inode); update() = Lock → Datei neu lesen → ändern →
+                       atomisch schreiben (Read-Modify-Write ohne Lost Update)
+
+Lesen braucht keinen Lock (os.replace ist atomar). Ohne fcntl (Windows-
+Entwicklungsrechner) wird nicht gesperrt. suspects_db nutzt SQLite und
+dessen eigene Sperren.
+"""
+import os
+import json
+import logging
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+log = logging.getLogger('CYT-State')
+
+
+@contextmanager
+def file_lock(path, exclusive=True):
+    """Advisory-Lock für path (über Sperrdatei path + '.lock')."""
+    dirname = os.path.dirname(path)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    with open(path + '.lock', 'a+') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+@contextmanager
+def atomic_file(path, mode='w'):
+    """
+    with atomic_file(path, 'wb') as f: ... - schreibt in eine temp-Datei im
+    selben Verzeichnis; erst nach fehlerfreiem Block fsync + os.replace.
+    """
+    dirname = os.path.dirname(path) or '.'
+    os.makedirs(dirname, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=dirname, prefix='.' + os.path.basename(path) + '.',
+                               suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write_json(path, data, **dump_kwargs):
+    """JSON atomisch schreiben: temp-Datei → fsync → os.replace."""
+    with atomic_file(path) as f:
+        json.dump(data, f, **dump_kwargs)
+
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class JsonState:
+    """
+    JSON-Datei als gemeinsamer Zustand.
+    load():   Inhalt (gecacht, neu gelesen nur wenn die Datei sich geändert hat)
+    update(): Kontextmanager für Read-Modify-Write unter exklusivem Lock
+    default:  Fabrik für den Inhalt einer fehlenden/defekten Datei
+    """
+
+    def __init__(self, path, default=dict, **dump_kwargs):
+        self.path = path
+        self.default = default
+        self.dump_kwargs = dump_kwargs
+        self.data = None
+        self._stamp = None
+
+    def changed(self):
+        """Wurde die Datei seit dem letzten load()/update() geändert?"""
+        return self.data is None or _stamp(self.path) != self._stamp
+
+    def load(self, force=False):
+        if not force and not self.changed():
+            return self.data
+        stamp = _stamp(self.path)
+        data = None
+        if stamp is not None:
+            try:
+                with open(self.path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                log.warning(f'{self.path} nicht lesbar: {e}')
+        self.data = self.default() if data is None else data
+        self._stamp = stamp
+        return self.data
+
+    @contextmanager
+    def update(self):
+        """
+        with state.update() as data: ... - data ist der Dateistand unter Lock
+        (immer neu gelesen, lokale Änderungen an load()-Daten zählen nicht);
+        nach dem Block wird data atomisch geschrieben (bei Exception nicht).
+        """
+        with file_lock(self.path):
+            data = self.load(force=True)
+            yield data
+            atomic_write_json(self.path, data, **self.dump_kwargs)
+            self.data = data
+            self._stamp = _stamp(self.path)
+
+
+# ============================================================
+# MAIN (Test: parallele Updates ohne Lost Update)
+# ============================================================
+if __name__ == '__main__':
+    import sys
+    from multiprocessing import Process
+
+    path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        tempfile.gettempdir(), 'cyt_state_test.json')
+
+    def worker(n):
+        st = JsonState(path)
+        for _ in range(200):
+            with st.update() as data:
+                data['counter'] = data.get('counter', 0) + 1
+                data.setdefault('workers', {})[str(n)] = True
+
+    atomic_write_json(path, {})
+    procs = [Process(target=worker, args=(n,)) for n in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    result = JsonState(path).load()
+    print(f'counter={result["counter"]} (erwartet 800), '
+          f'workers={len(result["workers"])}')
@@ -9,20 +9,72 @@ APIs:
   - Shodan Host (Key, $49 einmalig)    → IP → Org/ASN/Banner
   - Fingerbank  (Key, kostenlos)       → MAC → Gerätekategorie
 
-Nur stdlib — urllib.request + json.
+Nur stdlib — http_pool (http.client, Keep-alive) + json.
+
+Alle Provider teilen einen persistenten Cache (disk_cache.PersistentCache,
+enrich_cache.json): TTL je Provider, Negativ-Einträge (404, kein Treffer)
+mit kürzerer TTL, Netzwerk-/Serverfehler nur kurz (TTL_FAILED), LRU-Grenze.
+Wiederholte Scans im selben Hotel/Büro fragen kaum noch das Netz.
 """
 
-import json
 import logging
+import threading
 import time
-import urllib.request
-import urllib.error
 import urllib.parse
 
+import http_pool
+from disk_cache import PersistentCache, MISS
+
 log = logging.getLogger('CYT-Shodan')
 
-# ── In-Memory Cache (Laufzeit des Scripts) ────────────────────────────────────
-_cache = {}
+# ── Persistenter Cache (prozessübergreifend) ──────────────────────────────────
+CACHE_FILE  = '/root/loot/chasing_your_tail/enrich_cache.json'
+CACHE_MAX   = 2000
+TTL_FAILED  = 900           # Timeout/5xx/429: nur kurz merken
+
+# Provider-Präfix → (TTL Treffer, TTL negativ) in Sekunden
+PROVIDER_TTL = {
+    'idb':  (7 * 86400,  86400),        # InternetDB
+    'cve':  (7 * 86400,  3 * 86400),    # CVEDB
+    'host': (7 * 86400,  86400),        # Shodan Host API
+    'fb':   (30 * 86400, 7 * 86400),    # Fingerbank
+}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _store():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PersistentCache(CACHE_FILE, max_entries=CACHE_MAX)
+    return _cache
+
+
+def _cached(cache_key):
+    """Gecachter Wert (auch None/[]) oder MISS."""
+    return _store().get(cache_key)
+
+
+def _remember(cache_key, value, ok=True):
+    """
+    Ergebnis cachen. ok=False: Abfrage gescheitert (Netz/Server) → TTL_FAILED.
+    Leere Ergebnisse (None, []) bekommen die negative TTL des Providers.
+    """
+    hit_ttl, neg_ttl = PROVIDER_TTL[cache_key.split(':', 1)[0]]
+    if not ok:
+        ttl = TTL_FAILED
+    else:
+        ttl = hit_ttl if value else neg_ttl
+    _store().put(cache_key, value, ttl)
+    return value
+
+
+def flush_cache():
+    """Neue Cache-Einträge schreiben (sonst automatisch bei Prozessende)."""
+    if _cache is not None:
+        _cache.flush()
 
 
 # ── Private IP Check ─────────────────────────────────────────────────────────
@@ -56,23 +108,34 @@ def is_private_ip(ip):
 _UA = {'User-Agent': 'ArgusP/1.0'}
 
 
-def _http_get(url, timeout=5, headers=None):
-    """GET request, returns parsed JSON or None."""
+def _http_fetch(url, timeout=5, headers=None):
+    """
+    GET request → (ok, JSON oder None).
+    ok=False bei Netzwerkfehler, Timeout, 401/403 (Key ungültig/abgelaufen),
+    429 und 5xx - wird nur kurz gecacht (TTL_FAILED); 404 und andere 4xx
+    gelten als Antwort ohne Daten (ok=True, None).
+    """
     try:
         h = dict(_UA)
         if headers:
             h.update(headers)
-        req = urllib.request.Request(url, headers=h)
-        with urllib.request.urlopen(req, timeout=timeout) as resp:
-            return json.loads(resp.read().decode('utf-8'))
-    except urllib.error.HTTPError as e:
+        return True, http_pool.get_json(url, headers=h, timeout=timeout)
+    except http_pool.HTTPError as e:
         if e.code == 404:
-            return None
+            return True, None
+        if e.code in (401, 403):
+            log.warning(f'HTTP {e.code}: API-Key abgelehnt ({url.split("?")[0]})')
+            return False, None
         log.debug(f'HTTP {e.code}: {url}')
-        return None
+        return not (e.code == 429 or e.code >= 500), None
     except Exception as e:
         log.debug(f'HTTP error: {url}: {e}')
-        return None
+        return False, None
+
+
+def _http_get(url, timeout=5, headers=None):
+    """GET request, returns parsed JSON or None."""
+    return _http_fetch(url, timeout, headers)[1]
 
 
 # ── InternetDB (kostenlos) ───────────────────────────────────────────────────
@@ -86,10 +149,11 @@ def internetdb_lookup(ip, timeout=5):
         return None
 
     cache_key = f'idb:{ip}'
-    if cache_key in _cache:
-        return _cache[cache_key]
+    cached = _cached(cache_key)
+    if cached is not MISS:
+        return cached
 
-    data = _http_get(f'https://internetdb.shodan.io/{ip}', timeout=timeout)
+    ok, data = _http_fetch(f'https://internetdb.shodan.io/{ip}', timeout=timeout)
     if data and 'ip' in data:
         result = {
             'ports': data.get('ports', []),
@@ -98,11 +162,9 @@ def internetdb_lookup(ip, timeout=5):
             'tags': data.get('tags', []),
             'vulns': data.get('vulns', []),
         }
-        _cache[cache_key] = result
-        return result
+        return _remember(cache_key, result)
 
-    _cache[cache_key] = None
-    return None
+    return _remember(cache_key, None, ok)
 
 
 # ── CVEDB (kostenlos) ────────────────────────────────────────────────────────
@@ -117,17 +179,20 @@ def cvedb_by_product(product, limit=5):
         return []
 
     cache_key = f'cve:{product}'
-    if cache_key in _cache:
-        return _cache[cache_key]
+    cached = _cached(cache_key)
+    if cached is not MISS:
+        return cached
 
     results = []
+    any_ok = False
 
     # CPE-basierte Suche (zuverlässiger bei CVEDB)
     cpe_query = f'cpe:/a:{product}'
     params = urllib.parse.urlencode({
         'cpe': cpe_query, 'is_kev': 'true', 'limit': limit
     })
-    data = _http_get(f'https://cvedb.shodan.io/cves?{params}', timeout=8)
+    ok, data = _http_fetch(f'https://cvedb.shodan.io/cves?{params}', timeout=8)
+    any_ok |= ok
     if data and data.get('cves'):
         for c in data['cves'][:limit]:
             results.append({
@@ -143,7 +208,8 @@ def cvedb_by_product(product, limit=5):
         params = urllib.parse.urlencode({
             'cpe': cpe_query, 'sort_by_epss': 'true', 'limit': limit
         })
-        data = _http_get(f'https://cvedb.shodan.io/cves?{params}', timeout=8)
+        ok, data = _http_fetch(f'https://cvedb.shodan.io/cves?{params}', timeout=8)
+        any_ok |= ok
         if data and data.get('cves'):
             for c in data['cves'][:limit]:
                 results.append({
@@ -159,7 +225,8 @@ def cvedb_by_product(product, limit=5):
         params = urllib.parse.urlencode({
             'product': product, 'sort_by_epss': 'true', 'limit': limit
         })
-        data = _http_get(f'https://cvedb.shodan.io/cves?{params}', timeout=8)
+        ok, data = _http_fetch(f'https://cvedb.shodan.io/cves?{params}', timeout=8)
+        any_ok |= ok
         if data and data.get('cves'):
             for c in data['cves'][:limit]:
                 results.append({
@@ -170,8 +237,7 @@ def cvedb_by_product(product, limit=5):
                     'propose_action': c.get('propose_action', ''),
                 })
 
-    _cache[cache_key] = results
-    return results
+    return _remember(cache_key, results, any_ok or bool(results))
 
 
 # ── Shodan Full Host API (Key erforderlich) ──────────────────────────────────
@@ -184,17 +250,17 @@ def shodan_host_lookup(ip, api_key, timeout=8):
         return None
 
     cache_key = f'host:{ip}'
-    if cache_key in _cache:
-        return _cache[cache_key]
+    cached = _cached(cache_key)
+    if cached is not MISS:
+        return cached
 
     params = urllib.parse.urlencode({'key': api_key})
-    data = _http_get(
+    ok, data = _http_fetch(
         f'https://api.shodan.io/shodan/host/{ip}?{params}',
         timeout=timeout
     )
     if not data:
-        _cache[cache_key] = None
-        return None
+        return _remember(cache_key, None, ok)
 
     result = {
         'org': data.get('org', ''),
@@ -220,8 +286,7 @@ def shodan_host_lookup(ip, api_key, timeout=8):
                 svc['cpe'] if isinstance(svc['cpe'], list) else [svc['cpe']]
             )
 
-    _cache[cache_key] = result
-    return result
+    return _remember(cache_key, result)
 
 
 # ── Kombinierter IP-Lookup ───────────────────────────────────────────────────
@@ -300,24 +365,25 @@ def fingerbank_lookup(mac, api_key, dhcp_fingerprint=None, timeout=5):
         return None
 
     cache_key = f'fb:{mac.lower()}'
-    if cache_key in _cache:
-        return _cache[cache_key]
+    if dhcp_fingerprint:
+        cache_key += f':{dhcp_fingerprint}'
+    cached = _cached(cache_key)
+    if cached is not MISS:
+        return cached
 
     params = {'key': api_key, 'mac': mac}
     if dhcp_fingerprint:
         params['dhcp_fingerprint'] = dhcp_fingerprint
 
     url = f'https://api.fingerbank.org/api/v2/combinations/interrogate?{urllib.parse.urlencode(params)}'
-    data = _http_get(url, timeout=timeout)
+    ok, data = _http_fetch(url, timeout=timeout)
 
     if not data or 'device' not in data:
-        _cache[cache_key] = None
-        return None
+        return _remember(cache_key, None, ok)
 
     score = data.get('score', 0)
     if score < 30:
-        _cache[cache_key] = None
-        return None
+        return _remember(cache_key, None)
 
     device = data['device']
     category = device.get('name', '')
@@ -339,5 +405,4 @@ def fingerbank_lookup(mac, api_key, dhcp_fingerprint=None, timeout=5):
         'score': score,
         'risk': risk,
     }
-    _cache[cache_key] = result
-    return result
+    return _remember(cache_key, result)
@@ -15,12 +15,15 @@ import os
 import sys
 import logging
 import argparse
-import math
 from datetime import datetime, timedelta
 from collections import defaultdict
 from xml.etree.ElementTree import Element, SubElement, tostring
 from xml.dom import minidom
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from geo import haversine, radius_clusters
+from time_join import overlap_join
+
 log = logging.getLogger('CYT-Surveillance')
 
 # ============================================================
@@ -92,39 +95,20 @@ def extract_gps_from_kismet(db_path):
 # ============================================================
 # LOCATION CLUSTERING (ohne numpy - reines Python)
 # ============================================================
-def haversine_distance(lat1, lon1, lat2, lon2):
-    """Berechnet Distanz in Metern zwischen zwei GPS-Punkten."""
-    R = 6371000  # Erdradius in Metern
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lon2 - lon1)
-    a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
-    return 2 * R * math.asin(math.sqrt(a))
+# Distanz in Metern zwischen zwei GPS-Punkten (gemeinsamer Kern in geo.py)
+haversine_distance = haversine
 
 def cluster_locations(gps_points, threshold_meters=100):
     """
     Einfaches Radius-Clustering ohne numpy.
     Gruppert GPS-Punkte die < threshold_meters auseinander liegen.
+    Raster-Index (geo.radius_clusters) statt Vergleich aller Punktpaare.
     """
     if not gps_points:
         return []
 
     clusters = []
-    used = [False] * len(gps_points)
-
-    for i, p in enumerate(gps_points):
-        if used[i]:
-            continue
-        cluster = [p]
-        used[i] = True
-        for j, q in enumerate(gps_points):
-            if used[j]:
-                continue
-            dist = haversine_distance(p['lat'], p['lon'], q['lat'], q['lon'])
-            if dist <= threshold_meters:
-                cluster.append(q)
-                used[j] = True
+    for cluster in radius_clusters(gps_points, threshold_meters):
         # Cluster-Zentrum berechnen
         center_lat = sum(pt['lat'] for pt in cluster) / len(cluster)
         center_lon = sum(pt['lon'] for pt in cluster) / len(cluster)
@@ -143,41 +127,29 @@ def cluster_locations(gps_points, threshold_meters=100):
 # ============================================================
 # GERÄT-ZU-LOCATION KORRELATION
 # ============================================================
-def correlate_devices_to_locations(suspicious_devices, gps_clusters, db_path):
+def correlate_devices_to_locations(suspicious_devices, gps_clusters):
     """
     Verknüpft verdächtige Geräte mit GPS-Clustern anhand von Zeitstempeln.
+    Zeitliche Überschneidung per Endpunkt-Sweep (time_join.overlap_join).
     """
     if not gps_clusters or not suspicious_devices:
         return suspicious_devices
 
-    # Geräte-Timestamps aus DB laden
-    try:
-        with sqlite3.connect(db_path, timeout=10) as conn:
-            for mac, data in suspicious_devices.items():
-                # Zeitstempel des Geräts
-                first_ts = data.get('first_seen', 0) or 0
-                last_ts = data.get('last_seen', 0) or 0
-
-                # Passende Cluster finden (zeitliche Überschneidung)
-                matched_clusters = []
-                for cluster in gps_clusters:
-                    c_start = cluster['start_time']
-                    c_end = cluster['end_time']
-                    # Zeitliche Überschneidung prüfen
-                    if first_ts <= c_end and last_ts >= c_start:
-                        matched_clusters.append({
-                            'lat': cluster['lat'],
-                            'lon': cluster['lon'],
-                            'point_count': cluster['point_count']
-                        })
-
-                if matched_clusters:
-                    data['gps_locations'] = matched_clusters
-                    data['location_count'] = len(matched_clusters)
-                    log.info(f"Gerät {mac} an {len(matched_clusters)} Standort(en) gesehen")
-
-    except sqlite3.Error as e:
-        log.warning(f"Geräte-Location-Korrelation fehlgeschlagen: {e}")
+    # Zeitfenster der Geräte / Zeitspannen der Cluster
+    windows = [(mac, data.get('first_seen', 0) or 0, data.get('last_seen', 0) or 0)
+               for mac, data in suspicious_devices.items()]
+    spans = [(c['start_time'], c['end_time']) for c in gps_clusters]
+
+    for mac, idxs in overlap_join(windows, spans).items():
+        data = suspicious_devices[mac]
+        # Treffer in Cluster-Reihenfolge
+        data['gps_locations'] = [{
+            'lat': gps_clusters[i]['lat'],
+            'lon': gps_clusters[i]['lon'],
+            'point_count': gps_clusters[i]['point_count']
+        } for i in idxs]
+        data['location_count'] = len(idxs)
+        log.info(f"Gerät {mac} an {len(idxs)} Standort(en) gesehen")
 
     return suspicious_devices
 
@@ -422,9 +394,7 @@ def main():
 
     # Geräte mit Standorten korrelieren
     if suspicious and gps_clusters:
-        suspicious = correlate_devices_to_locations(
-            suspicious, gps_clusters, args.kismet_db
-        )
+        suspicious = correlate_devices_to_locations(suspicious, gps_clusters)
 
     # Reports erstellen
     report_path = generate_surveillance_report(suspicious, gps_clusters, args.output_dir)
@@ -1,81 +1,269 @@
 """
 suspects_db.py - Persistente Verdächtige-Datenbank
 Speichert verdächtige Geräte über mehrere Scans hinweg.
+SQLite-Backend: Updates eines Reports laufen in einer Transaktion
+(transaction()), Indizes auf MAC, last_seen und Vendor. Eine vorhandene
+suspects_db.json wird beim ersten Start einmalig importiert und danach
+in suspects_db.json.imported umbenannt.
+Standortverlauf als kompakte Besuche (geo.add_visit): aufeinanderfolgende
+Sichtungen im Umkreis merge_m werden zusammengefasst, max. max_visits
+Besuche pro MAC (älteste fliegen raus).
 """
 import json
 import os
+import sqlite3
 import logging
+from contextlib import contextmanager
 from datetime import datetime
+from geo import haversine, compact_visits, VISIT_MERGE_M, MAX_VISITS
 
 log = logging.getLogger(__name__)
 
 DEFAULT_PATH = '/root/loot/chasing_your_tail/suspects_db.json'
 
+TS_FMT = '%Y-%m-%d %H:%M:%S'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS suspects (
+    mac        TEXT PRIMARY KEY,
+    vendor     TEXT,
+    type       TEXT,
+    first_seen TEXT,
+    last_seen  TEXT,
+    seen_count INTEGER NOT NULL DEFAULT 0,
+    max_score  REAL,
+    ssids      TEXT NOT NULL DEFAULT '[]'
+);
+CREATE INDEX IF NOT EXISTS idx_suspects_last_seen ON suspects(last_seen);
+CREATE INDEX IF NOT EXISTS idx_suspects_vendor    ON suspects(vendor);
+CREATE TABLE IF NOT EXISTS visits (
+    mac      TEXT NOT NULL,
+    lat      REAL NOT NULL,
+    lon      REAL NOT NULL,
+    first_ts TEXT NOT NULL,
+    last_ts  TEXT NOT NULL,
+    count    INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS idx_visits_mac ON visits(mac);
+"""
+
+
+def db_path_for(path):
+    """Legacy-Pfad *.json → SQLite-Datei *.db daneben."""
+    root, ext = os.path.splitext(path)
+    return root + '.db' if ext == '.json' else path
+
+
 class SuspectsDB:
-    def __init__(self, path=DEFAULT_PATH):
-        self.path = path
-        self.db = self._load()
-
-    def _load(self):
-        if os.path.exists(self.path):
-            try:
-                with open(self.path) as f:
-                    data = json.load(f)
-                log.info(f'SuspectsDB: {len(data)} bekannte Verdächtige geladen')
-                return data
-            except Exception as e:
-                log.warning(f'SuspectsDB Ladefehler: {e}')
-        return {}
+    def __init__(self, path=DEFAULT_PATH, merge_m=VISIT_MERGE_M, max_visits=MAX_VISITS):
+        self.merge_m = merge_m
+        self.max_visits = max_visits
+        self.path = db_path_for(path)
+        self.json_path = path if path != self.path else None
+        dirname = os.path.dirname(self.path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        # isolation_level=None: Transaktionen explizit über transaction()
+        self.conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(_SCHEMA)
+        self._tx_depth = 0
+        self._migrate_locations()
+        self._import_json()
+        n = self.conn.execute('SELECT COUNT(*) FROM suspects').fetchone()[0]
+        log.info(f'SuspectsDB: {n} bekannte Verdächtige ({self.path})')
+
+    # ── Legacy-Import ──────────────────────────────────────────────────────
+    def _insert_visits(self, mac, locations):
+        self.conn.executemany(
+            'INSERT INTO visits VALUES (?,?,?,?,?,?)',
+            [(mac, v['lat'], v['lon'], v['first_ts'], v['last_ts'], v['count'])
+             for v in compact_visits(locations, self.merge_m, self.max_visits)])
+
+    def _migrate_locations(self):
+        """Alte Punkt-Tabelle 'locations' (eine Zeile pro Sichtung) → Besuche."""
+        if not self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='locations'"
+                ).fetchone():
+            return
+        per_mac = {}
+        for r in self.conn.execute('SELECT mac, ts, lat, lon FROM locations ORDER BY rowid'):
+            per_mac.setdefault(r['mac'], []).append(
+                {'ts': r['ts'], 'lat': r['lat'], 'lon': r['lon']})
+        with self.transaction():
+            for mac, locs in per_mac.items():
+                self._insert_visits(mac, locs)
+            self.conn.execute('DROP TABLE locations')
+        log.info(f'SuspectsDB: Standortverlauf von {len(per_mac)} MACs zu Besuchen kompaktiert')
+
+    def _import_json(self):
+        """Einmaliger Import einer alten suspects_db.json."""
+        if not self.json_path or not os.path.exists(self.json_path):
+            return
+        try:
+            with open(self.json_path) as f:
+                data = json.load(f)
+        except Exception as e:
+            log.warning(f'SuspectsDB JSON-Import fehlgeschlagen: {e}')
+            return
+        with self.transaction():
+            for mac, e in data.items():
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO suspects VALUES (?,?,?,?,?,?,?,?)',
+                    (mac, e.get('vendor'), e.get('type'), e.get('first_seen'),
+                     e.get('last_seen'), e.get('seen_count', 1),
+                     e.get('max_score'), json.dumps(e.get('ssids', []))))
+                self._insert_visits(mac, e.get('locations', []))
+        os.replace(self.json_path, self.json_path + '.imported')
+        log.info(f'SuspectsDB: {len(data)} Einträge aus {self.json_path} importiert')
+
+    # ── Transaktionen ──────────────────────────────────────────────────────
+    @contextmanager
+    def transaction(self):
+        """
+        Bündelt alle Updates (z.B. eines Reports) in einer Transaktion.
+        Verschachtelt nutzbar - committet wird nur auf äußerster Ebene.
+        """
+        if self._tx_depth == 0:
+            self.conn.execute('BEGIN IMMEDIATE')
+        self._tx_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._tx_depth -= 1
+            if self._tx_depth == 0:
+                self.conn.execute('ROLLBACK')
+            raise
+        self._tx_depth -= 1
+        if self._tx_depth == 0:
+            self.conn.execute('COMMIT')
 
     def save(self):
-        os.makedirs(os.path.dirname(self.path), exist_ok=True)
-        with open(self.path, 'w') as f:
-            json.dump(self.db, f, indent=2)
+        """Kompatibilität: außerhalb transaction() ist jedes Update sofort persistiert."""
+        pass
+
+    def close(self):
+        self.conn.close()
+
+    # ── Abfragen ───────────────────────────────────────────────────────────
+    def _entry(self, row, with_locations=True):
+        entry = {
+            'mac': row['mac'],
+            'vendor': row['vendor'],
+            'type': row['type'],
+            'first_seen': row['first_seen'],
+            'last_seen': row['last_seen'],
+            'seen_count': row['seen_count'],
+            'max_score': row['max_score'],
+            'ssids': json.loads(row['ssids'] or '[]'),
+        }
+        if with_locations:
+            entry['locations'] = [
+                {'ts': r['last_ts'], 'lat': r['lat'], 'lon': r['lon'],
+                 'first_ts': r['first_ts'], 'last_ts': r['last_ts'],
+                 'count': r['count']}
+                for r in self.conn.execute(
+                    'SELECT * FROM visits WHERE mac=? ORDER BY rowid',
+                    (row['mac'],))]
+        return entry
 
     def is_known(self, mac):
-        return mac in self.db
+        return self.conn.execute(
+            'SELECT 1 FROM suspects WHERE mac=?', (mac,)).fetchone() is not None
 
     def get(self, mac):
-        return self.db.get(mac)
+        row = self.conn.execute('SELECT * FROM suspects WHERE mac=?', (mac,)).fetchone()
+        return self._entry(row) if row else None
 
     def update(self, mac, vendor, mac_type, score, ssids=None, lat=None, lon=None):
-        ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        if mac not in self.db:
-            self.db[mac] = {
-                'mac': mac,
-                'vendor': vendor,
-                'type': mac_type,
-                'first_seen': ts,
-                'last_seen': ts,
-                'seen_count': 1,
-                'max_score': score,
-                'ssids': list(ssids or []),
-                'locations': []
-            }
-            log.info(f'SuspectsDB: NEU {mac} ({vendor})')
-        else:
-            entry = self.db[mac]
-            entry['last_seen'] = ts
-            entry['seen_count'] += 1
-            entry['max_score'] = max(entry['max_score'], score)
-            for s in (ssids or []):
-                if s not in entry['ssids']:
-                    entry['ssids'].append(s)
-            log.info(f'SuspectsDB: UPDATE {mac} - gesehen {entry["seen_count"]}x')
-
-        if lat and lon:
-            self.db[mac]['locations'].append({
-                'ts': ts, 'lat': lat, 'lon': lon
-            })
-
-        self.save()
-        return self.db[mac]
+        ts = datetime.now().strftime(TS_FMT)
+        with self.transaction():
+            row = self.conn.execute(
+                'SELECT seen_count, max_score, ssids FROM suspects WHERE mac=?',
+                (mac,)).fetchone()
+            if row is None:
+                self.conn.execute(
+                    'INSERT INTO suspects VALUES (?,?,?,?,?,?,?,?)',
+                    (mac, vendor, mac_type, ts, ts, 1, score,
+                     json.dumps(list(ssids or []))))
+                log.info(f'SuspectsDB: NEU {mac} ({vendor})')
+            else:
+                known = json.loads(row['ssids'] or '[]')
+                for s in (ssids or []):
+                    if s not in known:
+                        known.append(s)
+                max_score = score if row['max_score'] is None else max(row['max_score'], score)
+                self.conn.execute(
+                    'UPDATE suspects SET last_seen=?, seen_count=seen_count+1, '
+                    'max_score=?, ssids=? WHERE mac=?',
+                    (ts, max_score, json.dumps(known), mac))
+                log.info(f'SuspectsDB: UPDATE {mac} - gesehen {row["seen_count"] + 1}x')
+
+            if lat and lon:
+                self._add_visit(mac, ts, lat, lon)
+        return self.get(mac)
+
+    def _add_visit(self, mac, ts, lat, lon):
+        """Sichtung an letzten Besuch anhängen oder neuen Besuch anlegen (+ Kappung)."""
+        last = self.conn.execute(
+            'SELECT rowid, lat, lon FROM visits WHERE mac=? ORDER BY rowid DESC LIMIT 1',
+            (mac,)).fetchone()
+        if last and haversine(last['lat'], last['lon'], lat, lon) <= self.merge_m:
+            self.conn.execute(
+                'UPDATE visits SET last_ts=?, count=count+1 WHERE rowid=?',
+                (ts, last['rowid']))
+            return
+        self.conn.execute('INSERT INTO visits VALUES (?,?,?,?,?,1)',
+                          (mac, round(lat, 6), round(lon, 6), ts, ts))
+        if self.max_visits:
+            self.conn.execute(
+                'DELETE FROM visits WHERE mac=? AND rowid NOT IN '
+                '(SELECT rowid FROM visits WHERE mac=? ORDER BY rowid DESC LIMIT ?)',
+                (mac, mac, self.max_visits))
 
     def was_seen_before(self, mac):
-        entry = self.db.get(mac)
-        if not entry:
-            return False
-        return entry['seen_count'] > 1
+        row = self.conn.execute(
+            'SELECT seen_count FROM suspects WHERE mac=?', (mac,)).fetchone()
+        return bool(row) and row['seen_count'] > 1
+
+    def seen_since(self, since, vendor=None):
+        """
+        Alle Verdächtigen mit last_seen >= since (datetime oder 'YYYY-mm-dd HH:MM:SS'),
+        optional gefiltert nach Vendor. Neueste zuerst, ohne Standortliste.
+        """
+        if isinstance(since, datetime):
+            since = since.strftime(TS_FMT)
+        sql = 'SELECT * FROM suspects WHERE last_seen >= ?'
+        args = [since]
+        if vendor is not None:
+            sql += ' AND vendor = ?'
+            args.append(vendor)
+        sql += ' ORDER BY last_seen DESC'
+        return [self._entry(r, with_locations=False)
+                for r in self.conn.execute(sql, args)]
 
     def summary(self):
-        return {'total': len(self.db), 'entries': self.db}
+        entries = {r['mac']: self._entry(r)
+                   for r in self.conn.execute('SELECT * FROM suspects')}
+        return {'total': len(entries), 'entries': entries}
+
+
+# ============================================================
+# MAIN
+# ============================================================
+if __name__ == '__main__':
+    import argparse
+    from datetime import timedelta
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    parser = argparse.ArgumentParser(description='SuspectsDB abfragen')
+    parser.add_argument('--db', default=DEFAULT_PATH)
+    parser.add_argument('--days', type=float, default=7,
+                        help='Verdächtige der letzten N Tage')
+    parser.add_argument('--vendor', default=None)
+    args = parser.parse_args()
+
+    db = SuspectsDB(args.db)
+    for e in db.seen_since(datetime.now() - timedelta(days=args.days), args.vendor):
+        print(f'{e["mac"]}  {e["last_seen"]}  {e["seen_count"]:>4}x  '
+              f'{e["max_score"] or 0:.2f}  {e["vendor"] or "?"}')
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+time_join.py - Zeitliche Joins zwischen Geräten, GPS-Clustern und Ereignissen
+Ersetzt verschachtelte Schleifen (jedes Gerät × jeder Cluster) durch einen
+Endpunkt-Sweep über zeitlich sortierte Intervalle:
+  overlap_join: Geräte-Zeitfenster [first_seen, last_seen] gegen
+                Cluster-Zeitspannen [start_time, end_time]
+                O((N+M) log(N+M) + Treffer) statt O(N·M)
+  window_join:  Ereignisse (Cell-Anomalien, Silent SMS) gegen Sichtungen
+                (Reports) innerhalb ±window Sekunden - Zwei-Zeiger-Join
+                über beide zeitlich sortierten Ströme, linear nach Sortierung
+"""
+import heapq
+import logging
+from bisect import bisect_right
+
+log = logging.getLogger('CYT-TimeJoin')
+
+
+def overlap_join(queries, intervals):
+    """
+    Alle Intervalle, die sich mit dem Zeitfenster einer Abfrage überschneiden
+    (inklusive Grenzen: q_start <= i_end und q_end >= i_start).
+
+    queries:   Iterable von (key, start, end)
+    intervals: Liste von (start, end)
+    Returns:   {key: [Intervall-Indizes aufsteigend]} - nur Keys mit Treffern
+
+    Sweep über die Abfragen nach Startzeit: aktive Intervalle (begonnen, noch
+    nicht beendet) liegen in einem Heap nach Endzeit und werden verworfen,
+    sobald sie vor dem Abfragestart enden. Dazu kommen die Intervalle, die
+    innerhalb des Abfragefensters beginnen.
+    """
+    order = sorted(range(len(intervals)), key=lambda i: intervals[i][0])
+    starts = [intervals[i][0] for i in order]
+
+    result = {}
+    active = {}          # Intervall-Index → True
+    ends = []            # Heap (end, index)
+    ptr = 0
+    for key, q_start, q_end in sorted(queries, key=lambda q: q[1]):
+        if q_end < q_start:
+            # Inkonsistentes Fenster - direkt prüfen (selten)
+            hits = [order[k] for k in range(bisect_right(starts, q_end))
+                    if intervals[order[k]][1] >= q_start]
+            if hits:
+                result[key] = sorted(hits)
+            continue
+
+        # Alle bis q_start begonnenen Intervalle aktivieren
+        while ptr < len(order) and starts[ptr] <= q_start:
+            i = order[ptr]
+            active[i] = True
+            heapq.heappush(ends, (intervals[i][1], i))
+            ptr += 1
+        # Vor q_start beendete Intervalle verwerfen
+        while ends and ends[0][0] < q_start:
+            _, i = heapq.heappop(ends)
+            active.pop(i, None)
+
+        hits = list(active)
+        # Intervalle die innerhalb des Fensters beginnen
+        k = ptr
+        while k < len(order) and starts[k] <= q_end:
+            hits.append(order[k])
+            k += 1
+        if hits:
+            result[key] = sorted(hits)
+    return result
+
+
+def window_join(event_times, sighting_times, window_sec):
+    """
+    Für jedes Ereignis alle Sichtungen mit |t_sichtung - t_ereignis| <= window_sec.
+
+    event_times:    Liste von Zeitpunkten (Epoch-Sekunden)
+    sighting_times: Liste von Zeitpunkten (Epoch-Sekunden)
+    Returns:        Liste (Ereignis-Reihenfolge) von Listen mit Sichtungs-
+                    Indizes (zeitlich aufsteigend)
+
+    Beide Ströme werden einmal sortiert; der untere Fensterzeiger läuft nur
+    vorwärts, pro Ereignis werden nur Sichtungen im Fenster angefasst.
+    """
+    ev_order = sorted(range(len(event_times)), key=event_times.__getitem__)
+    s_order = sorted(range(len(sighting_times)), key=sighting_times.__getitem__)
+    s_times = [sighting_times[i] for i in s_order]
+    n = len(s_times)
+
+    result = [[] for _ in event_times]
+    lo = 0
+    for e in ev_order:
+        t = event_times[e]
+        while lo < n and s_times[lo] < t - window_sec:
+            lo += 1
+        hi = lo
+        while hi < n and s_times[hi] <= t + window_sec:
+            hi += 1
+        result[e] = s_order[lo:hi]
+    return result
+
+
+# ============================================================
+# MAIN (Test)
+# ============================================================
+if __name__ == '__main__':
+    import random
+    import time
+
+    clusters = []
+    t = 0
+    for _ in range(500):
+        dur = random.randint(60, 3600)
+        clusters.append((t, t + dur))
+        t += dur + random.randint(0, 600)
+    devices = []
+    for n in range(2000):
+        a = random.randint(0, t)
+        devices.append((f'dev{n}', a, a + random.randint(0, 7200)))
+
+    t0 = time.time()
+    fast = overlap_join(devices, clusters)
+    t1 = time.time()
+    slow = {}
+    for key, a, b in devices:
+        hits = [i for i, (cs, ce) in enumerate(clusters) if a <= ce and b >= cs]
+        if hits:
+            slow[key] = hits
+    t2 = time.time()
+    print(f'overlap_join: {t1 - t0:.3f}s  naiv: {t2 - t1:.3f}s  '
+          f'identisch: {fast == slow}')
+
+    events = [random.uniform(0, 72 * 3600) for _ in range(50000)]
+    reports = [random.uniform(0, 72 * 3600) for _ in range(300)]
+    t0 = time.time()
+    joined = window_join(events, reports, 300)
+    t1 = time.time()
+    naive = [sorted((i for i, r in enumerate(reports) if abs(r - e) <= 300),
+                    key=reports.__getitem__) for e in events[:2000]]
+    print(f'window_join: {t1 - t0:.3f}s für {len(events)} Ereignisse  '
+          f'identisch: {joined[:2000] == naive}')
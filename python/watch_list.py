@@ -2,47 +2,138 @@
 watch_list.py - Beobachtungsliste mit statischer/dynamischer Erkennung
 STATIC:  Gerät nur an bekanntem Ort erwartet (Nachbar, Hotel, Arbeit)
 DYNAMIC: Gerät folgt mir = Tracking!
+seen_locations ist ein kompakter Besuchsverlauf (geo.add_visit):
+{lat, lon, first_ts, last_ts, count, ts}, gekappt auf max_visits.
+places: persistente Ortscluster (Leader, 500 m) pro Gerät - eine neue
+Sichtung wird in O(Cluster) zugeordnet statt den ganzen Verlauf neu zu
+clustern. check_many()/get_all_alerts() schreiben die Datei einmal.
+Speichern über shared_state: Lock, aktuellen Dateistand lesen, eigene
+Änderungen (neue Geräte, Sichtungen) darauf anwenden, atomisch ersetzen.
+Statische Zonen aller Geräte (+ config.json known_zones) liegen in einem
+geo.ZoneIndex, der einmal pro Lauf gebaut wird (build_zone_index).
+Statische Geräte ohne eigene Zone werden gegen die known_zones geprüft
+(Orte des Nutzers: Zuhause, Arbeit, ...). check_many() fragt die Zonen
+aller statischen Geräte in einem containing_many()-Aufruf ab.
 """
-import json
-import os
-import math
+import copy
 import logging
 from datetime import datetime
+from geo import haversine, ZoneIndex, add_visit, compact_visits, VISIT_MERGE_M, MAX_VISITS
+from shared_state import JsonState
 
 log = logging.getLogger(__name__)
 
 DEFAULT_PATH = '/root/loot/chasing_your_tail/watch_list.json'
 
-def haversine(lat1, lon1, lat2, lon2):
-    """Abstand in Metern zwischen zwei GPS-Koordinaten"""
-    R = 6371000
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlam = math.radians(lon2 - lon1)
-    a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlam/2)**2
-    return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+# Min. Abstand zweier Orte für Tracking-Erkennung (dynamic)
+DYNAMIC_PLACE_M = 500
+# Eigentümer der config.json known_zones im Zonenindex
+CONFIG_ZONES = 'config'
+
+
+def assign_place(places, lat, lon, n=1):
+    """Sichtung dem ersten Ortscluster < DYNAMIC_PLACE_M zuordnen oder neuen anlegen."""
+    for p in places:
+        if haversine(lat, lon, p['lat'], p['lon']) < DYNAMIC_PLACE_M:
+            p['count'] += n
+            return p
+    places.append({'lat': round(lat, 6), 'lon': round(lon, 6), 'count': n})
+    return places[-1]
+
 
 class WatchList:
-    def __init__(self, path=DEFAULT_PATH):
+    def __init__(self, path=DEFAULT_PATH, merge_m=VISIT_MERGE_M, max_visits=MAX_VISITS):
         self.path = path
+        self.merge_m = merge_m
+        self.max_visits = max_visits
+        self.zone_index = None
+        self.config_zones = []
+        self._zone_cfg = ((), 100)
+        # Änderungen seit dem letzten save(): ('add', mac, entry) /
+        # ('sighting', mac, ts, lat, lon) - werden beim Speichern auf den
+        # aktuellen Dateistand angewendet (andere Prozesse gehen nicht verloren)
+        self._pending = []
+        self._state = JsonState(path, indent=2)
         self.devices = self._load()
 
+    def _normalize(self, devices):
+        """Alte Punktlisten kompaktieren, fehlende Ortscluster aufbauen."""
+        for entry in devices.values():
+            # Alte Punktlisten ({ts, lat, lon} pro Sichtung) kompaktieren
+            locs = entry.get('seen_locations') or []
+            if any('count' not in loc for loc in locs) or len(locs) > self.max_visits:
+                entry['seen_locations'] = compact_visits(
+                    locs, self.merge_m, self.max_visits)
+            # Ortscluster einmalig aus dem Verlauf aufbauen
+            if 'places' not in entry:
+                entry['places'] = []
+                for loc in entry.get('seen_locations', []):
+                    assign_place(entry['places'], loc['lat'], loc['lon'],
+                                 loc.get('count', 1))
+        return devices
+
     def _load(self):
-        if os.path.exists(self.path):
-            try:
-                with open(self.path) as f:
-                    data = json.load(f)
-                devices = data.get('watched_devices', {})
+        try:
+            data = self._state.load(force=True)
+            devices = self._normalize(data.get('watched_devices', {}))
+            if devices:
                 log.info(f'WatchList: {len(devices)} Geräte geladen')
-                return devices
-            except Exception as e:
-                log.warning(f'WatchList Ladefehler: {e}')
+            return devices
+        except Exception as e:
+            log.warning(f'WatchList Ladefehler: {e}')
         return {}
 
+    def _record(self, entry, op):
+        if op[0] == 'add':
+            return op[2]
+        _, mac, ts, lat, lon = op
+        add_visit(entry.setdefault('seen_locations', []), ts, lat, lon,
+                  self.merge_m, self.max_visits)
+        assign_place(entry.setdefault('places', []), lat, lon)
+        return entry
+
+    def refresh(self):
+        """Neu laden, falls ein anderer Prozess die Datei geändert hat."""
+        if self._state.changed():
+            if self._pending:
+                self.save()
+            else:
+                self.devices = self._load()
+                if self.zone_index is not None:
+                    self.build_zone_index(*self._zone_cfg)
+
     def save(self):
-        os.makedirs(os.path.dirname(self.path), exist_ok=True)
-        with open(self.path, 'w') as f:
-            json.dump({'watched_devices': self.devices}, f, indent=2)
+        """
+        Unter Lock: aktuellen Dateistand lesen, eigene Änderungen darauf
+        anwenden, atomisch schreiben.
+        """
+        with self._state.update() as data:
+            devices = self._normalize(data.setdefault('watched_devices', {}))
+            for op in self._pending:
+                mac = op[1]
+                if op[0] == 'add' or mac in devices:
+                    devices[mac] = self._record(devices.get(mac), op)
+        self._pending = []
+        self.devices = devices
+        if self.zone_index is not None:
+            self.build_zone_index(*self._zone_cfg)
+
+    def build_zone_index(self, config_zones=(), default_radius_m=100):
+        """
+        Zonenindex aus den known_locations aller Geräte (Eigentümer = MAC)
+        und optional den known_zones aus config.json (Eigentümer
+        CONFIG_ZONES) - für statische Geräte ohne eigene Zone.
+        """
+        self._zone_cfg = (config_zones, default_radius_m)
+        idx = ZoneIndex(default_radius_m=default_radius_m)
+        self.config_zones = [z for z in config_zones
+                             if idx.add(z, owner=CONFIG_ZONES) is not None]
+        for mac, entry in self.devices.items():
+            for z in entry.get('known_locations', []):
+                idx.add(z, owner=mac)
+        self.zone_index = idx
+        log.debug(f'WatchList: Zonenindex mit {len(idx)} Zonen')
+        return idx
 
     def is_watched(self, mac):
         return mac in self.devices
@@ -59,7 +150,8 @@ class WatchList:
             'type': watch_type,  # 'static' oder 'dynamic'
             'first_seen': ts,
             'notes': notes,
-            'seen_locations': []
+            'seen_locations': [],
+            'places': []
         }
         if watch_type == 'static' and lat and lon:
             entry['known_locations'] = [{
@@ -72,15 +164,27 @@ class WatchList:
             entry['known_locations'] = []
 
         self.devices[mac] = entry
+        self._pending.append(('add', mac, copy.deepcopy(entry)))
+        if self.zone_index is not None:
+            for z in entry['known_locations']:
+                self.zone_index.add(z, owner=mac)
         self.save()
         log.info(f'WatchList: {mac} hinzugefügt als {watch_type} - {label}')
         return entry
 
-    def check(self, mac, cur_lat=None, cur_lon=None):
+    def _zone_owner(self, mac):
+        """Eigentümer der Zonen, gegen die ein statisches Gerät geprüft wird."""
+        if self.devices[mac].get('known_locations'):
+            return mac
+        return CONFIG_ZONES if self.config_zones else None
+
+    def check(self, mac, cur_lat=None, cur_lon=None, persist=True, zone_hits=None):
         """
         Prüft Gerät gegen Watch-List.
         Gibt zurück: dict mit status, alert, message
         Status: 'static_ok', 'static_alarm', 'dynamic_ok', 'dynamic_alarm', 'not_watched'
+        persist=False: Standort nur im Speicher vermerken (save() später).
+        zone_hits: vorab ermittelte Zonentreffer (check_many).
         """
         if mac not in self.devices:
             return {'status': 'not_watched', 'alert': False, 'message': ''}
@@ -92,20 +196,22 @@ class WatchList:
         # Standort speichern
         if cur_lat and cur_lon:
             ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            entry['seen_locations'].append({
-                'ts': ts, 'lat': cur_lat, 'lon': cur_lon
-            })
-            self.save()
+            op = ('sighting', mac, ts, cur_lat, cur_lon)
+            self._record(entry, op)
+            self._pending.append(op)
+            if persist:
+                self.save()
 
         if watch_type == 'static':
-            return self._check_static(entry, label, cur_lat, cur_lon)
+            return self._check_static(mac, entry, label, cur_lat, cur_lon, zone_hits)
         else:
             return self._check_dynamic(entry, label, cur_lat, cur_lon)
 
-    def _check_static(self, entry, label, cur_lat, cur_lon):
-        """Statisches Gerät - nur an bekanntem Ort erwartet"""
-        known = entry.get('known_locations', [])
-
+    def _check_static(self, mac, entry, label, cur_lat, cur_lon, hits=None):
+        """
+        Statisches Gerät - nur an bekanntem Ort erwartet: eigene Zonen,
+        sonst die known_zones aus config.json.
+        """
         # Kein GPS verfügbar - kann nicht prüfen
         if not cur_lat or not cur_lon:
             return {
@@ -115,25 +221,30 @@ class WatchList:
             }
 
         # Keine bekannten Zonen definiert
-        if not known:
+        if self.zone_index is None:
+            self.build_zone_index()
+        owner = self._zone_owner(mac)
+        if owner is None:
             return {
                 'status': 'static_ok',
                 'alert': False,
                 'message': f'{label}: Beobachtet (keine Zone definiert)'
             }
 
-        # In einer bekannten Zone?
-        for zone in known:
-            dist = haversine(cur_lat, cur_lon, zone['lat'], zone['lon'])
-            if dist <= zone.get('radius_m', 100):
-                return {
-                    'status': 'static_ok',
-                    'alert': False,
-                    'message': f'{label}: In Zone "{zone["name"]}" ({dist:.0f}m)'
-                }
+        # In einer bekannten Zone? (nächste enthaltende Zone)
+        if hits is None:
+            hits = self.zone_index.containing(cur_lat, cur_lon, owner=owner)
+        if hits:
+            zone, dist = hits[0]
+            return {
+                'status': 'static_ok',
+                'alert': False,
+                'message': f'{label}: In Zone "{zone["name"]}" ({dist:.0f}m)'
+            }
 
         # Außerhalb aller bekannten Zonen!
-        zone_names = ', '.join(z['name'] for z in known)
+        known = entry['known_locations'] if owner == mac else self.config_zones
+        zone_names = ', '.join(z.get('name', '?') for z in known)
         return {
             'status': 'static_alarm',
             'alert': True,
@@ -142,45 +253,57 @@ class WatchList:
 
     def _check_dynamic(self, entry, label, cur_lat, cur_lon):
         """Dynamisches Gerät - Tracking-Erkennung"""
-        locations = entry.get('seen_locations', [])
+        places = entry.get('places', [])
+        sightings = sum(p['count'] for p in places)
 
-        # Weniger als 2 verschiedene Orte - noch unauffällig
-        if len(locations) < 2:
+        # Weniger als 2 Sichtungen - noch unauffällig
+        if sightings < 2:
             return {
                 'status': 'dynamic_ok',
                 'alert': False,
                 'message': f'{label}: Beobachtet (1 Standort)'
             }
 
-        # Verschiedene Orte prüfen - min. 500m Abstand = neuer Ort
-        unique_locations = [locations[0]]
-        for loc in locations[1:]:
-            is_new = True
-            for known_loc in unique_locations:
-                dist = haversine(loc['lat'], loc['lon'],
-                               known_loc['lat'], known_loc['lon'])
-                if dist < 500:
-                    is_new = False
-                    break
-            if is_new:
-                unique_locations.append(loc)
-
-        if len(unique_locations) >= 2:
+        # Verschiedene Orte (persistente Cluster, min. 500m Abstand)
+        if len(places) >= 2:
             return {
                 'status': 'dynamic_alarm',
                 'alert': True,
-                'message': f'{label}: TRACKING ERKANNT! An {len(unique_locations)} verschiedenen Orten gesehen!'
+                'message': f'{label}: TRACKING ERKANNT! An {len(places)} verschiedenen Orten gesehen!'
             }
 
         return {
             'status': 'dynamic_ok',
             'alert': False,
-            'message': f'{label}: Beobachtet ({len(locations)} Sichtungen, 1 Ort)'
+            'message': f'{label}: Beobachtet ({sightings} Sichtungen, 1 Ort)'
         }
 
-    def get_all_alerts(self, cur_lat=None, cur_lon=None):
-        """Alle Watch-List Einträge prüfen und Alarme zurückgeben"""
+    def check_many(self, positions):
+        """
+        Mehrere Geräte prüfen, Datei höchstens einmal schreiben.
+        positions: Iterable von (mac, lat, lon). Returns: {mac: Ergebnis}
+        """
+        self.refresh()
+        positions = list(positions)
+        if self.zone_index is None:
+            self.build_zone_index()
+        # Zonen aller statischen Geräte mit Position in einem Aufruf
+        queries = []
+        for mac, lat, lon in positions:
+            entry = self.devices.get(mac)
+            if entry and entry.get('type') == 'static' and lat and lon:
+                owner = self._zone_owner(mac)
+                if owner is not None:
+                    queries.append((mac, lat, lon, owner))
+        zone_hits = self.zone_index.containing_many(queries)
         results = {}
-        for mac in self.devices:
-            results[mac] = self.check(mac, cur_lat, cur_lon)
+        for mac, lat, lon in positions:
+            results[mac] = self.check(mac, lat, lon, persist=False,
+                                      zone_hits=zone_hits.get(mac))
+        if self._pending:
+            self.save()
         return results
+
+    def get_all_alerts(self, cur_lat=None, cur_lon=None):
+        """Alle Watch-List Einträge prüfen und Alarme zurückgeben"""
+        return self.check_many((mac, cur_lat, cur_lon) for mac in list(self.devices))
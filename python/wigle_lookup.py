@@ -3,17 +3,94 @@
 wigle_lookup.py - WiGLE API Integration für Chasing Your Tail NG
 Sucht MAC, BT-Adresse und SSIDs in der WiGLE Datenbank.
 v4.5: Nearby-Search – bekannte Geräte in GPS-Radius abfragen.
+Antworten landen in einem PersistentCache (disk_cache.py): TTL je Abfrageart,
+leere Ergebnisse und Client-Fehler als Negativ-Einträge mit kurzer TTL,
+Journal statt Komplett-Rewrite nach jedem Request.
+WiGLEScheduler: sammelt alle MAC/BT/SSID-Abfragen eines Reports vorab,
+dedupliziert sie, arbeitet sie nach Priorität (Watch-List, Score) unter
+Token-Bucket und Zeitbudget ab und verteilt die Ergebnisse auf die Geräte.
+offline= (wigle_offline.WiGLEOffline): MAC-, SSID- und Nearby-Suche zuerst
+lokal, die API nur bei einem Miss. Ohne API-Token rein offline.
+Nearby-Abfragen gehen kachelweise an die API (festes Raster TILE_DEG,
+Cache je Kachel) - Reports ein paar Meter weiter nutzen dieselben Kacheln.
 """
-import urllib.request, urllib.parse, json, logging, base64, time, os
+import urllib.parse, json, logging, base64, time, os, math
+import http_pool
+from disk_cache import PersistentCache, MISS
+from geo import distances_from
 
 log = logging.getLogger('CYT-WiGLE')
 
 WIGLE_BASE    = 'https://api.wigle.net/api/v2'
 CACHE_FILE    = '/root/loot/chasing_your_tail/wigle_cache.json'
-RATE_LIMIT    = 1.5  # Sekunden zwischen Anfragen
+RATE_LIMIT    = 1.5  # Sekunden zwischen Anfragen (Dauerrate)
+RATE_BURST    = 3    # Anfragen am Stück, bevor RATE_LIMIT greift
+BUDGET_S      = 90   # Zeitbudget je Report/Scheduler-Lauf
+RETRY_STATUS  = (500, 502, 503, 504)   # 429 = Tages-Quota, Retry zwecklos
+PRIORITY_WATCHED = 10.0  # Watch-List-Alarme vor allen Verdächtigen (Score 0..1)
+PRIORITY_NEARBY  = 1.0   # Nearby-Abgleich nach Watch-List, vor Verdächtigen
+
+# Cache-TTLs (Sekunden)
+TTL_MAC       = 30 * 86400   # WiFi/BT-MAC: Standort ändert sich selten
+TTL_SSID      = 7 * 86400
+TTL_NEARBY    = 3 * 86400
+TTL_EMPTY     = 86400        # Erfolgreiche Abfrage ohne Treffer
+TTL_ERROR     = 3600         # HTTP 4xx (außer 429) - nicht sofort wiederholen
+CACHE_MAX     = 5000         # LRU-Obergrenze
+
+# Nearby-Kacheln: 0.005° (~555 m Nord-Süd, ~370 m Ost-West bei 48°N)
+TILE_DEG      = 0.005
+MAX_TILES     = 16           # größere Radien: gröbere Kacheln statt vieler Abfragen
+
+def nearby_tiles(lat, lon, radius_m, tile_deg=TILE_DEG):
+    """
+    Kacheln (lat_min, lat_max, lon_min, lon_max), die den Radius um
+    (lat, lon) überdecken. Kachelgrenzen liegen auf einem festen Raster
+    (Vielfache von tile_deg) → gleiche Cache-Keys für nahe Positionen.
+    """
+    lat_delta = radius_m / 111_000.0
+    lon_delta = radius_m / (111_000.0 * max(math.cos(math.radians(lat)), 0.01))
+    while True:
+        y0 = math.floor((lat - lat_delta) / tile_deg)
+        y1 = math.floor((lat + lat_delta) / tile_deg)
+        x0 = math.floor((lon - lon_delta) / tile_deg)
+        x1 = math.floor((lon + lon_delta) / tile_deg)
+        if (y1 - y0 + 1) * (x1 - x0 + 1) <= MAX_TILES:
+            break
+        tile_deg *= 2
+    return [(round(y * tile_deg, 6), round((y + 1) * tile_deg, 6),
+             round(x * tile_deg, 6), round((x + 1) * tile_deg, 6))
+            for y in range(y0, y1 + 1) for x in range(x0, x1 + 1)]
+
+class TokenBucket:
+    """Token-Bucket: rate Anfragen/s im Mittel, bis zu burst am Stück."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.stamp = time.monotonic()
+
+    def acquire(self, deadline=None):
+        """
+        Ein Token nehmen, ggf. warten. deadline (time.monotonic()): False
+        statt zu warten, wenn das Token erst danach verfügbar wäre.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        if deadline is not None and now + wait > deadline:
+            return False
+        if wait:
+            time.sleep(wait)
+            self.tokens += wait * self.rate
+            self.stamp = now + wait
+        self.tokens -= 1
+        return True
 
 class WiGLEClient:
-    def __init__(self, api_name, api_token):
+    def __init__(self, api_name, api_token, budget_s=BUDGET_S, offline=None):
         credentials = base64.b64encode(
             f'{api_name}:{api_token}'.encode()
         ).decode()
@@ -21,106 +98,163 @@ class WiGLEClient:
             'Authorization': f'Basic {credentials}',
             'Accept': 'application/json'
         }
-        self._last_request = 0
-        self._cache = self._load_cache()
-
-    def _load_cache(self):
-        if os.path.exists(CACHE_FILE):
-            try:
-                with open(CACHE_FILE) as f:
-                    return json.load(f)
-            except Exception:
-                pass
-        return {}
-
-    def _save_cache(self):
-        os.makedirs(os.path.dirname(CACHE_FILE), exist_ok=True)
-        with open(CACHE_FILE, 'w') as f:
-            json.dump(self._cache, f)
+        self.online = bool(api_name and api_token)
+        self.offline = offline
+        self.bucket = TokenBucket(1 / RATE_LIMIT, RATE_BURST)
+        self.budget_s = budget_s
+        self.deadline = None      # vom Scheduler gesetzt (time.monotonic())
+        self.skipped = 0
+        self._cache = PersistentCache(CACHE_FILE, default_ttl=TTL_SSID,
+                                      max_entries=CACHE_MAX)
+
+    def flush(self):
+        """Neue Cache-Einträge schreiben (einmal am Ende des Laufs)."""
+        self._cache.flush()
+        log.info(f'WiGLE-Cache: {self._cache.hits} Treffer, '
+                 f'{self._cache.misses} Abfragen')
 
     def _rate_limit(self):
-        elapsed = time.time() - self._last_request
-        if elapsed < RATE_LIMIT:
-            time.sleep(RATE_LIMIT - elapsed)
-        self._last_request = time.time()
+        """True = Anfrage darf raus; False = Zeitbudget reicht nicht mehr."""
+        return self.bucket.acquire(self.deadline)
 
-    def _get(self, endpoint, params):
+    def _get(self, endpoint, params, ttl=TTL_SSID):
         cache_key = f'{endpoint}?{urllib.parse.urlencode(params)}'
-        if cache_key in self._cache:
+        data = self._cache.get(cache_key)
+        if data is not MISS:
             log.debug(f'Cache hit: {cache_key}')
-            return self._cache[cache_key]
+            return data
+        if not self.online:
+            return None
 
-        self._rate_limit()
+        if not self._rate_limit():
+            log.debug(f'Zeitbudget erschöpft, übersprungen: {cache_key}')
+            self.skipped += 1
+            return None
         url = f'{WIGLE_BASE}{endpoint}?{urllib.parse.urlencode(params)}'
         try:
-            req = urllib.request.Request(url, headers=self.headers)
-            resp = urllib.request.urlopen(req, timeout=10)
-            data = json.loads(resp.read().decode())
-            self._cache[cache_key] = data
-            self._save_cache()
-            return data
+            data = http_pool.get_json(url, headers=self.headers, timeout=10,
+                                      retry_status=RETRY_STATUS)
+        except http_pool.HTTPError as e:
+            log.warning(f'WiGLE Fehler: {e}')
+            # 429 (Quota) und 5xx nicht cachen - später erneut versuchen
+            if 400 <= e.code < 500 and e.code != 429:
+                self._cache.put(cache_key, None, TTL_ERROR)
+            return None
         except Exception as e:
             log.warning(f'WiGLE Fehler: {e}')
             return None
+        # success=false (z.B. Tageslimit) nicht cachen
+        if data.get('success'):
+            self._cache.put(cache_key, data, ttl if data.get('results') else TTL_EMPTY)
+        return data
 
     def search_wifi_mac(self, mac):
         """Sucht WiFi-Gerät anhand MAC-Adresse."""
+        if self.offline:
+            hit = self.offline.network(mac, 'wifi')
+            if hit:
+                return hit
         data = self._get('/network/search', {
             'netid': mac.upper().replace(':', '%3A'),
             'resultsPerPage': 1
-        })
+        }, TTL_MAC)
         return self._parse_network(data, 'wifi')
 
     def search_bt_mac(self, mac):
         """Sucht Bluetooth-Gerät anhand MAC-Adresse."""
+        if self.offline:
+            hit = self.offline.network(mac, 'bt')
+            if hit:
+                return hit
         data = self._get('/bluetooth/search', {
             'netid': mac.upper().replace(':', '%3A'),
             'resultsPerPage': 1
-        })
+        }, TTL_MAC)
         return self._parse_network(data, 'bt')
 
     def search_ssid(self, ssid):
         """Sucht SSID in WiGLE."""
+        if self.offline:
+            hit = self.offline.ssid(ssid)
+            if hit:
+                return hit
         data = self._get('/network/search', {
             'ssid': ssid,
             'resultsPerPage': 3
-        })
+        }, TTL_SSID)
         return self._parse_network(data, 'ssid')
 
+    def search_ssid_locations(self, ssid, lat_min=-90, lat_max=90,
+                              lon_min=-180, lon_max=180, max_results=5):
+        """Sucht SSID in einem Bereich, gibt Standortliste zurück (Probe-Analyse)."""
+        data = self._get('/network/search', {
+            'ssid':           ssid,
+            'latrange1':      lat_min,
+            'latrange2':      lat_max,
+            'longrange1':     lon_min,
+            'longrange2':     lon_max,
+            'resultsPerPage': max_results,
+        }, TTL_SSID)
+        if not data or not data.get('success'):
+            return []
+        locations = []
+        for r in data.get('results', []):
+            if r.get('trilat') and r.get('trilong'):
+                locations.append({
+                    'ssid':       r.get('ssid', ssid),
+                    'bssid':      r.get('netid', ''),
+                    'lat':        r['trilat'],
+                    'lon':        r['trilong'],
+                    'lastupdt':   r.get('lastupdt', ''),
+                    'encryption': r.get('encryption', 'unknown'),
+                })
+        log.info(f"WiGLE: '{ssid}' → {len(locations)} Standorte")
+        return locations
+
     def search_nearby(self, lat, lon, radius_m=200):
         """
         Sucht alle WiGLE-bekannten WiFi-Netze in einem Radius um GPS-Position.
         radius_m: Suchradius in Metern (empfohlen: 100-500m).
         Gibt Liste von {ssid, netid, lat, lon, last_seen} zurück.
         """
-        import math
-        # Grad-Offset für Radius: 1° Lat ≈ 111km, 1° Lon ≈ 111km * cos(lat)
-        lat_delta = radius_m / 111_000.0
-        lon_delta = radius_m / (111_000.0 * max(math.cos(math.radians(lat)), 0.01))
-
-        data = self._get('/network/search', {
-            'latrange1':     lat - lat_delta,
-            'latrange2':     lat + lat_delta,
-            'longrange1':    lon - lon_delta,
-            'longrange2':    lon + lon_delta,
-            'resultsPerPage': 100,
-            'onlymine':      'false',
-        })
-        if not data or not data.get('success'):
-            return []
-
-        results = []
-        for r in data.get('results', []):
-            results.append({
-                'ssid':      r.get('ssid', ''),
-                'netid':     r.get('netid', '').upper().replace('-', ':'),
-                'lat':       r.get('trilat', 0),
-                'lon':       r.get('trilong', 0),
-                'last_seen': r.get('lasttime', '')[:10],
-                'type':      'wifi',
-            })
-        log.info(f'WiGLE Nearby ({radius_m}m): {len(results)} Netze in Datenbank')
-        return results
+        if self.offline:
+            local = self.offline.nearby(lat, lon, radius_m)
+            if local:
+                log.info(f'WiGLE Nearby offline ({radius_m}m): {len(local)} Netze')
+                return local
+        # Abdeckende Kacheln abfragen (je Kachel gecacht), dann exakt filtern
+        results = {}
+        tiles = nearby_tiles(lat, lon, radius_m)
+        for lat1, lat2, lon1, lon2 in tiles:
+            data = self._get('/network/search', {
+                'latrange1':     f'{lat1:.6f}',
+                'latrange2':     f'{lat2:.6f}',
+                'longrange1':    f'{lon1:.6f}',
+                'longrange2':    f'{lon2:.6f}',
+                'resultsPerPage': 100,
+                'onlymine':      'false',
+            }, TTL_NEARBY)
+            if not data or not data.get('success'):
+                continue
+            rows = data.get('results', [])
+            dists = distances_from(lat, lon, ((r.get('trilat', 0), r.get('trilong', 0))
+                                              for r in rows))
+            for r, d in zip(rows, dists):
+                netid = r.get('netid', '').upper().replace('-', ':')
+                if netid in results or d > radius_m:
+                    continue
+                r_lat, r_lon = r.get('trilat', 0), r.get('trilong', 0)
+                results[netid] = {
+                    'ssid':      r.get('ssid', ''),
+                    'netid':     netid,
+                    'lat':       r_lat,
+                    'lon':       r_lon,
+                    'last_seen': r.get('lasttime', '')[:10],
+                    'type':      'wifi',
+                }
+        log.info(f'WiGLE Nearby ({radius_m}m, {len(tiles)} Kacheln): '
+                 f'{len(results)} Netze in Datenbank')
+        return list(results.values())
 
     def _parse_network(self, data, ntype):
         if not data or not data.get('success'):
@@ -159,33 +293,143 @@ def format_location(result):
     loc = ', '.join(parts) if parts else f'{result["lat"]:.4f}, {result["lon"]:.4f}'
     return f'{loc} (zuletzt: {result.get("last_seen","?")[:10]})'
 
+class WiGLEScheduler:
+    """
+    Sammelt WiGLE-Abfragen (add/add_device), führt jede Abfrage einmal aus
+    (run) und verteilt die Ergebnisse (device_results/result).
+    Reihenfolge: höchste Priorität zuerst, bei Gleichstand MAC vor BT vor
+    SSID und häufig angefragte SSIDs zuerst. Cache-Treffer kosten weder
+    Token noch Zeit; ist das Budget aufgebraucht, bleiben restliche
+    Netz-Abfragen offen (pending) statt als "nicht gefunden" zu zählen.
+    """
+
+    _KIND_ORDER = {'wifi': 0, 'bt': 1, 'nearby': 2, 'ssid': 3, 'ssid_loc': 4}
+
+    def __init__(self, client, budget_s=None):
+        self.client = client
+        self.budget_s = client.budget_s if budget_s is None else budget_s
+        self._queries = {}    # (kind, arg) → [priority, anzahl Anfragender]
+        self._devices = {}    # mac → {'wifi': key, 'bt': key, 'ssids': {ssid: key}}
+        self._results = {}
+        self._failed = set()
+        self.requested = 0
+
+    def add(self, kind, arg, priority=0.0):
+        """Abfrage vormerken; kind: wifi | bt | ssid | ssid_loc | nearby. Returns: key."""
+        key = (kind, arg)
+        self.requested += 1
+        q = self._queries.get(key)
+        if q is None:
+            self._queries[key] = [priority, 1]
+        else:
+            q[0] = max(q[0], priority)
+            q[1] += 1
+        return key
+
+    def add_device(self, mac, ssids, bt_mac=None, priority=0.0):
+        """Alle Abfragen eines Geräts vormerken (wie bisher max. 5 SSIDs)."""
+        dev = self._devices.setdefault(mac, {'ssids': {}})
+        dev['wifi'] = self.add('wifi', mac, priority)
+        if bt_mac:
+            dev['bt'] = self.add('bt', bt_mac, priority)
+        for ssid in [s for s in ssids if s and len(s) > 2][:5]:
+            dev['ssids'][ssid] = self.add('ssid', ssid, priority)
+
+    def _call(self, kind, arg):
+        c = self.client
+        if kind == 'wifi':
+            return c.search_wifi_mac(arg)
+        if kind == 'bt':
+            return c.search_bt_mac(arg)
+        if kind == 'ssid':
+            return c.search_ssid(arg)
+        if kind == 'ssid_loc':
+            ssid, bounds, max_results = arg
+            return c.search_ssid_locations(ssid, *bounds, max_results=max_results)
+        if kind == 'nearby':
+            lat, lon, radius_m = arg
+            return c.search_nearby(lat, lon, radius_m)
+        raise ValueError(f'Unbekannte WiGLE-Abfrage: {kind}')
+
+    def run(self):
+        """Alle offenen Abfragen ausführen. Returns: {(kind, arg): Ergebnis}."""
+        order = sorted((k for k in self._queries if k not in self._results),
+                       key=lambda k: (-self._queries[k][0],
+                                      self._KIND_ORDER.get(k[0], 9),
+                                      -self._queries[k][1]))
+        hits0, skipped0 = self.client._cache.hits, self.client.skipped
+        self.client.deadline = time.monotonic() + self.budget_s
+        try:
+            for kind, arg in order:
+                log.debug(f'WiGLE: {kind} {arg}')
+                skipped = self.client.skipped
+                try:
+                    result = self._call(kind, arg)
+                except Exception as e:
+                    # eine kaputte Abfrage (z.B. Offline-DB) nicht alle abbrechen lassen
+                    log.warning(f'WiGLE {kind} {arg} fehlgeschlagen: {type(e).__name__}: {e}')
+                    self._results[(kind, arg)] = None
+                    self._failed.add((kind, arg))
+                    continue
+                # (auch nur teilweise) wegen Zeitbudget übersprungen → bleibt offen
+                if self.client.skipped == skipped:
+                    self._results[(kind, arg)] = result
+        finally:
+            self.client.deadline = None
+        log.info(f'WiGLE: {self.requested} Abfragen → {len(order)} eindeutig, '
+                 f'{self.client._cache.hits - hits0} aus Cache, '
+                 f'{self.client.skipped - skipped0} wegen Zeitbudget übersprungen')
+        return self._results
+
+    def result(self, kind, arg):
+        return self._results.get((kind, arg))
+
+    def pending(self, kind, arg):
+        """Vorgemerkt, aber (noch) nicht ausgeführt - z.B. Report-Deadline."""
+        return (kind, arg) in self._queries and (kind, arg) not in self._results
+
+    def failed(self, kind, arg):
+        return (kind, arg) in self._failed
+
+    def fail_pending(self):
+        """Alle offenen Abfragen als fehlgeschlagen markieren (run() abgebrochen)."""
+        for key in self._queries:
+            if key not in self._results:
+                self._results[key] = None
+                self._failed.add(key)
+
+    def device_results(self, mac):
+        """
+        Ergebnisse eines Geräts im Format von lookup_device().
+        Noch nicht ausgeführte Abfragen fehlen und zählen in 'pending',
+        fehlgeschlagene in 'failed'.
+        """
+        dev = self._devices.get(mac)
+        if not dev:
+            return {}
+        done = self._results
+        keys = [dev['wifi'], dev.get('bt')] + list(dev['ssids'].values())
+        results = {'wifi_mac': done.get(dev['wifi'])}
+        if 'bt' in dev:
+            results['bt_mac'] = done.get(dev['bt'])
+        results['ssids'] = {ssid: done[key] for ssid, key in dev['ssids'].items()
+                            if key in done and key not in self._failed}
+        results['pending'] = sum(1 for k in keys if k and k not in done)
+        results['failed'] = sum(1 for k in keys if k and k in self._failed)
+        return results
+
 def lookup_device(mac, ssids, bt_mac=None, client=None):
     """
     Vollständiger WiGLE-Lookup für ein Gerät.
+    Für mehrere Geräte WiGLEScheduler nutzen (Deduplizierung, Budget).
     Returns: dict mit allen Ergebnissen
     """
     if not client:
         return {}
-
-    results = {}
-
-    # 1. WiFi MAC suchen
-    log.info(f'WiGLE: Suche WiFi-MAC {mac}')
-    results['wifi_mac'] = client.search_wifi_mac(mac)
-
-    # 2. BT MAC suchen (falls vorhanden)
-    if bt_mac:
-        log.info(f'WiGLE: Suche BT-MAC {bt_mac}')
-        results['bt_mac'] = client.search_bt_mac(bt_mac)
-
-    # 3. Probe-SSIDs suchen
-    results['ssids'] = {}
-    for ssid in ssids[:5]:  # Max 5 SSIDs
-        if ssid and len(ssid) > 2:
-            log.info(f'WiGLE: Suche SSID "{ssid}"')
-            results['ssids'][ssid] = client.search_ssid(ssid)
-
-    return results
+    sched = WiGLEScheduler(client)
+    sched.add_device(mac, ssids, bt_mac)
+    sched.run()
+    return sched.device_results(mac)
 
 def nearby_cross_reference(nearby_list, suspicious_macs):
     """
@@ -261,6 +505,11 @@ def format_wigle_section(wigle_results):
             loc = format_location(result)
             lines.append(f'  - `{ssid}`: {loc}')
 
+    if wigle_results.get('pending'):
+        lines.append(f'- ⏳ {wigle_results["pending"]} Abfrage(n) ausstehend (Zeitlimit)')
+    if wigle_results.get('failed'):
+        lines.append(f'- ⚠ {wigle_results["failed"]} Abfrage(n) fehlgeschlagen')
+
     return '\n'.join(lines)
 
 # ============================================================
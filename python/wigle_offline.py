@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+wigle_offline.py - Lokale WiGLE-/Wardriving-Datenbank
+Der Pager ist im Feld meist offline; search_nearby, search_wifi_mac und
+search_ssid (wigle_lookup.WiGLEClient) fragen daher zuerst diese Datenbank
+und erst bei einem Miss die API.
+
+Quellen:
+  - WiGLE-CSV-Exporte (WigleWifi-1.x, auch .csv.gz) - WIFI, BT, BLE
+  - eigene Beacon-Beobachtungen: PCAP + GPS-Track (pcap_engine.read_pcap_beacons)
+
+SQLite, eine Zeile je (netid, type); bei mehreren Beobachtungen gilt die
+Position mit dem stärksten RSSI. Räumliche Suche über einen R*Tree
+(net_rtree, per Trigger gepflegt); fehlt das RTREE-Modul im SQLite des
+Systems, über die indizierte Rasterspalte cell (0.01°-Zellen).
+Abfragen liefern dieselben Strukturen wie WiGLEClient.
+Eine Verbindung für alle Threads (check_same_thread=False, serialisiert
+per Lock) - der WiGLE-Scheduler läuft in einem Enrichment-Worker.
+"""
+import os
+import csv
+import gzip
+import math
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from geo import distances_from
+
+log = logging.getLogger('CYT-WiGLE')
+
+DEFAULT_PATH = '/root/loot/chasing_your_tail/wigle_offline.db'
+
+# Rasterzellen 0.01° (~1.1 km Nord-Süd) für den Fallback ohne R*Tree
+CELL_DEG  = 0.01
+MAX_CELLS = 400      # mehr Zellen → Bereichsscan über lat statt IN (...)
+NO_RSSI   = -200
+
+# WiGLE-CSV-Typ → interner Typ
+_CSV_TYPES = {'WIFI': 'wifi', 'BT': 'bt', 'BLE': 'bt'}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS networks (
+    netid      TEXT NOT NULL,
+    type       TEXT NOT NULL,
+    ssid       TEXT NOT NULL DEFAULT '',
+    lat        REAL NOT NULL,
+    lon        REAL NOT NULL,
+    rssi       INTEGER NOT NULL DEFAULT -200,
+    first_seen TEXT,
+    last_seen  TEXT,
+    source     TEXT,
+    cell       INTEGER NOT NULL,
+    UNIQUE (netid, type)
+);
+CREATE INDEX IF NOT EXISTS idx_networks_ssid ON networks(ssid);
+CREATE INDEX IF NOT EXISTS idx_networks_cell ON networks(cell);
+"""
+
+_RTREE = """
+CREATE VIRTUAL TABLE IF NOT EXISTS net_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon);
+CREATE TRIGGER IF NOT EXISTS net_rtree_ins AFTER INSERT ON networks BEGIN
+    INSERT INTO net_rtree VALUES (new.rowid, new.lat, new.lat, new.lon, new.lon);
+END;
+CREATE TRIGGER IF NOT EXISTS net_rtree_upd AFTER UPDATE OF lat, lon ON networks BEGIN
+    DELETE FROM net_rtree WHERE id = old.rowid;
+    INSERT INTO net_rtree VALUES (new.rowid, new.lat, new.lat, new.lon, new.lon);
+END;
+CREATE TRIGGER IF NOT EXISTS net_rtree_del AFTER DELETE ON networks BEGIN
+    DELETE FROM net_rtree WHERE id = old.rowid;
+END;
+"""
+
+# Stärkste Beobachtung gewinnt die Position, SSID nur wenn nicht leer
+_UPSERT = """
+INSERT INTO networks (netid, type, ssid, lat, lon, rssi, first_seen, last_seen, source, cell)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (netid, type) DO UPDATE SET
+    ssid       = CASE WHEN excluded.ssid != '' THEN excluded.ssid ELSE ssid END,
+    lat        = CASE WHEN excluded.rssi > rssi THEN excluded.lat  ELSE lat  END,
+    lon        = CASE WHEN excluded.rssi > rssi THEN excluded.lon  ELSE lon  END,
+    cell       = CASE WHEN excluded.rssi > rssi THEN excluded.cell ELSE cell END,
+    rssi       = MAX(rssi, excluded.rssi),
+    first_seen = MIN(COALESCE(first_seen, excluded.first_seen), COALESCE(excluded.first_seen, first_seen)),
+    last_seen  = MAX(COALESCE(last_seen, excluded.last_seen), COALESCE(excluded.last_seen, last_seen))
+"""
+
+
+def _cell_xy(lat, lon):
+    return math.floor(lat / CELL_DEG), math.floor(lon / CELL_DEG)
+
+
+def _cell(lat, lon):
+    y, x = _cell_xy(lat, lon)
+    return (y + 9000) * 36001 + (x + 18000)
+
+
+def _norm_mac(mac):
+    return mac.strip().upper().replace('-', ':')
+
+
+def _box(lat, lon, radius_m):
+    """Bounding-Box (lat_min, lat_max, lon_min, lon_max) um einen Radius."""
+    lat_delta = radius_m / 111_000.0
+    lon_delta = radius_m / (111_000.0 * max(math.cos(math.radians(lat)), 0.01))
+    return lat - lat_delta, lat + lat_delta, lon - lon_delta, lon + lon_delta
+
+
+def _open_text(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='ignore', newline='')
+    return open(path, encoding='utf-8', errors='ignore', newline='')
+
+
+class WiGLEOffline:
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        dirname = os.path.dirname(path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=10, isolation_level=None,
+                                    check_same_thread=False)
+        self._lock = threading.RLock()
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(_SCHEMA)
+        try:
+            self.conn.executescript(_RTREE)
+            self.rtree = True
+        except sqlite3.OperationalError:
+            # SQLite ohne RTREE-Modul → Rasterzellen
+            self.rtree = False
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def __len__(self):
+        return self._query('SELECT COUNT(*) FROM networks')[0][0]
+
+    # ── Import ──────────────────────────────────────────────────────────
+    def _upsert_many(self, rows):
+        """rows: (netid, type, ssid, lat, lon, rssi, first, last, source) → Anzahl."""
+        n = 0
+        with self._lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                batch = []
+                for row in rows:
+                    batch.append(row + (_cell(row[3], row[4]),))
+                    if len(batch) >= 1000:
+                        self.conn.executemany(_UPSERT, batch)
+                        n += len(batch)
+                        batch = []
+                self.conn.executemany(_UPSERT, batch)
+                n += len(batch)
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+            self.conn.execute('COMMIT')
+        return n
+
+    def import_wigle_csv(self, path):
+        """WiGLE-CSV-Export (WigleWifi-1.x, optional .gz) importieren. Returns: Zeilen."""
+        def rows(f):
+            first = f.readline()
+            if not first.startswith('WigleWifi'):
+                f.seek(0)   # Export ohne Vorspann-Zeile
+            for r in csv.DictReader(f):
+                ntype = _CSV_TYPES.get((r.get('Type') or '').strip().upper())
+                if not ntype:
+                    continue
+                try:
+                    lat = float(r['CurrentLatitude'])
+                    lon = float(r['CurrentLongitude'])
+                except (KeyError, TypeError, ValueError):
+                    continue
+                if lat == 0 and lon == 0:
+                    continue
+                try:
+                    rssi = int(r.get('RSSI') or NO_RSSI)
+                except ValueError:
+                    rssi = NO_RSSI
+                seen = (r.get('FirstSeen') or '').strip() or None
+                yield (_norm_mac(r.get('MAC') or ''), ntype, (r.get('SSID') or '').strip(),
+                       lat, lon, rssi, seen, seen, 'wigle')
+
+        with _open_text(path) as f:
+            n = self._upsert_many(r for r in rows(f) if r[0])
+        log.info(f'WiGLE-CSV {path}: {n} Beobachtungen importiert ({len(self)} Netze)')
+        return n
+
+    def import_beacons(self, beacons, source='cyt'):
+        """
+        Eigene Beacon-Beobachtungen übernehmen.
+        beacons: {bssid: {ssid, lat, lon, rssi_best, last_seen}} aus
+        pcap_engine.read_pcap_beacons(pfad, gps_track) - ohne Position übersprungen.
+        """
+        def rows():
+            for bssid, b in beacons.items():
+                if 'lat' not in b or (b['lat'] == 0 and b['lon'] == 0):
+                    continue
+                seen = None
+                if b.get('last_seen'):
+                    seen = datetime.fromtimestamp(b['last_seen']).strftime('%Y-%m-%d %H:%M:%S')
+                rssi = b.get('rssi_best')
+                yield (_norm_mac(bssid), 'wifi', b.get('ssid', ''), b['lat'], b['lon'],
+                       NO_RSSI if rssi is None else rssi, seen, seen, source)
+
+        n = self._upsert_many(rows())
+        log.info(f'Beacons: {n} BSSIDs mit Position übernommen ({len(self)} Netze)')
+        return n
+
+    # ── Abfragen ────────────────────────────────────────────────────────
+    def _in_box(self, lat_min, lat_max, lon_min, lon_max, ntype):
+        if self.rtree:
+            return self._query(
+                'SELECT n.* FROM net_rtree r JOIN networks n ON n.rowid = r.id '
+                'WHERE r.min_lat >= ? AND r.max_lat <= ? AND r.min_lon >= ? AND r.max_lon <= ? '
+                'AND n.type = ?', (lat_min, lat_max, lon_min, lon_max, ntype))
+        y0, x0 = _cell_xy(lat_min, lon_min)
+        y1, x1 = _cell_xy(lat_max, lon_max)
+        if (y1 - y0 + 1) * (x1 - x0 + 1) > MAX_CELLS:
+            return self._query(
+                'SELECT * FROM networks WHERE lat BETWEEN ? AND ? AND lon BETWEEN ? AND ? '
+                'AND type = ?', (lat_min, lat_max, lon_min, lon_max, ntype))
+        cells = [(y + 9000) * 36001 + (x + 18000)
+                 for y in range(y0, y1 + 1) for x in range(x0, x1 + 1)]
+        return self._query(
+            f'SELECT * FROM networks WHERE cell IN ({",".join("?" * len(cells))}) '
+            'AND lat BETWEEN ? AND ? AND lon BETWEEN ? AND ? AND type = ?',
+            (*cells, lat_min, lat_max, lon_min, lon_max, ntype))
+
+    def nearby(self, lat, lon, radius_m=200, ntype='wifi'):
+        """
+        Netze im Radius (exakte Distanz), Format wie WiGLEClient.search_nearby:
+        [{ssid, netid, lat, lon, last_seen, type}], nächste zuerst.
+        """
+        rows = self._in_box(*_box(lat, lon, radius_m), ntype)
+        dists = distances_from(lat, lon, ((r['lat'], r['lon']) for r in rows))
+        hits = []
+        for r, d in zip(rows, dists):
+            if d <= radius_m:
+                hits.append((d, {
+                    'ssid':      r['ssid'],
+                    'netid':     r['netid'],
+                    'lat':       r['lat'],
+                    'lon':       r['lon'],
+                    'last_seen': (r['last_seen'] or '')[:10],
+                    'type':      r['type'],
+                }))
+        hits.sort(key=lambda h: h[0])
+        return [h[1] for h in hits]
+
+    def _result(self, row, ntype, total):
+        return {
+            'found':       True,
+            'type':        ntype,
+            'ssid':        row['ssid'],
+            'netid':       row['netid'],
+            'lat':         row['lat'],
+            'lon':         row['lon'],
+            'country':     '',
+            'region':      '',
+            'city':        '',
+            'first_seen':  row['first_seen'] or '',
+            'last_seen':   row['last_seen'] or '',
+            'total_found': total,
+            'source':      'offline',
+        }
+
+    def network(self, mac, ntype='wifi'):
+        """MAC-Suche, Format wie WiGLEClient._parse_network oder None (Miss)."""
+        rows = self._query('SELECT * FROM networks WHERE netid = ? AND type = ?',
+                           (_norm_mac(mac), ntype))
+        return self._result(rows[0], ntype, 1) if rows else None
+
+    def ssid(self, ssid):
+        """SSID-Suche (zuletzt gesehenes Netz) oder None (Miss)."""
+        rows = self._query(
+            "SELECT * FROM networks WHERE ssid = ? AND type = 'wifi' "
+            'ORDER BY last_seen DESC', (ssid,))
+        return self._result(rows[0], 'ssid', len(rows)) if rows else None
+
+
+def open_offline(path=DEFAULT_PATH):
+    """Vorhandene Offline-Datenbank öffnen oder None (kein Anlegen)."""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        return WiGLEOffline(path)
+    except sqlite3.Error as e:
+        log.warning(f'WiGLE-Offline-DB {path} nicht lesbar: {e}')
+        return None
+
+
+# ============================================================
+# MAIN (Import / Abfrage)
+# ============================================================
+if __name__ == '__main__':
+    import sys
+    import argparse
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    parser = argparse.ArgumentParser(description='Offline-WiGLE-Datenbank')
+    parser.add_argument('--db', default=DEFAULT_PATH)
+    parser.add_argument('--import-csv', nargs='+', metavar='CSV',
+                        help='WiGLE-CSV-Export(e) importieren')
+    parser.add_argument('--import-pcap', nargs='+', metavar='PCAP',
+                        help='Beacons aus PCAP(s) übernehmen (braucht GPS-Track)')
+    parser.add_argument('--gps-track', default=None)
+    parser.add_argument('--nearby', nargs=2, type=float, metavar=('LAT', 'LON'))
+    parser.add_argument('--radius', type=int, default=200)
+    parser.add_argument('--mac')
+    parser.add_argument('--ssid')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO,
+                        format='[%(asctime)s] %(levelname)s %(message)s')
+
+    db = WiGLEOffline(args.db)
+    log.info(f'{args.db}: {len(db)} Netze ({"R*Tree" if db.rtree else "Raster"})')
+
+    for path in args.import_csv or []:
+        db.import_wigle_csv(path)
+    if args.import_pcap:
+        from gps_track import GpsTrack, DEFAULT_PATH as GPS_PATH
+        from pcap_engine import read_pcap_beacons
+        track = GpsTrack.load(args.gps_track or GPS_PATH)
+        if not track:
+            log.warning('Kein GPS-Track - Beacons ohne Position werden übersprungen')
+        for path in args.import_pcap:
+            db.import_beacons(read_pcap_beacons(path, track))
+
+    if args.nearby:
+        for r in db.nearby(*args.nearby, radius_m=args.radius):
+            print(f'{r["netid"]}  {r["ssid"]:32s}  {r["last_seen"]}')
+    if args.mac:
+        print(db.network(args.mac) or db.network(args.mac, 'bt') or 'Nicht gefunden')
+    if args.ssid:
+        print(db.ssid(args.ssid) or 'Nicht gefunden')
+    db.close()
@@ -10,11 +10,14 @@ Ausgabe (stdout, eine Zeile):
   ZONE_ERROR:<msg>                    - Konfigurationsfehler
 """
 import json
+import os
 import sys
-import math
 import argparse
 import logging
-import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from geo import ZoneIndex
+import http_pool
 
 logging.basicConfig(level=logging.WARNING)
 log = logging.getLogger(__name__)
@@ -22,15 +25,6 @@ log = logging.getLogger(__name__)
 DEFAULT_CONFIG = '/root/payloads/user/reconnaissance/chasing_your_tail/config.json'
 
 
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371000
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlam = math.radians(lon2 - lon1)
-    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlam / 2) ** 2
-    return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-
-
 def load_zones(config_path):
     try:
         with open(config_path) as f:
@@ -54,27 +48,23 @@ def find_nearest(zones, lat, lon):
       in_radius = (name, dist_m) wenn innerhalb Zone-Radius, sonst None
       nearest   = (name, dist_m) nächste Zone unabhängig von Radius, oder None
     """
-    in_radius = None
-    nearest = None
-    for z in zones:
-        dist = haversine(lat, lon, z['lat'], z['lon'])
-        if dist <= z.get('radius_m', 100):
-            if in_radius is None or dist < in_radius[1]:
-                in_radius = (z['name'], int(dist))
-        if nearest is None or dist < nearest[1]:
-            nearest = (z['name'], int(dist))
+    if not isinstance(zones, ZoneIndex):
+        zones = ZoneIndex(zones)
+    in_radius, nearest = zones.locate(lat, lon)
+    if in_radius:
+        in_radius = (in_radius[0]['name'], int(in_radius[1]))
+    if nearest:
+        nearest = (nearest[0]['name'], int(nearest[1]))
     return in_radius, nearest
 
 
 def ip_geolocate():
     """Gibt (lat, lon, city) via ip-api.com zurück oder None bei Fehler."""
     try:
-        req = urllib.request.Request(
+        data = http_pool.get_json(
             'http://ip-api.com/json/?fields=status,lat,lon,city',
-            headers={'User-Agent': 'ChasingYourTail/4.5'}
+            headers={'User-Agent': 'ChasingYourTail/4.5'}, timeout=5
         )
-        with urllib.request.urlopen(req, timeout=5) as r:
-            data = json.loads(r.read().decode())
         if data.get('status') == 'success':
             return float(data['lat']), float(data['lon']), data.get('city', '')
     except Exception as e:
@@ -89,7 +79,7 @@ def main():
     p.add_argument('--lon', type=float, default=None, help='GPS Longitude')
     args = p.parse_args()
 
-    zones = load_zones(args.config)
+    zones = ZoneIndex(load_zones(args.config))
     if not zones:
         # Keine echten GPS-Koordinaten in config.json → Zonen nicht nutzbar
         print('ZONE_NONE')